@@ -0,0 +1,30 @@
+import argparse
+import json
+import os, sys
+
+def parseSizes(value):
+    return [int(size) for size in value.split(",")]
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.dirname(here)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    
+    from dcpu16.benchmark import runCompileBenchmark
+    
+    parser = argparse.ArgumentParser(description='Time each stage of generate() on synthetic modules and print one JSON object per configuration.')
+    parser.add_argument('--functions', type=parseSizes, default=[1, 10, 100], help='Comma separated numbers of functions per module')
+    parser.add_argument('--statements', type=parseSizes, default=[10, 100], help='Comma separated numbers of statements per function')
+    parser.add_argument('--depth', type=parseSizes, default=[1, 2, 4], help='Comma separated expression depths')
+    parser.add_argument('--repeat', type=int, default=3, help='Keep the fastest of this many runs for every phase')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic source generator')
+    
+    args = parser.parse_args()
+    
+    for functions in args.functions:
+        for statements in args.statements:
+            for depth in args.depth:
+                result = runCompileBenchmark(functions, statements, depth, args.seed, args.repeat)
+                sys.stdout.write(json.dumps(result, sort_keys = True) + "\n")
+                sys.stdout.flush()
@@ -0,0 +1,19 @@
+# expect: 0x8000 = 3664
+
+def start():
+    i = 0
+    total = 0
+    step()
+    SCREEN[0] = total
+    end()
+    return 0
+
+def step():
+    total = total + i * 3 + i / 2 - i % 5
+    i = i + 1
+    if i < 200:
+        step()
+    return 0
+
+def end():
+    exit()
@@ -0,0 +1,70 @@
+# expect: 0x8000 = 580
+# expect: 0x8001 = 240
+
+def start():
+    depth = 0
+    total = 0
+    runs = 0
+    repeat()
+    SCREEN[0] = total
+    SCREEN[1] = depth
+    end()
+    return 0
+
+def repeat():
+    total = total + level1()
+    runs = runs + 1
+    if runs < 20:
+        repeat()
+    return 0
+
+def level1():
+    depth = depth + 1
+    return level2() + 1
+
+def level2():
+    depth = depth + 1
+    return level3() + 2
+
+def level3():
+    depth = depth + 1
+    return level4() + 3
+
+def level4():
+    depth = depth + 1
+    return level5() + 4
+
+def level5():
+    depth = depth + 1
+    return level6() + 5
+
+def level6():
+    depth = depth + 1
+    return level7() + 6
+
+def level7():
+    depth = depth + 1
+    return level8() + 1
+
+def level8():
+    depth = depth + 1
+    return level9() + 1
+
+def level9():
+    depth = depth + 1
+    return level10() + 1
+
+def level10():
+    depth = depth + 1
+    return level11() + 1
+
+def level11():
+    depth = depth + 1
+    return level12() + 1
+
+def level12():
+    depth = depth + 1
+    return 3
+
+def end():
+    exit()
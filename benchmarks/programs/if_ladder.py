@@ -0,0 +1,44 @@
+# expect: 0x8000 = 1432
+# expect: 0x8001 = 1
+
+def start():
+    state = 0
+    count = 0
+    total = 0
+    tick()
+    SCREEN[0] = total
+    SCREEN[1] = state
+    end()
+    return 0
+
+def tick():
+    if state == 0:
+        total = total + 1
+    elif state == 1:
+        total = total + 3
+    elif state == 2:
+        total = total + 5
+    elif state == 3:
+        total = total + 7
+    elif state == 4:
+        total = total + 11
+    elif state == 5:
+        total = total + 13
+    elif state == 6:
+        total = total + 17
+    elif state == 7:
+        total = total + 19
+    elif state == 8:
+        total = total + 23
+    elif state == 9:
+        total = total + 29
+    else:
+        total = total + 31
+    state = (state + 1) % 11
+    count = count + 1
+    if count < 100:
+        tick()
+    return 0
+
+def end():
+    exit()
@@ -0,0 +1,21 @@
+# expect: 0x8000 = 28672
+# expect: 0x8021 = 28693
+# expect: 0x817f = 28923
+# expect: 0x9000 = 1200
+
+def start():
+    color = 28672
+    for row in range(12):
+        for column in range(32):
+            SCREEN[row * 32 + column] = color + row * 20 + column
+    total = 0
+    count = 0
+    while count < 300:
+        count = count + 1
+        total = total + 4
+    SCREEN[4096] = total
+    end()
+    return 0
+
+def end():
+    exit()
@@ -0,0 +1,18 @@
+# expect: 0x8000 = 28737
+# expect: 0x817f = 28752
+
+def start():
+    i = 0
+    fill()
+    end()
+    return 0
+
+def fill():
+    SCREEN[i] = 28737 + i % 16
+    i = i + 1
+    if i < 384:
+        fill()
+    return 0
+
+def end():
+    exit()
@@ -0,0 +1,37 @@
+import argparse
+import os, sys
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.dirname(here)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    
+    from dcpu16.benchmark import METRICS, runSuite, findRegressions, loadBaseline, saveBaseline
+    
+    parser = argparse.ArgumentParser(description='Compile, assemble and run the benchmark corpus and compare it against the stored baseline.')
+    parser.add_argument('--programs', default=os.path.join(here, 'programs'), help='Directory holding the benchmark programs')
+    parser.add_argument('--baseline', default=os.path.join(here, 'baseline.json'), help='Baseline file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.0, help='Allowed relative growth of each metric before it counts as a regression')
+    parser.add_argument('--update', action='store_true', help='Overwrite the baseline with the current results')
+    
+    args = parser.parse_args()
+    
+    results = runSuite(args.programs)
+    baseline = loadBaseline(args.baseline)
+    
+    print "%-16s %8s %13s %10s" % (("program",) + METRICS)
+    for result in results:
+        print "%-16s %8d %13d %10d" % ((result.name,) + tuple(result.metrics[metric] for metric in METRICS))
+    
+    failures = ["%s: %s" % (result.name, failure) for result in results for failure in result.failures]
+    if not args.update:
+        failures += findRegressions(results, baseline, args.tolerance)
+    
+    for failure in failures:
+        print "FAIL " + failure
+    
+    if failures:
+        sys.exit(1)
+    if args.update:
+        saveBaseline(args.baseline, results)
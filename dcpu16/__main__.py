@@ -7,11 +7,121 @@ if __name__ == "__main__":
         sys.path.append(path)
     
     import dcpu16.compiler as l
+    from dcpu16.instructions import measure, render
+    from dcpu16.assembler import assemble, writeImage
+    from dcpu16.profiler import Profiler
+    from dcpu16.cache import FragmentCache, DEFAULT_MAX_BYTES
+    from dcpu16.batch import BatchOptions, compileFiles
+    from dcpu16.passes import PASSES, OPTIMIZATION_LEVELS, DEFAULT_LEVEL
+    
+    if sys.argv[1:2] == ["serve"]:
+        from dcpu16.server import CompileService, serveSocket, serveStream, DEFAULT_MAX_ENTRIES, DEFAULT_MAX_RESULTS
+        
+        parser = argparse.ArgumentParser(prog='dcpu16 serve', description='Keep the compiler loaded and answer JSON-lines compile requests.')
+        parser.add_argument('--socket', metavar='path', help='Listen on this Unix socket instead of reading requests from stdin')
+        parser.add_argument('--cache-entries', metavar='count', type=int, default=DEFAULT_MAX_ENTRIES, help='Keep at most this many compiled functions in memory')
+        parser.add_argument('--result-entries', metavar='count', type=int, default=DEFAULT_MAX_RESULTS, help='Keep at most this many whole-program results in memory')
+        args = parser.parse_args(sys.argv[2:])
+        
+        service = CompileService(args.cache_entries, args.result_entries)
+        try:
+            if args.socket:
+                serveSocket(service, args.socket)
+            else:
+                serveStream(service)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
 
     parser = argparse.ArgumentParser(description='A compiler that turns python code to dcpu16 assembly code.')
-    parser.add_argument('file', metavar='file', help='The file to tokenize or compile')
+    parser.add_argument('files', metavar='file', nargs='+', help='The file to compile; several files, directories or glob patterns compile in batch mode')
+    parser.add_argument('-o', '--output', metavar='file', help='Write the assembly code to this file instead of stdout')
+    parser.add_argument('--output-dir', metavar='directory', help='Write batch mode outputs to this directory instead of next to their inputs')
+    parser.add_argument('--force', action='store_true', help='Compile batch mode inputs even when their outputs are up to date')
+    parser.add_argument('--binary', action='store_true', help='Assemble the code and write a binary word image instead of assembly text')
+    parser.add_argument('--little-endian', action='store_true', help='Write the binary word image in little-endian order')
+    parser.add_argument('-O', dest='level', type=int, choices=sorted(OPTIMIZATION_LEVELS), default=DEFAULT_LEVEL, help='Optimization level: 0 keeps the code generator output as it is, %d is the default' % (DEFAULT_LEVEL,))
+    parser.add_argument('--passes', metavar='names', type=lambda names: tuple(name for name in names.split(",") if name), help='Run these comma-separated passes over every function instead of the ones the level picks: %s' % (", ".join(sorted(PASSES)),))
+    parser.add_argument('--no-registers', dest='registers', action='store_false', help='Keep every temporary in memory instead of the general registers')
+    parser.add_argument('--no-fold', dest='fold', action='store_false', help='Do not fold constant expressions before generating code')
+    parser.add_argument('--no-inline', dest='inline', action='store_false', help='Do not inline small and single-use functions into their callers')
+    parser.add_argument('--no-dead-code', dest='deadcode', action='store_false', help='Keep unreachable functions, statements and stores to variables that are never read')
+    parser.add_argument('--no-hoist', dest='hoist', action='store_false', help='Leave invariant expressions and multiplications of the loop variable inside loops')
+    parser.add_argument('--no-unroll', dest='unroll', action='store_false', help='Do not unroll short range loops at -O3')
+    parser.add_argument('--no-dispatch', dest='dispatch', action='store_false', help='Test if/elif ladders on one variable in turn instead of jumping through a table or a binary search')
+    parser.add_argument('--no-peephole', dest='peephole', action='store_false', help='Do not run the peephole optimizer over the generated code')
+    parser.add_argument('-j', '--jobs', metavar='count', type=int, default=1, help='Compile this many files, or functions of a single file, in parallel worker processes')
+    parser.add_argument('--cache', metavar='directory', help='Reuse the code of unchanged functions from this cache directory')
+    parser.add_argument('--cache-size', metavar='bytes', type=int, default=DEFAULT_MAX_BYTES, help='Evict the least recently used cache entries beyond this many bytes')
+    parser.add_argument('--no-slot-sharing', dest='share', action='store_false', help='Give every variable its own memory word instead of sharing words between variables that are never live together')
+    parser.add_argument('--profile', action='store_true', help='Print the time spent in every compiler stage and AST node type to stderr')
+    parser.add_argument('--stats', action='store_true', help='Print the static word and cycle count of the generated code and optimizer statistics to stderr')
     
     args = parser.parse_args()
+    for name, value in OPTIMIZATION_LEVELS[args.level].items():
+        if name != "passes":
+            setattr(args, name, getattr(args, name) and value)
+    if args.passes is None:
+        args.passes = OPTIMIZATION_LEVELS[args.level]["passes"]
+    unknown = [name for name in args.passes if name not in PASSES]
+    if unknown:
+        parser.error("unknown pass %s" % (", ".join(unknown),))
+    
+    if len(args.files) > 1 or args.output_dir or not os.path.isfile(args.files[0]):
+        if args.output or args.stats or args.profile:
+            parser.error("--output, --stats and --profile only apply to a single file")
+        options = BatchOptions(args.output_dir, args.binary, args.little_endian, args.registers, args.fold, args.peephole, args.share, args.inline, args.deadcode, args.passes, args.cache, args.cache_size, args.force, args.hoist, args.unroll, args.dispatch)
+        result = compileFiles(args.files, options, args.jobs)
+        for path, error in result.failures:
+            sys.stderr.write("%s: %s\n" % (path, error))
+        sys.stderr.write("%s\n" % (result.summary(),))
+        sys.exit(1 if result.failures else 0)
+    
+    stats = {}
+    profiler = Profiler() if args.profile else None
+    cache = FragmentCache(args.cache, args.cache_size) if args.cache else None
+    instructions = l.generate(open(args.files[0]).read(), registers = args.registers, fold = args.fold, peephole = args.peephole, stats = stats, profiler = profiler, cache = cache, workers = args.jobs, share = args.share, inline = args.inline, deadcode = args.deadcode, passes = args.passes, hoist = args.hoist, unroll = args.unroll, dispatch = args.dispatch)
+    if args.binary:
+        image = l.runStage(profiler, "assemble", assemble, instructions)
+        if args.output:
+            with open(args.output, "wb") as out:
+                l.runStage(profiler, "emit", writeImage, image, out, args.little_endian)
+        else:
+            l.runStage(profiler, "emit", writeImage, image, sys.stdout, args.little_endian)
+    elif args.output:
+        with open(args.output, "w") as out:
+            l.runStage(profiler, "emit", render, instructions, out)
+    else:
+        l.runStage(profiler, "emit", render, instructions)
+    
+    if args.stats:
+        sys.stderr.write("words: %d, cycles: %d\n" % measure(instructions))
+        if "folded" in stats:
+            sys.stderr.write("folded: %d nodes\n" % (stats["folded"],))
+        if "inlined" in stats:
+            inlined, removed = stats["inlined"]
+            sys.stderr.write("inlined: %d calls, %d functions removed\n" % (inlined, len(removed)))
+        if "loops" in stats:
+            hoisted, reduced, unrolled = stats["loops"]
+            sys.stderr.write("loops: %d invariants hoisted, %d induction variables reduced, %d loops unrolled\n" % (hoisted, reduced, unrolled))
+        if "deadcode" in stats:
+            words, removed = stats["deadcode"]
+            sys.stderr.write("dead code: %d words, %d functions removed\n" % (words, len(removed)))
+        if "memory" in stats:
+            words, unshared, functions = stats["memory"]
+            sys.stderr.write("memory: %d words, %d without slot sharing\n" % (words, unshared))
+            for name, words in sorted(functions.items()):
+                sys.stderr.write("memory %s: %d words\n" % (name, words))
+        if "passes" in stats:
+            stats["passes"].report(sys.stderr)
+        if cache is not None:
+            sys.stderr.write("cache: %d hits, %d misses\n" % (cache.hits, cache.misses))
+        if "measure" in stats:
+            (wordsBefore, cyclesBefore), (wordsAfter, cyclesAfter) = stats["measure"]
+            sys.stderr.write("peephole: %d -> %d words, %d -> %d cycles\n" % (wordsBefore, wordsAfter, cyclesBefore, cyclesAfter))
+        for name, (hits, words, cycles) in sorted(stats.get("peephole", {}).items()):
+            sys.stderr.write("peephole %s: %d hits, %d words, %d cycles\n" % (name, hits, words, cycles))
     
-    l.parse(open(args.file).read())
+    if profiler is not None:
+        profiler.report(sys.stderr)
  
\ No newline at end of file
@@ -0,0 +1,158 @@
+import sys
+from array import array
+from dcpu16.instructions import Instruction, Label, Data, Register, Literal, Address, LabelRef, Memory, IndexedMemory, BASIC_OPCODES, SPECIAL_OPCODES, REGISTER_CODES, isShortLiteral
+
+SPECIAL_REGISTERS = {
+    "PC" : Register("PC"),
+    "SP" : Register("SP"),
+    "EX" : Register("EX"),
+    "POP" : Register("POP"),
+    "PUSH" : Register("PUSH"),
+    "PEEK" : Register("PEEK"),
+}
+
+SPECIAL_REGISTER_CODES = {
+    "SP" : 0x1b,
+    "PC" : 0x1c,
+    "EX" : 0x1d,
+    "PEEK" : 0x19,
+}
+
+def parseValue(token):
+    if token.lower() in REGISTER_CODES:
+        return Register(token.lower())
+    if token.upper() in SPECIAL_REGISTERS:
+        return SPECIAL_REGISTERS[token.upper()]
+    try:
+        return Literal(int(token, 0))
+    except ValueError:
+        return LabelRef(token)
+
+def parseOperand(token):
+    token = token.strip()
+    if not (token.startswith("[") and token.endswith("]")):
+        return parseValue(token)
+
+    inner = token[1:-1].replace(" ", "")
+    if "+" not in inner:
+        return Memory(parseValue(inner))
+    first, second = [parseValue(part) for part in inner.split("+", 1)]
+    if isinstance(first, Register):
+        first, second = second, first
+    if not isinstance(second, Register):
+        raise Exception("Invalid operand %s" % (token,))
+    return IndexedMemory(second, first)
+
+def parseAssembly(text):
+    program = []
+    for number, line in enumerate(text.splitlines()):
+        line = line.split(";", 1)[0].strip()
+        while line.startswith(":"):
+            parts = line[1:].split(None, 1)
+            program.append(Label(parts[0]))
+            line = parts[1].strip() if len(parts) > 1 else ""
+        if not line:
+            continue
+        parts = line.split(None, 1)
+        opcode = parts[0].lower()
+        if opcode == "dat":
+            program.append(Data(*[parseValue(value.strip()) for value in parts[1].split(",")] if len(parts) > 1 else []))
+            continue
+        if opcode not in BASIC_OPCODES and opcode not in SPECIAL_OPCODES:
+            raise Exception("Unknown instruction %s on line %d" % (parts[0], number + 1))
+        operands = [parseOperand(operand) for operand in parts[1].split(",")] if len(parts) > 1 else []
+        program.append(Instruction(opcode, *operands))
+    return program
+
+class Assembler:
+    def __init__(self):
+        self.labels = {}
+
+    def resolve(self, operand):
+        if isinstance(operand, LabelRef):
+            if operand.value not in self.labels:
+                raise Exception("Undefined label %s" % (operand.value,))
+            return self.labels[operand.value]
+        return operand.value & 0xffff
+
+    def encodeOperand(self, operand, isA):
+        if isinstance(operand, Register):
+            name = operand.value
+            if name in REGISTER_CODES:
+                return REGISTER_CODES[name], None
+            if name == "PUSH" and not isA or name == "POP" and isA:
+                return 0x18, None
+            if name in SPECIAL_REGISTER_CODES:
+                return SPECIAL_REGISTER_CODES[name], None
+        elif isinstance(operand, Memory):
+            inner = operand.value
+            if isinstance(inner, Register):
+                if inner.value in REGISTER_CODES:
+                    return 0x08 + REGISTER_CODES[inner.value], None
+                if inner.value == "SP":
+                    return 0x19, None
+            else:
+                return 0x1e, self.resolve(inner)
+        elif isinstance(operand, IndexedMemory):
+            register, offset = operand.value
+            if register.value in REGISTER_CODES:
+                return 0x10 + REGISTER_CODES[register.value], self.resolve(offset)
+            if register.value == "SP":
+                return 0x1a, self.resolve(offset)
+        elif isinstance(operand, (Literal, Address)):
+            if isA and isShortLiteral(operand.value):
+                return 0x21 + operand.value if operand.value != 0xffff else 0x20, None
+            return 0x1f, operand.value & 0xffff
+        elif isinstance(operand, LabelRef):
+            return 0x1f, self.resolve(operand)
+        raise Exception("Invalid operand %s" % (operand,))
+
+    def encode(self, instruction):
+        if instruction.opcode in SPECIAL_OPCODES:
+            a, aWord = self.encodeOperand(instruction.operands[0], True)
+            words = [SPECIAL_OPCODES[instruction.opcode] << 5 | a << 10]
+            if aWord is not None:
+                words.append(aWord)
+            return words
+
+        b, bWord = self.encodeOperand(instruction.operands[0], False)
+        a, aWord = self.encodeOperand(instruction.operands[1], True)
+        words = [BASIC_OPCODES[instruction.opcode] | b << 5 | a << 10]
+        if aWord is not None:
+            words.append(aWord)
+        if bWord is not None:
+            words.append(bWord)
+        return words
+
+    def assemble(self, program):
+        if isinstance(program, basestring):
+            program = parseAssembly(program)
+
+        self.labels = {}
+        address = 0
+        for item in program:
+            if isinstance(item, Label):
+                if item.name in self.labels:
+                    raise Exception("Duplicate label %s" % (item.name,))
+                self.labels[item.name] = address
+            else:
+                address += item.words()
+
+        image = array("H")
+        for item in program:
+            if isinstance(item, Instruction):
+                image.extend(self.encode(item))
+            elif isinstance(item, Data):
+                image.extend(self.resolve(value) for value in item.values)
+        return image
+
+def assemble(program):
+    return Assembler().assemble(program)
+
+def writeImage(image, out = None, littleEndian = False):
+    if out is None:
+        out = sys.stdout
+    image = array("H", image)
+    if (sys.byteorder == "little") != littleEndian:
+        image.byteswap()
+    out.write(image.tostring())
@@ -0,0 +1,126 @@
+import glob
+import multiprocessing
+import os
+import time
+from dcpu16.compiler import generate
+from dcpu16.instructions import render
+from dcpu16.assembler import assemble, writeImage
+from dcpu16.cache import FragmentCache, DEFAULT_MAX_BYTES
+from dcpu16.passes import DEFAULT_PASSES
+
+SOURCE_EXTENSION = ".py"
+ASSEMBLY_EXTENSION = ".dasm"
+BINARY_EXTENSION = ".bin"
+
+class BatchOptions:
+    def __init__(self, outputDirectory = None, binary = False, littleEndian = False, registers = True, fold = True, peephole = True, share = True, inline = True, deadcode = True, passes = DEFAULT_PASSES, cacheDirectory = None, cacheSize = DEFAULT_MAX_BYTES, force = False, hoist = True, unroll = False, dispatch = True):
+        self.outputDirectory = outputDirectory
+        self.binary = binary
+        self.littleEndian = littleEndian
+        self.registers = registers
+        self.fold = fold
+        self.peephole = peephole
+        self.share = share
+        self.inline = inline
+        self.deadcode = deadcode
+        self.hoist = hoist
+        self.unroll = unroll
+        self.dispatch = dispatch
+        self.passes = passes
+        self.cacheDirectory = cacheDirectory
+        self.cacheSize = cacheSize
+        self.force = force
+
+class BatchResult:
+    def __init__(self):
+        self.compiled = 0
+        self.skipped = 0
+        self.lines = 0
+        self.seconds = 0.0
+        self.failures = []
+
+    def summary(self):
+        seconds = max(self.seconds, 1e-9)
+        return "%d compiled, %d up to date, %d failed in %.3fs: %.1f files/s, %.1f lines/s" % (self.compiled, self.skipped, len(self.failures), self.seconds, self.compiled / seconds, self.lines / seconds)
+
+def findInputs(paths):
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, names, files in os.walk(path):
+                names.sort()
+                inputs.extend(os.path.join(directory, name) for name in sorted(files) if name.endswith(SOURCE_EXTENSION))
+        elif os.path.exists(path):
+            inputs.append(path)
+        else:
+            inputs.extend(sorted(glob.glob(path)))
+    return inputs
+
+def getOutputPath(path, options):
+    base = os.path.splitext(path)[0]
+    if options.outputDirectory is not None:
+        base = os.path.join(options.outputDirectory, os.path.basename(base))
+    return base + (BINARY_EXTENSION if options.binary else ASSEMBLY_EXTENSION)
+
+def isUpToDate(path, output):
+    return os.path.exists(output) and os.path.getmtime(output) >= os.path.getmtime(path)
+
+def compileFile(task):
+    path, output, options = task
+    cache = FragmentCache(options.cacheDirectory, options.cacheSize) if options.cacheDirectory is not None else None
+    lines = 0
+    try:
+        with open(path) as source:
+            text = source.read()
+        lines = text.count("\n")
+        instructions = generate(text, registers = options.registers, fold = options.fold, peephole = options.peephole, share = options.share, inline = options.inline, deadcode = options.deadcode, passes = options.passes, hoist = options.hoist, unroll = options.unroll, dispatch = options.dispatch, cache = cache)
+        if options.binary:
+            with open(output, "wb") as out:
+                writeImage(assemble(instructions), out, options.littleEndian)
+        else:
+            with open(output, "w") as out:
+                render(instructions, out)
+    except Exception as error:
+        return path, lines, str(error)
+    return path, lines, None
+
+def compileFiles(paths, options, jobs = 1):
+    result = BatchResult()
+    started = time.time()
+
+    if options.outputDirectory is not None and not os.path.isdir(options.outputDirectory):
+        os.makedirs(options.outputDirectory)
+
+    # A path matching nothing is most likely a typo, so it fails the batch
+    # rather than quietly compiling nothing.
+    for path in paths:
+        if not findInputs([path]):
+            result.failures.append((path, "no input files match"))
+
+    tasks = []
+    for path in findInputs(paths):
+        output = getOutputPath(path, options)
+        if not options.force and isUpToDate(path, output):
+            result.skipped += 1
+        else:
+            tasks.append((path, output, options))
+
+    if jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(tasks)))
+        try:
+            outcomes = list(pool.imap_unordered(compileFile, tasks))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        outcomes = [compileFile(task) for task in tasks]
+
+    for path, lines, error in sorted(outcomes):
+        if error is not None:
+            result.failures.append((path, error))
+        else:
+            result.compiled += 1
+            result.lines += lines
+
+    result.seconds = time.time() - started
+    return result
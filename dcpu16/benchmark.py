@@ -0,0 +1,204 @@
+import glob
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from dcpu16.compiler import generate
+from dcpu16.assembler import Assembler
+from dcpu16.emulator import Emulator
+from dcpu16.instructions import Instruction, render
+from dcpu16.profiler import Profiler
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+METRICS = ("words", "instructions", "cycles")
+COMPILE_PHASES = ("parse", "inline", "loops", "deadcode", "transform", "codegen", "passes", "link", "peephole", "emit")
+
+EXPECT_PATTERN = re.compile(r"^#\s*expect:\s*(\w+)\s*=\s*(\w+)", re.MULTILINE)
+
+MAX_INSTRUCTIONS = 10000000
+
+class BenchmarkResult:
+    def __init__(self, name, metrics, failures):
+        self.name = name
+        self.metrics = metrics
+        self.failures = failures
+
+def runProgram(name, source, **options):
+    instructions = generate(source, **options)
+    assembler = Assembler()
+    image = assembler.assemble(instructions)
+
+    emulator = Emulator(image)
+    emulator.pc = assembler.labels.get("start", 0)
+    failures = []
+    if not emulator.run(MAX_INSTRUCTIONS):
+        failures.append("did not halt within %d instructions" % (MAX_INSTRUCTIONS,))
+    for address, expected in EXPECT_PATTERN.findall(source):
+        actual = emulator.memory[int(address, 0)]
+        if actual != int(expected, 0):
+            failures.append("[%s] is %d, expected %s" % (address, actual, expected))
+
+    metrics = {
+        "words" : len(image),
+        "instructions" : sum(1 for item in instructions if isinstance(item, Instruction)),
+        "cycles" : emulator.cycles,
+    }
+    return BenchmarkResult(name, metrics, failures)
+
+def runSuite(directory, **options):
+    results = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path) as source:
+            results.append(runProgram(name, source.read(), **options))
+    return results
+
+def findRegressions(results, baseline, tolerance = 0.0):
+    regressions = []
+    for result in results:
+        if result.name not in baseline:
+            continue
+        for metric in METRICS:
+            limit = baseline[result.name][metric] * (1 + tolerance)
+            if result.metrics[metric] > limit:
+                regressions.append("%s: %s regressed from %d to %d" % (result.name, metric, baseline[result.name][metric], result.metrics[metric]))
+    return regressions
+
+def loadBaseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baseline:
+        return json.load(baseline)
+
+def saveBaseline(path, results):
+    with open(path, "w") as baseline:
+        json.dump(dict((result.name, result.metrics) for result in results), baseline, indent = 4, sort_keys = True, separators = (",", ": "))
+        baseline.write("\n")
+
+SYNTHETIC_OPERATORS = ("+", "-", "*", "/", "%")
+
+class NullWriter:
+    def write(self, data):
+        pass
+    
+    def writelines(self, lines):
+        for line in lines:
+            pass
+
+def generateExpression(generator, depth, names):
+    if depth <= 0:
+        if generator.random() < 0.5:
+            return generator.choice(names)
+        return str(generator.randint(0, 100))
+    return "(%s %s %s)" % (generateExpression(generator, depth - 1, names), generator.choice(SYNTHETIC_OPERATORS), generateExpression(generator, depth - 1, names))
+
+def generateSource(functions, statements, depth, seed = 0, variables = 16):
+    generator = random.Random(seed)
+    names = ["v%d" % (i,) for i in range(variables)]
+    lines = []
+    for function in range(functions):
+        lines.append("def f%d():" % (function,))
+        for statement in range(statements):
+            choice = generator.random()
+            if choice < 0.15 and function + 1 < functions:
+                lines.append("    %s = f%d()" % (generator.choice(names), generator.randint(function + 1, functions - 1)))
+            elif choice < 0.3:
+                lines.append("    if %s < %s:" % (generator.choice(names), generateExpression(generator, depth, names)))
+                lines.append("        %s = %s" % (generator.choice(names), generateExpression(generator, depth, names)))
+            else:
+                lines.append("    %s = %s" % (generator.choice(names), generateExpression(generator, depth, names)))
+        lines.append("    return 0")
+        lines.append("")
+    return "\n".join(lines)
+
+def timeCompile(source):
+    # Compiles through generate(), as the command line does, and reads the
+    # time of every stage off a profiler that leaves the code generator
+    # uninstrumented.
+    profiler = Profiler(profileNodes = False)
+    started = time.time()
+    instructions = generate(source, profiler = profiler)
+    profiler.stage("emit", render, instructions, NullWriter())
+    total = time.time() - started
+    
+    timings = dict((phase, profiler.stages[phase].seconds if phase in profiler.stages else 0.0) for phase in COMPILE_PHASES)
+    timings["total"] = total
+    timings["instructions"] = len(instructions)
+    return timings
+
+# The resident set high-water mark only ever grows for the life of a
+# process, and getrusage() even carries it over from the parent that
+# forked the interpreter, so every measurement compiles in a fresh
+# interpreter and reads the mark its own address space started with.
+PEAK_MEMORY_SCRIPT = """
+import sys
+from dcpu16.compiler import generate
+
+def getHighWaterMark():
+    try:
+        status = open("/proc/self/status")
+    except IOError:
+        return None
+    try:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    finally:
+        status.close()
+    return None
+
+source = sys.stdin.read()
+before = getHighWaterMark()
+generate(source)
+after = getHighWaterMark()
+if before is not None and after is not None:
+    sys.stdout.write("%d\\n" % (after - before,))
+"""
+
+def measurePeakMemory(source):
+    # Returns the bytes compiling source needed at its peak, or None when
+    # this platform offers no way to tell.
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            generate(source)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join([root] + ([environment["PYTHONPATH"]] if environment.get("PYTHONPATH") else []))
+    process = subprocess.Popen([sys.executable, "-c", PEAK_MEMORY_SCRIPT], stdin = subprocess.PIPE, stdout = subprocess.PIPE, env = environment)
+    output = process.communicate(source)[0]
+    if process.returncode != 0 or not output.strip():
+        return None
+    return int(output)
+
+def runCompileBenchmark(functions, statements, depth, seed = 0, repeat = 3):
+    source = generateSource(functions, statements, depth, seed)
+    best = None
+    for attempt in range(repeat):
+        timings = timeCompile(source)
+        if best is None:
+            best = timings
+        else:
+            for phase in COMPILE_PHASES + ("total",):
+                best[phase] = min(best[phase], timings[phase])
+    
+    result = {
+        "functions" : functions,
+        "statements" : statements,
+        "depth" : depth,
+        "lines" : source.count("\n") + 1,
+        "peak_memory" : measurePeakMemory(source),
+        "peak_memory_source" : "tracemalloc" if tracemalloc is not None else "hwm",
+    }
+    result.update(best)
+    return result
@@ -0,0 +1,132 @@
+import ast
+import cPickle
+import errno
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import dcpu16.compiler
+import dcpu16.deadcode
+import dcpu16.dispatch
+import dcpu16.inliner
+import dcpu16.instructions
+import dcpu16.loops
+import dcpu16.transforms
+
+CACHE_FORMAT = "1"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 4096
+VERSION_MODULES = (dcpu16.compiler, dcpu16.transforms, dcpu16.inliner, dcpu16.deadcode, dcpu16.loops, dcpu16.dispatch, dcpu16.instructions)
+
+def compilerVersion():
+    digest = hashlib.sha1(CACHE_FORMAT)
+    for module in VERSION_MODULES:
+        with open(os.path.splitext(module.__file__)[0] + ".py", "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+def fragmentKey(version, namespace, node, options):
+    digest = hashlib.sha1(version)
+    digest.update("%s\0%r\0" % (namespace, options))
+    digest.update(ast.dump(node))
+    return digest.hexdigest()
+
+class MemoryCache:
+    def __init__(self, maxEntries = DEFAULT_MAX_ENTRIES, version = None):
+        self.maxEntries = maxEntries
+        self.version = version if version is not None else compilerVersion()
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, namespace, node, options):
+        return fragmentKey(self.version, namespace, node, options)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last = False)
+
+class FragmentCache:
+    def __init__(self, directory, maxBytes = DEFAULT_MAX_BYTES, version = None):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.version = version if version is not None else compilerVersion()
+        self.sizes = None
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, namespace, node, options):
+        return fragmentKey(self.version, namespace, node, options)
+
+    def getPath(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self.getPath(key)
+        try:
+            with open(path, "rb") as entry:
+                fragment = cPickle.load(entry)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            self.misses += 1
+            return None
+        os.utime(path, None)
+        self.hits += 1
+        return fragment
+
+    def put(self, key, fragment):
+        path = self.getPath(key)
+        data = cPickle.dumps(fragment, cPickle.HIGHEST_PROTOCOL)
+        temporary = "%s.%d.tmp" % (path, os.getpid())
+        with open(temporary, "wb") as entry:
+            entry.write(data)
+        os.rename(temporary, path)
+
+        sizes = self.getSizes()
+        sizes[key] = len(data)
+        self.evict()
+
+    def getSizes(self):
+        if self.sizes is None:
+            self.sizes = {}
+            for name in os.listdir(self.directory):
+                if not name.endswith(".tmp"):
+                    self.sizes[name] = os.path.getsize(self.getPath(name))
+        return self.sizes
+
+    def evict(self):
+        sizes = self.getSizes()
+        total = sum(sizes.itervalues())
+        if total <= self.maxBytes:
+            return
+
+        entries = []
+        for name in sizes:
+            try:
+                entries.append((os.path.getmtime(self.getPath(name)), name))
+            except OSError:
+                entries.append((0, name))
+        for mtime, name in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(self.getPath(name))
+            except OSError as error:
+                if error.errno != errno.ENOENT:
+                    raise
+            total -= sizes.pop(name)
@@ -1,6 +1,21 @@
 import ast
+import bisect
+import copy
+import heapq
+import multiprocessing
+from dcpu16.transforms import foldConstants, isPure, wrap, WORD_MASK
+from dcpu16.peephole import optimize
+from dcpu16.liveness import allocateSlots
+from dcpu16.inliner import inlineFunctions, getSignatures, getCalls, getReadNames, getAssignedNames
+from dcpu16.deadcode import eliminateDeadCode
+from dcpu16.loops import optimizeLoops, getRangeArguments, getTripCount, hasCalls
+from dcpu16.dispatch import getDispatchCases, chooseDispatch, CHAIN, TABLE, SEARCH_LEAF_CASES
+from dcpu16.passes import PassManager, DEFAULT_PASSES
+from dcpu16.instructions import Instruction, Label, Data, Register, Literal, Address, LabelRef, Memory, IndexedMemory, A, PC, POP, PUSH, VARIABLE_ADDRESS_RANGE, measure, render
 
-VARIABLE_ADDRESS_RANGE = (0x2000, 0x7000)
+SCREEN_ADDRESS = 0x8000
+
+GENERAL_REGISTERS = ("b", "c", "x", "y", "z", "i", "j")
 
 BIN_OP_MAP = {
     "Add" : "add",
@@ -10,6 +25,16 @@ BIN_OP_MAP = {
     "Mod" : "mod",
 }
 
+COMMUTATIVE_OPS = frozenset(["add", "mul"])
+
+# Multiplying, dividing or taking the remainder by a power of two needs
+# only a shift or a mask, which costs a single cycle.
+REDUCED_OP_MAP = {
+    "mul" : lambda shift, value: ("shl", shift),
+    "div" : lambda shift, value: ("shr", shift),
+    "mod" : lambda shift, value: ("and", value - 1),
+}
+
 BOOL_OP_MAP = {
     "And" : "ifn",
     "Or" : "ife",
@@ -25,38 +50,99 @@ COMPARE_OP_MAP = {
     "LtE" : ["ifl", "ife"],
     "Lt" : "ifl",
     "Eq" : "ife",
+    "NotEq" : "ifn",
+}
+
+NEGATED_COMPARE_OP_MAP = {
+    "GtE" : "Lt",
+    "Gt" : "LtE",
+    "LtE" : "Gt",
+    "Lt" : "GtE",
+    "Eq" : "NotEq",
+    "NotEq" : "Eq",
+}
+
+MIRRORED_COMPARE_OP_MAP = {
+    "GtE" : "LtE",
+    "Gt" : "Lt",
+    "LtE" : "GtE",
+    "Lt" : "Gt",
+    "Eq" : "Eq",
+    "NotEq" : "NotEq",
 }
 
+# "a >= n" is "a > n - 1" and "a <= n" is "a < n + 1" for a constant n,
+# which saves the second test; the bound is where the test always holds.
+INCLUSIVE_COMPARE_OP_MAP = {
+    "GtE" : ("ifg", -1, 0),
+    "LtE" : ("ifl", 1, 0xffff),
+}
+
+def getPowerOfTwo(value):
+    if value > 1 and not value & (value - 1):
+        return value.bit_length() - 1
+    return None
+
 class Variable:
     def __init__(self, name, address, context):
         self.name = name
         self.address = address
         self.context = context
 
+class AddressAllocator:
+    def __init__(self, start, end):
+        self.end = end
+        self.top = start
+        self.released = []
+        self.free = set()
+    
+    def peek(self, reuse = True):
+        released = self.released
+        while reuse and released and released[0] not in self.free:
+            heapq.heappop(released)
+        if reuse and released:
+            return released[0]
+        if self.top > self.end:
+            raise Exception("Memory exhausted")
+        return self.top
+    
+    def allocate(self):
+        address = self.peek()
+        self.reserve(address)
+        return address
+    
+    def reserve(self, address):
+        if address >= self.top:
+            for gap in range(self.top, address):
+                self.free.add(gap)
+                heapq.heappush(self.released, gap)
+            self.top = address + 1
+        else:
+            self.free.discard(address)
+    
+    def release(self, address):
+        if address < self.top and address not in self.free:
+            self.free.add(address)
+            heapq.heappush(self.released, address)
+    
+    def isAllocated(self, address):
+        return address < self.top and address not in self.free
+
 class Context:
     def __init__(self, parent = None):
         self.parent = parent
         self.varsByAddress = {}
         self.varsByName = {}
+        self.allocator = AddressAllocator(*VARIABLE_ADDRESS_RANGE) if parent is None else None
     
     def startChildContext(self):
         return Context(self)
     
-    def toAddress(self, num):
-        address = hex(num)
-        while address < 6:
-            address = address[0:2] + "0" + address[2:]
-        return address
-    
     def getNextAddress(self):
         if self.parent:
             return self.parent.getNextAddress()
         
-        for num in range(VARIABLE_ADDRESS_RANGE[0], VARIABLE_ADDRESS_RANGE[1] + 1):
-            address = self.toAddress(num)
-            if address not in self.varsByAddress:
-                return address
-        raise Exception("Memory exhausted")
+        return self.allocator.peek()
     
     def getVariable(self, name, context = None):
         context = context if context else self
@@ -83,6 +169,8 @@ class Context:
         return var
     
     def addVariable(self, var):
+        if self.allocator:
+            self.allocator.reserve(var.address)
         self.varsByAddress[var.address] = var
         if var.name not in self.varsByName:
             self.varsByName[var.name] = []
@@ -93,17 +181,21 @@ class Context:
             self.parent.removeVariable(var)
         if var.address in self.varsByAddress:
             del self.varsByAddress[var.address]
+            if self.allocator:
+                self.allocator.release(var.address)
         if var.name in self.varsByName:
             self.varsByName[var.name].remove(var)
     
     def removeAddress(self, address):
         if self.parent:
-            self.parent.removeAddress(var)
+            self.parent.removeAddress(address)
         if address in self.varsByAddress:
             var = self.varsByAddress[address]
             if var.name in self.varsByName:
                 self.varsByName[var.name].remove(var)
             del self.varsByAddress[address]
+            if self.allocator:
+                self.allocator.release(address)
     
     def destroy(self):
         if not self.parent:
@@ -117,29 +209,72 @@ class Context:
         self.varsByName = {}
 
 class Program(Context):
-    def __init__(self):
+    def __init__(self, namespace = None):
         Context.__init__(self)
         
+        self.namespace = namespace
         self.uniqueId = 0
+        self.variables = {}
+        self.temporaries = set()
         
     def getUniqueId(self):
         self.uniqueId += 1
         return self.uniqueId
 
     def getUniqueTag(self, prefix):
+        if self.namespace is not None:
+            return "%s.%s%d" % (self.namespace, prefix, self.getUniqueId())
         return "%s%d" % (prefix, self.getUniqueId())
     
+    def getNextAddress(self):
+        # Named variables never take over a released temporary, so every
+        # address keeps a single meaning when the fragment is relocated.
+        return self.allocator.peek(reuse = False)
+    
     def getUniqueAddress(self):
-        var = self.getVariable(str(self.getUniqueId()))
-        return var.address
+        address = self.allocator.peek()
+        self.temporaries.add(address)
+        self.addVariable(Variable(str(self.getUniqueId()), address, self))
+        return address
+    
+    def addVariable(self, var):
+        Context.addVariable(self, var)
+        if var.address not in self.temporaries:
+            self.variables.setdefault(var.name, var.address)
+
+class RegisterPool:
+    def __init__(self, names = GENERAL_REGISTERS):
+        self.free = [Register(name) for name in reversed(names)]
+        self.live = []
+    
+    def allocate(self):
+        if not self.free:
+            return None
+        register = self.free.pop()
+        self.live.append(register)
+        return register
+    
+    def release(self, register):
+        self.live.remove(register)
+        self.free.append(register)
 
 class DCPU16AssemblyProducer(ast.NodeVisitor):
-    def __init__(self, program):
+    def __init__(self, program, registers = True, signatures = None, dispatch = True):
         ast.NodeVisitor.__init__(self)
         
         self.program = program
         self.context = program
-        self.code = ""
+        self.registers = RegisterPool() if registers else None
+        self.signatures = signatures or {}
+        self.dispatch = dispatch
+        self.instructions = []
+        self.loops = []
+    
+    def emit(self, opcode, *operands):
+        self.instructions.append(Instruction(opcode, *operands))
+    
+    def label(self, name):
+        self.instructions.append(Label(name))
     
     def getOpMapValue(self, map, node, key = "op", index = None):
         op = getattr(node, key)
@@ -159,145 +294,551 @@ class DCPU16AssemblyProducer(ast.NodeVisitor):
     
     def getVariableAddress(self, name):
         if name.lower() == "screen":
-            return "0x8000"
-        return self.context.getVariable(name).address
+            return Address(SCREEN_ADDRESS)
+        return Address(self.context.getVariable(name).address)
+    
+    def acquireTemporary(self):
+        if self.registers is not None:
+            register = self.registers.allocate()
+            if register is not None:
+                return register
+        return Memory(Address(self.program.getUniqueAddress()))
+    
+    def releaseTemporary(self, operand):
+        if isinstance(operand, Register):
+            self.registers.release(operand)
+        else:
+            self.program.removeAddress(operand.value.value)
+    
+    def getSimpleOperand(self, node):
+        if self.registers is None:
+            return None
+        if isinstance(node, ast.Index):
+            node = node.value
+        if isinstance(node, ast.Name):
+            return Memory(self.getVariableAddress(node.id))
+        elif isinstance(node, ast.Num):
+            return Literal(node.n)
+        return None
+    
+    def getRegisterNeed(self, node):
+        if isinstance(node, (ast.Name, ast.Num)):
+            return 0
+        elif isinstance(node, ast.BinOp):
+            leftNeed = self.getRegisterNeed(node.left)
+            rightNeed = self.getRegisterNeed(node.right)
+            if rightNeed == 0:
+                return leftNeed
+            return max(leftNeed, rightNeed + 1)
+        return 1
     
     def visit_Module(self, node):
-        code = ""
         for child in node.body:
-            subCode = self.visit(child)
-            if subCode:
-                code += "\n" + subCode
-        return code.strip()
+            self.visit(child)
     
     def visit_FunctionDef(self, node):
-        code = ":%s" % (node.name,)
+        self.label(node.name)
         for child in node.body:
-            subCode = self.visit(child)
-            if subCode:
-                code += "\n" + subCode
-        return code
+            self.visit(child)
     
     def visit_Return(self, node):
-        code = self.visitForValue(node.value)
-        code += "\nset PC, POP"
-        return code
+        self.visitForValue(node.value)
+        self.emit("set", PC, POP)
     
     def visit_Call(self, node):
-        return "jsr %s" % (node.func.id,) if node.func.id != "exit" else "set PC, end"
+        if node.func.id == "exit":
+            self.emit("set", PC, LabelRef("end"))
+            return
+        
+        self.bindArguments(self.signatures.get(node.func.id, ()), node.args)
+        saved = list(self.registers.live) if self.registers is not None else []
+        for register in saved:
+            self.emit("set", PUSH, register)
+        self.emit("jsr", LabelRef(node.func.id))
+        for register in reversed(saved):
+            self.emit("set", register, POP)
+    
+    def bindArguments(self, params, args):
+        bindings = zip(params, args)
+        if any(getReadNames(arg) & set(params[:i]) for i, (param, arg) in enumerate(bindings)):
+            # A later argument reads a parameter bound before it, so every
+            # argument is evaluated before any parameter is written.
+            temporaries = []
+            for param, arg in bindings:
+                self.visitForValue(arg)
+                temporaries.append(self.acquireTemporary())
+                self.emit("set", temporaries[-1], A)
+            for (param, arg), temporary in zip(bindings, temporaries):
+                self.emit("set", Memory(self.getVariableAddress(param)), temporary)
+            for temporary in reversed(temporaries):
+                self.releaseTemporary(temporary)
+            return
+        
+        for param, arg in bindings:
+            self.visitForValue(arg)
+            self.emit("set", Memory(self.getVariableAddress(param)), A)
     
     def visit_If(self, node):
+        cases = getDispatchCases(node) if self.dispatch else None
+        if cases is not None:
+            name, cases, orelse = cases
+            strategy = chooseDispatch([value for value, body in cases])
+            if strategy != CHAIN:
+                self.visitDispatch(name, cases, orelse, strategy)
+                return
+        
         tagName = self.program.getUniqueTag("if")
-        code = self.visitForValue(node.test)
-        code += "\nifn a, 1"
-        code += "\nset PC, %selse" % (tagName,)
+        endLabel = "%send" % (tagName,)
+        elseLabel = "%selse" % (tagName,) if node.orelse else endLabel
+        self.visitCondition(node.test, elseLabel, False)
         for child in node.body:
-            code += "\n" + self.visit(child)
-        code += "\nset PC, %send" % (tagName,)
-        code += "\n:%selse" % (tagName,)
+            self.visit(child)
+        if node.orelse:
+            self.emit("set", PC, LabelRef(endLabel))
+            self.label(elseLabel)
+            for child in node.orelse:
+                self.visit(child)
+        self.label(endLabel)
+    
+    def visitDispatch(self, name, cases, orelse, strategy):
+        # The variable is loaded once and either indexes a table of case
+        # labels or is narrowed down by a binary search; the bodies follow
+        # in their original order.
+        tagName = self.program.getUniqueTag("switch")
+        endLabel = "%send" % (tagName,)
+        defaultLabel = "%sdefault" % (tagName,) if orelse else endLabel
+        labels = dict((value, "%scase%d" % (tagName, index)) for index, (value, body) in enumerate(cases))
+        
+        self.visitForValue(ast.Name(id = name, ctx = ast.Load()))
+        if strategy == TABLE:
+            low, high = min(labels), max(labels)
+            if low:
+                self.emit("sub", A, Literal(low))
+            self.emit("ifg", A, Literal(high - low))
+            self.emit("set", PC, LabelRef(defaultLabel))
+            self.emit("set", PC, IndexedMemory(A, LabelRef("%stable" % (tagName,))))
+            self.label("%stable" % (tagName,))
+            self.instructions.append(Data(*[LabelRef(labels.get(value, defaultLabel)) for value in xrange(low, high + 1)]))
+        else:
+            self.emitSearch(sorted(labels.iteritems()), defaultLabel)
+        
+        for index, (value, body) in enumerate(cases):
+            self.label(labels[value])
+            for child in body:
+                self.visit(child)
+            if orelse or index < len(cases) - 1:
+                self.emit("set", PC, LabelRef(endLabel))
+        if orelse:
+            self.label(defaultLabel)
+            for child in orelse:
+                self.visit(child)
+        self.label(endLabel)
+    
+    def emitSearch(self, cases, defaultLabel):
+        if len(cases) <= SEARCH_LEAF_CASES:
+            for value, label in cases:
+                self.emit("ife", A, Literal(value))
+                self.emit("set", PC, LabelRef(label))
+            self.emit("set", PC, LabelRef(defaultLabel))
+            return
+        middle = len(cases) // 2
+        upperLabel = "%supper" % (self.program.getUniqueTag("search"),)
+        self.emit("ifg", A, Literal(cases[middle - 1][0]))
+        self.emit("set", PC, LabelRef(upperLabel))
+        self.emitSearch(cases[:middle], defaultLabel)
+        self.label(upperLabel)
+        self.emitSearch(cases[middle:], defaultLabel)
+    
+    def visitLoopBody(self, body, continueLabel, breakLabel):
+        self.loops.append((continueLabel, breakLabel))
+        for child in body:
+            self.visit(child)
+        self.loops.pop()
+    
+    def visit_While(self, node):
+        tagName = self.program.getUniqueTag("while")
+        bodyLabel = "%sbody" % (tagName,)
+        testLabel = "%stest" % (tagName,)
+        endLabel = "%send" % (tagName,)
+        if not (isinstance(node.test, ast.Num) and not node.test.n & 0xffff):
+            # The test sits after the body, so every pass around the loop
+            # takes a single jump.
+            if not isinstance(node.test, ast.Num):
+                self.emit("set", PC, LabelRef(testLabel))
+            self.label(bodyLabel)
+            self.visitLoopBody(node.body, testLabel, endLabel)
+            self.label(testLabel)
+            self.visitCondition(node.test, bodyLabel, True)
+        for child in node.orelse:
+            self.visit(child)
+        self.label(endLabel)
+    
+    def visit_For(self, node):
+        arguments = getRangeArguments(node)
+        if arguments is None:
+            raise Exception("Only for loops over range() with a constant step are supported on line %s column %s" % (node.lineno, node.col_offset))
+        start, stop, step = arguments
+        target = Memory(self.getVariableAddress(node.target.id))
+        tagName = self.program.getUniqueTag("for")
+        nextLabel = "%snext" % (tagName,)
+        bodyLabel = "%sbody" % (tagName,)
+        continueLabel = "%scontinue" % (tagName,)
+        elseLabel = "%selse" % (tagName,)
+        endLabel = "%send" % (tagName,)
+        
+        # The loop runs on a counter of the passes left, which only needs
+        # "ifn counter, 0" to test; the variable is stepped next to it.
+        # A body that writes the variable, or calls something that might,
+        # cannot change the values it steps through, so those keep the
+        # current value in a temporary of their own.
+        constant = isinstance(start, ast.Num) and isinstance(stop, ast.Num)
+        count = getTripCount(node) if constant else None
+        if count is not None and count > WORD_MASK:
+            raise Exception("range() of more than %d passes is not supported on line %s column %s" % (WORD_MASK, node.lineno, node.col_offset))
+        if count == 0:
+            for child in node.orelse:
+                self.visit(child)
+            return
+        hidden = node.target.id in getAssignedNames(node.body) or hasCalls(node.body)
+        unread = constant and not hidden and not any(node.target.id in getReadNames(child) for child in node.body) and not any(isinstance(child, ast.Break) for child in ast.walk(node))
+        
+        counter = self.acquireTemporary()
+        if constant:
+            self.emit("set", counter, Literal(count))
+            initial = Literal(wrap(start.n - step))
+        else:
+            # Python evaluates start first, and a call in either bound may
+            # write what the other reads.
+            startTemporary = None
+            if not isinstance(start, ast.Num) and hasCalls([start, stop]):
+                self.visitForValue(start)
+                startTemporary = self.acquireTemporary()
+                self.emit("set", startTemporary, A)
+            self.visitForValue(stop)
+            self.emit("set", counter, A)
+            if startTemporary is not None:
+                self.emit("set", A, startTemporary)
+                self.releaseTemporary(startTemporary)
+            else:
+                self.visitForValue(start)
+            # The bounds compare signed, as getTripCount counts constant ones.
+            skipLabel = "%sskip" % (tagName,)
+            self.emit("ifu" if step > 0 else "ifa", A, counter)
+            self.emit("set", PC, LabelRef(skipLabel))
+            self.emit("set", PC, LabelRef(elseLabel))
+            self.label(skipLabel)
+            self.emit("sub", counter, A)
+            if step < 0:
+                self.emit("mul", counter, Literal(0xffff))
+            if abs(step) > 1:
+                self.emit("add", counter, Literal(abs(step) - 1))
+                shift = getPowerOfTwo(abs(step))
+                if shift is not None:
+                    self.emit("shr", counter, Literal(shift))
+                else:
+                    self.emit("div", counter, Literal(abs(step)))
+            self.emit("sub", A, Literal(wrap(step)))
+            initial = A
+        
+        current = None
+        if unread:
+            self.emit("set", target, Literal(wrap(start.n + (count - 1) * step)))
+        else:
+            if hidden:
+                current = self.acquireTemporary()
+                self.emit("set", current, initial)
+            else:
+                self.emit("set", target, initial)
+            self.label(nextLabel)
+            if hidden:
+                self.emit("add", current, Literal(wrap(step)))
+                self.emit("set", target, current)
+            else:
+                self.emit("add", target, Literal(wrap(step)))
+        self.label(bodyLabel)
+        self.visitLoopBody(node.body, continueLabel, endLabel)
+        self.label(continueLabel)
+        self.emit("sub", counter, Literal(1))
+        self.emit("ifn", counter, Literal(0))
+        self.emit("set", PC, LabelRef(bodyLabel if unread else nextLabel))
+        self.label(elseLabel)
         for child in node.orelse:
-            code += "\n" + self.visit(child)
-        code += "\n:%send" % (tagName,)
-        return code
+            self.visit(child)
+        self.label(endLabel)
+        if current is not None:
+            self.releaseTemporary(current)
+        self.releaseTemporary(counter)
+    
+    def visit_Break(self, node):
+        if not self.loops:
+            raise Exception("break outside a loop on line %s column %s" % (node.lineno, node.col_offset))
+        self.emit("set", PC, LabelRef(self.loops[-1][1]))
+    
+    def visit_Continue(self, node):
+        if not self.loops:
+            raise Exception("continue outside a loop on line %s column %s" % (node.lineno, node.col_offset))
+        self.emit("set", PC, LabelRef(self.loops[-1][0]))
     
     def visit_Assign(self, node):
-        uniqueAddress = self.program.getUniqueAddress()
+        if self.registers is not None and self.emitUpdate(node):
+            return
         
-        code = self.visitForValue(node.value)
-        code += "\nset [%s], a" % (uniqueAddress,)
-        for target in node.targets:
-            code += "\n" + self.visitForReference(target)
-            code += "\nset [a], [%s]" % (uniqueAddress,)
-            
-        self.program.removeAddress(uniqueAddress)
+        self.visitForValue(node.value)
         
-        return code
+        if self.registers is not None and all(isinstance(target, ast.Name) for target in node.targets):
+            for target in node.targets:
+                self.emit("set", Memory(self.getVariableAddress(target.id)), A)
+            return
+        
+        temporary = self.acquireTemporary()
+        self.emit("set", temporary, A)
+        for target in node.targets:
+            self.visitForReference(target)
+            self.emit("set", Memory(A), temporary)
+        self.releaseTemporary(temporary)
+    
+    def emitUpdate(self, node):
+        # "x = x + y" and the like work on the variable in place.
+        value = node.value
+        if len(node.targets) != 1 or not isinstance(node.targets[0], ast.Name) or not isinstance(value, ast.BinOp):
+            return False
+        if not isinstance(value.left, ast.Name) or value.left.id != node.targets[0].id or type(value.op).__name__ not in BIN_OP_MAP:
+            return False
+        operand = self.getSimpleOperand(value.right)
+        if operand is None:
+            return False
+        target = Memory(self.getVariableAddress(node.targets[0].id))
+        opValue = self.getOpMapValue(BIN_OP_MAP, value)
+        shift = getPowerOfTwo(operand.value & 0xffff) if isinstance(operand, Literal) and opValue in REDUCED_OP_MAP else None
+        if shift is not None:
+            opValue, operand = REDUCED_OP_MAP[opValue](shift, operand.value & 0xffff)
+            operand = Literal(operand)
+        self.emit(opValue, target, operand)
+        return True
     
     def visit_BoolOp(self, node):
         opValue = self.getOpMapValue(BOOL_OP_MAP, node)
         tagName = self.program.getUniqueTag("boolop")
         for value in node.values:
-            code = self.visitForValue(value)
-            code += "\n%s a, 1" % (opValue,)
-            code += "\nset PC, %sskip" % (tagName,)
-        code += "\n:%sskip" % (tagName,)
-        return code
+            self.visitForValue(value)
+            self.emit(opValue, A, Literal(1))
+            self.emit("set", PC, LabelRef("%sskip" % (tagName,)))
+        self.label("%sskip" % (tagName,))
         
     def visit_UnaryOp(self, node):
         opValue = self.getOpMapValue(UNARY_OP_MAP, node)
         
-        code = self.visitForValue(node.operand)
-        code += "\n%s a, 1" % (opValue,)
-        return code
+        self.visitForValue(node.operand)
+        self.emit(opValue, A, Literal(1))
     
     def visit_Compare(self, node):
-        uniqueAddress1 = self.program.getUniqueAddress()
-        uniqueAddress2 = self.program.getUniqueAddress()
+        leftOperand = self.getSimpleOperand(node.left)
+        if isinstance(leftOperand, Memory) and hasCalls(node.comparators):
+            # A call on the right may write the variable, so its value is
+            # taken before the call.
+            leftOperand = None
+        leftTemporary = None
+        if leftOperand is None:
+            self.visitForValue(node.left)
+            leftOperand = leftTemporary = self.acquireTemporary()
+            self.emit("set", leftTemporary, A)
         
-        code = self.visitForValue(node.left)
-        code += "\nset [%s], a" % (uniqueAddress1,)
         for i in range(0, len(node.ops)):
             opValue = self.getOpMapValue(COMPARE_OP_MAP, node, "ops", i)
             if not isinstance(opValue, list):
                 opValue = [opValue]
             
-            code += "\n" + self.visitForValue(node.comparators[i])
-            code += "\nset [%s], a" % (uniqueAddress2,)
+            rightOperand = self.getSimpleOperand(node.comparators[i])
+            rightTemporary = None
+            if rightOperand is None:
+                self.visitForValue(node.comparators[i])
+                rightOperand = rightTemporary = self.acquireTemporary()
+                self.emit("set", rightTemporary, A)
+            
+            self.emit("set", A, Literal(0))
             for opStr in opValue:
-                code += "\n%s [%s], [%s]\nset a, 1" % (opStr, uniqueAddress1, uniqueAddress2)
-        
-        self.program.removeAddress(uniqueAddress1)
-        self.program.removeAddress(uniqueAddress2)
+                self.emit(opStr, leftOperand, rightOperand)
+                self.emit("set", A, Literal(1))
+            
+            if rightTemporary is not None:
+                self.releaseTemporary(rightTemporary)
         
-        return code
+        if leftTemporary is not None:
+            self.releaseTemporary(leftTemporary)
     
     def visit_Expr(self, node):
-        return self.visitForValue(node.value)
+        self.visitForValue(node.value)
+    
+    def visit_Pass(self, node):
+        pass
     
     def visit_BinOp(self, node):
-        uniqueAddress = self.program.getUniqueAddress()
         opValue = self.getOpMapValue(BIN_OP_MAP, node)
         
-        code = self.visitForValue(node.left)
-        code += "\nset [%s], a" % (uniqueAddress,)
-        code += "\n" + self.visitForValue(node.right)
-        code += "\n%s [%s], a" % (opValue, uniqueAddress)
-        code += "\nset a, [%s]" % (uniqueAddress,)
+        left, right = node.left, node.right
+        if opValue in COMMUTATIVE_OPS and isinstance(left, ast.Num) and getPowerOfTwo(left.n & 0xffff) is not None:
+            left, right = right, left
+        elif opValue in COMMUTATIVE_OPS and self.registers is not None and isPure(left) and isPure(right):
+            # A call may write what the other operand reads, so operands
+            # with calls keep their order.
+            if self.getRegisterNeed(right) > self.getRegisterNeed(left):
+                left, right = right, left
         
-        self.program.removeAddress(uniqueAddress)
+        self.visitForValue(left)
+        if isinstance(right, ast.Num) and opValue in REDUCED_OP_MAP and self.emitReduced(opValue, right.n & 0xffff):
+            return
+        rightOperand = self.getSimpleOperand(right)
+        if rightOperand is not None:
+            self.emit(opValue, A, rightOperand)
+            return
         
-        return code
+        temporary = self.acquireTemporary()
+        self.emit("set", temporary, A)
+        self.visitForValue(right)
+        self.emit(opValue, temporary, A)
+        self.emit("set", A, temporary)
+        self.releaseTemporary(temporary)
+    
+    def emitReduced(self, opValue, value):
+        shift = getPowerOfTwo(value)
+        if shift is None:
+            return False
+        opStr, operand = REDUCED_OP_MAP[opValue](shift, value)
+        self.emit(opStr, A, Literal(operand))
+        return True
     
     def visit_Subscript(self, node):
-        uniqueAddress = self.program.getUniqueAddress()
-        
-        code = self.visitForValue(node.slice)
-        code += "\nset [%s], a" % (uniqueAddress,)
-        code += "\n" + self.visitForReference(node.value)
-        code += "\nadd a, [%s]" % (uniqueAddress,)
-        
-        self.program.removeAddress(uniqueAddress)
+        if self.registers is not None and isinstance(node.value, ast.Name):
+            base = self.getVariableAddress(node.value.id)
+            index = self.getSimpleOperand(node.slice)
+            if isinstance(index, Literal):
+                self.emit("set", A, Address(base.value + index.value))
+            else:
+                self.visitForValue(node.slice)
+                self.emit("add", A, base)
+            return
         
-        return code
+        self.visitForValue(node.slice)
+        temporary = self.acquireTemporary()
+        self.emit("set", temporary, A)
+        self.visitForReference(node.value)
+        self.emit("add", A, temporary)
+        self.releaseTemporary(temporary)
     
     def visit_Index(self, node):
-        return self.visitForValue(node.value)
+        self.visitForValue(node.value)
     
     def visitForReference(self, node):
         if isinstance(node, ast.Name):
-            return "set a, %s" % (self.getVariableAddress(node.id),)
+            self.emit("set", A, self.getVariableAddress(node.id))
         elif isinstance(node, ast.Subscript):
-            return self.visit(node)
+            self.visit(node)
         else:
             raise Exception("Invalid reference on line %s column %s" % (node.lineno, node.col_offset))
     
+    def visitCondition(self, node, label, jumpIf):
+        if isinstance(node, ast.Compare):
+            self.visitCompareCondition(node, label, jumpIf)
+        elif isinstance(node, ast.BoolOp):
+            # "and" falls out on the first false value and "or" on the
+            # first true one; only the last value decides the jump alone.
+            exitsOn = isinstance(node.op, ast.Or)
+            if exitsOn == jumpIf:
+                for value in node.values:
+                    self.visitCondition(value, label, jumpIf)
+                return
+            skipLabel = "%sskip" % (self.program.getUniqueTag("boolop"),)
+            for value in node.values[:-1]:
+                self.visitCondition(value, skipLabel, exitsOn)
+            self.visitCondition(node.values[-1], label, jumpIf)
+            self.label(skipLabel)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            self.visitCondition(node.operand, label, not jumpIf)
+        elif isinstance(node, ast.Num):
+            if bool(node.n & 0xffff) == jumpIf:
+                self.emit("set", PC, LabelRef(label))
+        else:
+            self.visitForValue(node)
+            self.emit("ifn" if jumpIf else "ife", A, Literal(0))
+            self.emit("set", PC, LabelRef(label))
+    
+    def emitBranch(self, opName, leftOperand, rightOperand, label):
+        if isinstance(leftOperand, Literal) and not isinstance(rightOperand, Literal):
+            opName, leftOperand, rightOperand = MIRRORED_COMPARE_OP_MAP[opName], rightOperand, leftOperand
+        
+        opValue = COMPARE_OP_MAP[opName]
+        if not isinstance(opValue, list):
+            self.emit(opValue, leftOperand, rightOperand)
+            self.emit("set", PC, LabelRef(label))
+        elif isinstance(rightOperand, Literal):
+            opStr, offset, bound = INCLUSIVE_COMPARE_OP_MAP[opName]
+            if rightOperand.value & 0xffff != bound:
+                self.emit(opStr, leftOperand, Literal((rightOperand.value + offset) & 0xffff))
+            self.emit("set", PC, LabelRef(label))
+        else:
+            skipLabel = "%sskip" % (self.program.getUniqueTag("compare"),)
+            self.emit(COMPARE_OP_MAP[NEGATED_COMPARE_OP_MAP[opName]], leftOperand, rightOperand)
+            self.emit("set", PC, LabelRef(skipLabel))
+            self.emit("set", PC, LabelRef(label))
+            self.label(skipLabel)
+    
+    def visitCompareCondition(self, node, label, jumpIf):
+        skipLabel = None
+        if jumpIf and len(node.ops) > 1:
+            skipLabel = "%sskip" % (self.program.getUniqueTag("compare"),)
+        
+        left = node.left
+        leftOperand = self.getSimpleOperand(left)
+        leftTemporary = None
+        for i in range(0, len(node.ops)):
+            right = node.comparators[i]
+            rightOperand = self.getSimpleOperand(right)
+            rightTemporary = None
+            last = i == len(node.ops) - 1
+            
+            if isinstance(leftOperand, Memory) and hasCalls(node.comparators[i:]):
+                # A call further right may write the variable, so its value
+                # is taken before the call.
+                leftOperand = None
+            if leftOperand is None:
+                self.visitForValue(left)
+                if rightOperand is None or not last:
+                    leftOperand = leftTemporary = self.acquireTemporary()
+                    self.emit("set", leftTemporary, A)
+                else:
+                    leftOperand = A
+            if rightOperand is None:
+                self.visitForValue(right)
+                if last:
+                    rightOperand = A
+                else:
+                    rightOperand = rightTemporary = self.acquireTemporary()
+                    self.emit("set", rightTemporary, A)
+            
+            opName = type(node.ops[i]).__name__
+            if opName not in COMPARE_OP_MAP:
+                raise Exception("Unknown operation %s on line %s column %s" % (opName, node.lineno, node.col_offset))
+            if last and jumpIf:
+                self.emitBranch(opName, leftOperand, rightOperand, label)
+            else:
+                self.emitBranch(NEGATED_COMPARE_OP_MAP[opName], leftOperand, rightOperand, skipLabel if jumpIf else label)
+            
+            if leftTemporary is not None:
+                self.releaseTemporary(leftTemporary)
+            left, leftOperand, leftTemporary = right, rightOperand, rightTemporary
+        
+        if leftTemporary is not None:
+            self.releaseTemporary(leftTemporary)
+        if skipLabel is not None:
+            self.label(skipLabel)
+    
     def visitForValue(self, node):
         if isinstance(node, ast.Name):
-            return "set a, [%s]" % (self.getVariableAddress(node.id),)
+            self.emit("set", A, Memory(self.getVariableAddress(node.id)))
         elif isinstance(node, ast.Num):
-            return "set a, %d" % (node.n,)
+            self.emit("set", A, Literal(node.n))
         else:
-            return self.visit(node)
+            self.visit(node)
     
     def generic_visit(self, node):
         print type(node).__name__
@@ -307,7 +848,187 @@ class DCPU16AssemblyProducer(ast.NodeVisitor):
                 print " " + str(attr)      
         ast.NodeVisitor.generic_visit(self, node)
 
-def parse(str):
-    node = ast.parse(str)
-    visitor = DCPU16AssemblyProducer(Program())
-    print visitor.visit(node)
+class Fragment:
+    def __init__(self, namespace, instructions, variables, temporaries, folded = 0):
+        self.namespace = namespace
+        self.instructions = instructions
+        self.variables = variables
+        self.temporaries = temporaries
+        self.folded = folded
+    
+    def relocate(self, mapping):
+        bases = sorted(self.variables.itervalues())
+        start, end = VARIABLE_ADDRESS_RANGE
+        
+        def relocateAddress(address):
+            if address in mapping or not start <= address <= end:
+                return Address(mapping.get(address, address))
+            index = bisect.bisect_right(bases, address) - 1
+            if index < 0:
+                return Address(address)
+            return Address(mapping[bases[index]] + address - bases[index])
+        
+        def relocateOperand(operand):
+            if isinstance(operand, Address):
+                return relocateAddress(operand.value)
+            if isinstance(operand, Memory) and isinstance(operand.value, Address):
+                return Memory(relocateAddress(operand.value.value))
+            return operand
+        
+        relocated = []
+        for item in self.instructions:
+            if isinstance(item, Instruction):
+                item = Instruction(item.opcode, *[relocateOperand(operand) for operand in item.operands])
+            relocated.append(item)
+        return relocated
+
+def runStage(profiler, name, function, *args, **kwargs):
+    if profiler is None:
+        return function(*args, **kwargs)
+    return profiler.stage(name, function, *args, **kwargs)
+
+def splitModule(node):
+    fragments = []
+    for index, statement in enumerate(node.body):
+        namespace = statement.name if isinstance(statement, ast.FunctionDef) else "module%d" % (index,)
+        fragments.append((namespace, ast.Module(body = [statement])))
+    return fragments
+
+def getCalleeSignatures(node, signatures):
+    return dict((call.func.id, signatures[call.func.id]) for call in getCalls(node) if call.func.id in signatures)
+
+def prepareModule(str, inline = True, deadcode = True, profiler = None, hoist = True, unroll = False):
+    node = runStage(profiler, "parse", ast.parse, str)
+    reports = {}
+    if inline:
+        node, reports["inlined"] = runStage(profiler, "inline", inlineFunctions, node)
+    if hoist or unroll:
+        node, reports["loops"] = runStage(profiler, "loops", optimizeLoops, node, hoist, unroll)
+    if deadcode:
+        node, reports["deadcode"] = runStage(profiler, "deadcode", eliminateDeadCode, node)
+    return node, reports
+
+def measureEliminated(eliminated, registers = True, fold = True):
+    def measureStatements(statements):
+        if not statements:
+            return 0
+        fragment = compileFragment("deadcode", ast.Module(body = copy.deepcopy(statements)), registers, fold)
+        return measure(fragment.instructions)[0]
+    return sum(measureStatements(before) - measureStatements(after) for before, after in eliminated)
+
+def compileFragment(namespace, node, registers = True, fold = True, signatures = None, profiler = None, dispatch = True):
+    folded = 0
+    if fold:
+        node, folded = runStage(profiler, "transform", foldConstants, node)
+    program = Program(namespace)
+    visitor = DCPU16AssemblyProducer(program, registers, signatures, dispatch)
+    if profiler is not None:
+        profiler.instrument(visitor)
+    runStage(profiler, "codegen", visitor.visit, node)
+    return Fragment(namespace, visitor.instructions, program.variables, sorted(program.temporaries), folded)
+
+def link(fragments, share = True, stats = None):
+    start, end = VARIABLE_ADDRESS_RANGE
+    if share:
+        allocation = allocateSlots(fragments, start, end)
+        mappings = allocation.mappings
+        if stats is not None:
+            stats["memory"] = (allocation.words, allocation.unshared, allocation.functions)
+    else:
+        addresses = {}
+        for fragment in fragments:
+            for name, address in sorted(fragment.variables.iteritems(), key = lambda item: item[1]):
+                if name not in addresses:
+                    addresses[name] = start + len(addresses)
+        
+        # Each function keeps temporaries of its own, since a callee would
+        # otherwise overwrite those its caller holds across the call.
+        temporaryBase = start + len(addresses)
+        if temporaryBase + sum(len(fragment.temporaries) for fragment in fragments) - 1 > end:
+            raise Exception("Memory exhausted")
+        
+        mappings = []
+        for fragment in fragments:
+            mapping = dict((address, addresses[name]) for name, address in fragment.variables.iteritems())
+            for index, address in enumerate(fragment.temporaries):
+                mapping[address] = temporaryBase + index
+            temporaryBase += len(fragment.temporaries)
+            mappings.append(mapping)
+    
+    instructions = []
+    for fragment, mapping in zip(fragments, mappings):
+        instructions.extend(fragment.relocate(mapping))
+    return instructions
+
+WORKER_MODULES = None
+WORKER_SIGNATURES = None
+
+def startWorker(str, inline, deadcode, hoist, unroll):
+    global WORKER_MODULES, WORKER_SIGNATURES
+    node, reports = prepareModule(str, inline, deadcode, None, hoist, unroll)
+    WORKER_MODULES = splitModule(node)
+    WORKER_SIGNATURES = getSignatures(node)
+
+def compileFragmentTask(task):
+    index, registers, fold, dispatch = task
+    namespace, module = WORKER_MODULES[index]
+    return compileFragment(namespace, module, registers, fold, getCalleeSignatures(module, WORKER_SIGNATURES), None, dispatch)
+
+def compileFragments(str, modules, indexes, registers = True, fold = True, inline = True, deadcode = True, signatures = None, workers = 1, profiler = None, hoist = True, unroll = False, dispatch = True):
+    if workers <= 1 or len(indexes) <= 1:
+        return [compileFragment(modules[index][0], modules[index][1], registers, fold, getCalleeSignatures(modules[index][1], signatures or {}), profiler, dispatch) for index in indexes]
+    
+    # Workers parse the source themselves; shipping the trees costs more
+    # than parsing them again.
+    pool = multiprocessing.Pool(min(workers, len(indexes)), startWorker, (str, inline, deadcode, hoist, unroll))
+    try:
+        return runStage(profiler, "codegen", pool.map, compileFragmentTask, [(index, registers, fold, dispatch) for index in indexes])
+    finally:
+        pool.close()
+        pool.join()
+
+def optimizeFragments(manager, fragments):
+    return [Fragment(fragment.namespace, manager.optimize(fragment.namespace, fragment.instructions), fragment.variables, fragment.temporaries, fragment.folded) for fragment in fragments]
+
+def generate(str, registers = True, fold = True, peephole = True, stats = None, profiler = None, cache = None, workers = 1, share = True, inline = True, deadcode = True, passes = DEFAULT_PASSES, hoist = True, unroll = False, dispatch = True):
+    node, reports = prepareModule(str, inline, deadcode, profiler, hoist, unroll)
+    if stats is not None and "inlined" in reports:
+        stats["inlined"] = reports["inlined"]
+    if stats is not None and "loops" in reports:
+        stats["loops"] = reports["loops"]
+    modules = splitModule(node)
+    signatures = getSignatures(node)
+    fragments = []
+    keys = {}
+    for index, (namespace, module) in enumerate(modules):
+        fragment = None
+        if cache is not None:
+            keys[index] = cache.key(namespace, module, (registers, fold, dispatch, sorted(getCalleeSignatures(module, signatures).items())))
+            fragment = cache.get(keys[index])
+        fragments.append(fragment)
+    dirty = [index for index, fragment in enumerate(fragments) if fragment is None]
+    for index, fragment in zip(dirty, compileFragments(str, modules, dirty, registers, fold, inline, deadcode, signatures, workers, profiler, hoist, unroll, dispatch)):
+        fragments[index] = fragment
+        if cache is not None:
+            cache.put(keys[index], fragment)
+    if fold and stats is not None:
+        stats["folded"] = sum(fragment.folded for fragment in fragments)
+    if stats is not None and "deadcode" in reports:
+        eliminated, removed = reports["deadcode"]
+        stats["deadcode"] = (measureEliminated(eliminated, registers, fold), removed)
+    manager = PassManager(passes)
+    fragments = runStage(profiler, "passes", optimizeFragments, manager, fragments)
+    instructions = runStage(profiler, "link", link, fragments, share, stats)
+    if peephole:
+        peepholeStats = {}
+        before = measure(instructions)
+        instructions = runStage(profiler, "peephole", manager.runInstructionPass, "peephole", optimize, instructions, stats = peepholeStats)
+        if stats is not None:
+            stats["peephole"] = peepholeStats
+            stats["measure"] = (before, measure(instructions))
+    if stats is not None:
+        stats["passes"] = manager
+    return instructions
+
+def parse(str, out = None, registers = True, fold = True, peephole = True):
+    render(generate(str, registers, fold, peephole), out)
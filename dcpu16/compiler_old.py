@@ -1,6 +1,10 @@
-import ply.lex as lex
-import ply.yacc as yacc
+import copy
+import os
 import sys
+import threading
+
+TABLE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+PARSE_TABLE_MODULE = "dcpu16.compiler_old_parsetab"
 
 # Lexer
 reserved = {
@@ -442,7 +446,34 @@ def p_end_context(t):
 def p_error(t):
     raise Exception("Error parsing: %s" % (str(t),))
 
-lexer = lex.lex()
-lexer.program = Program()
-lexer.context = lexer.program
-parser = yacc.yacc()
+# The lexer and parse tables are built on first use and shared; PLY is not
+# even imported before then. The parse tables come from the pre-generated
+# module next to this one and are rebuilt in memory when its version or
+# grammar signature no longer matches.
+TABLES = None
+TABLES_LOCK = threading.Lock()
+
+def loadTables(writeTables = False):
+    global TABLES
+    with TABLES_LOCK:
+        if TABLES is None or writeTables:
+            import ply.lex as lex
+            import ply.yacc as yacc
+            module = sys.modules[__name__]
+            lexer = lex.lex(module = module)
+            parser = yacc.yacc(module = module, tabmodule = PARSE_TABLE_MODULE, outputdir = TABLE_DIRECTORY, write_tables = writeTables, debug = False)
+            TABLES = (lexer, parser)
+        return TABLES
+
+def writeTables():
+    loadTables(True)
+
+class Compiler:
+    def compile(self, source):
+        # Every compile gets its own lexer, parser stacks, program and
+        # context, so one compiler serves any number of threads at once.
+        sharedLexer, sharedParser = loadTables()
+        lexer = sharedLexer.clone()
+        lexer.program = Program()
+        lexer.context = lexer.program
+        return copy.copy(sharedParser).parse(source, lexer = lexer)
@@ -0,0 +1,74 @@
+
+# compiler_old_parsetab.py
+# This file is automatically generated. Do not edit.
+# pylint: disable=W,C,R
+_tabversion = '3.10'
+
+_lr_method = 'LALR'
+
+_lr_signature = "right=leftORleftANDleftCOMPARISONleftMODleftPLUSMINUSleftTIMESDIVIDEAND COMPARISON DIVIDE ELSE FOR FUNCTION IF MINUS MOD NAME NUMBER OR PLUS RETURN SCREEN TIMES WHILEprogram : lineslines : \n             | lines line\n    line : construct\n            | control\n            | statement ';'\n            | expr ';'\n    construct : functionfunction : start_context FUNCTION NAME '(' ')' '{' lines return '}' end_contextreturn :\n              | RETURN variable ';'\n              | RETURN ';'\n    control : while_loop\n               | for_loop\n               | if_control\n    while_loop : start_context WHILE '(' clause ')' '{' lines '}' end_contextfor_loop : start_context FOR '(' statement ';' clause ';' statement ')' '{' lines '}' end_contextif_control : IF '(' clause ')' '{' start_context lines end_context '}'if_control : IF '(' clause ')' '{' start_context lines end_context '}' ELSE '{' start_context lines end_context '}'if_control : IF '(' clause ')' '{' start_context lines end_context '}' ELSE if_controlstatement : assignmentassignment : variable '=' exprassignment : SCREEN '[' operation ']' '=' operationexpr : function_call\n            | return\n            | clause\n            | operation\n    function_call : NAME '(' ')'clause : value COMPARISON valueclause : clause logic clauseoperation : '(' operation ')'\n                 | value\n    operation : operation TIMES operation\n                 | operation DIVIDE operation\n                 | operation PLUS operation\n                 | operation MINUS operation\n                 | operation MOD operation\n    logic : AND\n             | OR\n    value : variable\n             | NUMBER\n    variable : NAMEstart_context : end_context : "
+    
+_lr_action_items = {'RETURN':([0,2,3,11,12,14,15,17,21,43,45,48,77,78,80,82,83,85,86,89,91,93,94,95,96,98,99,100,101,102,103,104,106,],[-2,4,-5,-4,-15,-8,-14,-13,-3,-6,4,-7,-43,-2,-2,-2,4,4,4,-44,-44,-16,-18,-9,-2,4,-20,-43,-44,-2,-17,4,-19,]),'NUMBER':([0,2,3,9,11,12,14,15,17,21,29,30,31,32,33,34,35,36,43,44,45,46,48,49,61,74,76,77,78,80,82,83,85,86,89,91,93,94,95,96,98,99,100,101,102,103,104,106,],[-2,6,-5,6,-4,-15,-8,-14,-13,-3,-38,-39,6,6,6,6,6,6,-6,6,6,6,-7,6,6,6,6,-43,-2,-2,-2,6,6,6,-44,-44,-16,-18,-9,-2,6,-20,-43,-44,-2,-17,6,-19,]),'WHILE':([0,2,3,10,11,12,14,15,17,21,43,48,77,78,80,82,83,85,86,89,91,93,94,95,96,98,99,100,101,102,103,104,106,],[-2,-43,-5,42,-4,-15,-8,-14,-13,-3,-6,-7,-43,-2,-2,-2,-43,-43,-43,-44,-44,-16,-18,-9,-2,-43,-20,-43,-44,-2,-17,-43,-19,]),'MINUS':([6,8,20,23,25,28,37,38,39,53,54,55,56,57,58,62,81,],[-41,35,-40,-42,-32,-42,-32,-40,35,-34,-33,-35,-36,35,-31,35,35,]),'COMPARISON':([6,20,23,25,28,38,52,],[-41,-40,-42,49,-42,-40,49,]),')':([5,6,7,8,16,18,23,25,27,28,37,38,39,45,47,50,51,53,54,55,56,57,58,63,64,65,66,67,70,81,88,],[-26,-41,-24,-27,-25,-21,-42,-32,-12,-42,-32,-40,58,-10,65,-11,-30,-34,-33,-35,-36,-37,-31,-22,72,-28,-29,73,75,-23,92,]),'(':([0,2,3,9,11,12,14,15,17,21,22,23,32,33,34,35,36,41,42,43,44,45,48,59,76,77,78,80,82,83,85,86,89,91,93,94,95,96,98,99,100,101,102,103,104,106,],[-2,9,-5,9,-4,-15,-8,-14,-13,-3,46,47,9,9,9,9,9,60,61,-6,9,9,-7,67,9,-43,-2,-2,-2,9,9,9,-44,-44,-16,-18,-9,-2,9,-20,-43,-44,-2,-17,9,-19,]),'PLUS':([6,8,20,23,25,28,37,38,39,53,54,55,56,57,58,62,81,],[-41,34,-40,-42,-32,-42,-32,-40,34,-34,-33,-35,-36,34,-31,34,34,]),';':([0,2,3,4,5,6,7,8,11,12,13,14,15,16,17,18,20,21,23,24,25,26,27,28,37,38,43,45,48,50,51,53,54,55,56,57,58,63,65,66,68,77,78,79,80,81,82,83,85,86,87,89,91,93,94,95,96,98,99,100,101,102,103,104,106,],[-2,-10,-5,27,-26,-41,-24,-27,-4,-15,43,-8,-14,-25,-13,-21,-40,-3,-42,48,-32,50,-12,-42,-32,-40,-6,-10,-7,-11,-30,-34,-33,-35,-36,-37,-31,-22,-28,-29,74,-43,-2,84,-2,-23,-2,-10,-10,-10,-25,-44,-44,-16,-18,-9,-2,-10,-20,-43,-44,-2,-17,-10,-19,]),'=':([20,23,28,69,71,],[45,-42,-42,45,76,]),'$end':([0,1,2,3,11,12,14,15,17,21,43,48,89,91,93,94,95,99,101,103,106,],[-2,0,-1,-5,-4,-15,-8,-14,-13,-3,-6,-7,-44,-44,-16,-18,-9,-20,-44,-17,-19,]),'FUNCTION':([0,2,3,10,11,12,14,15,17,21,43,48,77,78,80,82,83,85,86,89,91,93,94,95,96,98,99,100,101,102,103,104,106,],[-2,-43,-5,40,-4,-15,-8,-14,-13,-3,-6,-7,-43,-2,-2,-2,-43,-43,-43,-44,-44,-16,-18,-9,-2,-43,-20,-43,-44,-2,-17,-43,-19,]),'DIVIDE':([6,8,20,23,25,28,37,38,39,53,54,55,56,57,58,62,81,],[-41,32,-40,-42,-32,-42,-32,-40,32,-34,-33,32,32,32,-31,32,32,]),'FOR':([0,2,3,10,11,12,14,15,17,21,43,48,77,78,80,82,83,85,86,89,91,93,94,95,96,98,99,100,101,102,103,104,106,],[-2,-43,-5,41,-4,-15,-8,-14,-13,-3,-6,-7,-43,-2,-2,-2,-43,-43,-43,-44,-44,-16,-18,-9,-2,-43,-20,-43,-44,-2,-17,-43,-19,]),'SCREEN':([0,2,3,11,12,14,15,17,21,43,48,60,77,78,80,82,83,84,85,86,89,91,93,94,95,96,98,99,100,101,102,103,104,106,],[-2,19,-5,-4,-15,-8,-14,-13,-3,-6,-7,19,-43,-2,-2,-2,19,19,19,19,-44,-44,-16,-18,-9,-2,19,-20,-43,-44,-2,-17,19,-19,]),'TIMES':([6,8,20,23,25,28,37,38,39,53,54,55,56,57,58,62,81,],[-41,33,-40,-42,-32,-42,-32,-40,33,-34,-33,33,33,33,-31,33,33,]),'[':([19,],[44,]),'ELSE':([94,],[97,]),']':([6,28,37,38,53,54,55,56,57,58,62,],[-41,-42,-32,-40,-34,-33,-35,-36,-37,-31,71,]),'IF':([0,2,3,11,12,14,15,17,21,43,48,77,78,80,82,83,85,86,89,91,93,94,95,96,97,98,99,100,101,102,103,104,106,],[-2,22,-5,-4,-15,-8,-14,-13,-3,-6,-7,-43,-2,-2,-2,22,22,22,-44,-44,-16,-18,-9,-2,22,22,-20,-43,-44,-2,-17,22,-19,]),'AND':([5,6,28,38,51,64,66,70,79,],[29,-41,-42,-40,29,29,-29,29,29,]),'NAME':([0,2,3,4,9,11,12,14,15,17,21,29,30,31,32,33,34,35,36,40,43,44,45,46,48,49,60,61,74,76,77,78,80,82,83,84,85,86,89,91,93,94,95,96,98,99,100,101,102,103,104,106,],[-2,23,-5,28,28,-4,-15,-8,-14,-13,-3,-38,-39,28,28,28,28,28,28,59,-6,28,23,28,-7,28,28,28,28,28,-43,-2,-2,-2,23,28,23,23,-44,-44,-16,-18,-9,-2,23,-20,-43,-44,-2,-17,23,-19,]),'{':([72,73,75,92,97,],[77,78,80,96,100,]),'}':([3,11,12,14,15,17,21,27,43,48,50,77,78,80,82,83,85,86,87,89,90,91,93,94,95,96,98,99,100,101,102,103,104,105,106,],[-5,-4,-15,-8,-14,-13,-3,-12,-6,-7,-11,-43,-2,-2,-2,-10,89,-44,91,-44,94,-44,-16,-18,-9,-2,101,-20,-43,-44,-2,-17,-44,106,-19,]),'OR':([5,6,28,38,51,64,66,70,79,],[30,-41,-42,-40,30,30,-29,30,30,]),'MOD':([6,8,20,23,25,28,37,38,39,53,54,55,56,57,58,62,81,],[-41,36,-40,-42,-32,-42,-32,-40,36,-34,-33,-35,-36,-37,-31,36,36,]),}
+
+_lr_action = {}
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = {}
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {'control':([2,83,85,86,98,104,],[3,3,3,3,3,3,]),'function':([2,83,85,86,98,104,],[14,14,14,14,14,14,]),'for_loop':([2,83,85,86,98,104,],[15,15,15,15,15,15,]),'operation':([2,9,32,33,34,35,36,44,45,76,83,85,86,98,104,],[8,39,53,54,55,56,57,62,8,81,8,8,8,8,8,]),'return':([2,45,83,85,86,98,104,],[16,16,87,16,16,16,16,]),'while_loop':([2,83,85,86,98,104,],[17,17,17,17,17,17,]),'end_context':([86,89,91,101,104,],[90,93,95,103,105,]),'expr':([2,45,83,85,86,98,104,],[24,63,24,24,24,24,24,]),'logic':([5,51,64,70,79,],[31,31,31,31,31,]),'lines':([0,78,80,82,96,102,],[2,83,85,86,98,104,]),'start_context':([2,77,83,85,86,98,100,104,],[10,82,10,10,10,10,102,10,]),'construct':([2,83,85,86,98,104,],[11,11,11,11,11,11,]),'program':([0,],[1,]),'if_control':([2,83,85,86,97,98,104,],[12,12,12,12,99,12,12,]),'statement':([2,60,83,84,85,86,98,104,],[13,68,13,88,13,13,13,13,]),'clause':([2,31,45,46,61,74,83,85,86,98,104,],[5,51,5,64,70,79,5,5,5,5,5,]),'variable':([2,4,9,31,32,33,34,35,36,44,45,46,49,60,61,74,76,83,84,85,86,98,104,],[20,26,38,38,38,38,38,38,38,38,38,38,38,69,38,38,38,20,69,20,20,20,20,]),'assignment':([2,60,83,84,85,86,98,104,],[18,18,18,18,18,18,18,18,]),'value':([2,9,31,32,33,34,35,36,44,45,46,49,61,74,76,83,85,86,98,104,],[25,37,52,37,37,37,37,37,37,25,52,66,52,52,37,25,25,25,25,25,]),'line':([2,83,85,86,98,104,],[21,21,21,21,21,21,]),'function_call':([2,45,83,85,86,98,104,],[7,7,7,7,7,7,7,]),}
+
+_lr_goto = {}
+for _k, _v in _lr_goto_items.items():
+   for _x, _y in zip(_v[0], _v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = {}
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> program","S'",1,None,None,None),
+  ('program -> lines','program',1,'p_program','compiler_old.py',168),
+  ('lines -> <empty>','lines',0,'p_lines','compiler_old.py',172),
+  ('lines -> lines line','lines',2,'p_lines','compiler_old.py',173),
+  ('line -> construct','line',1,'p_line','compiler_old.py',181),
+  ('line -> control','line',1,'p_line','compiler_old.py',182),
+  ('line -> statement ;','line',2,'p_line','compiler_old.py',183),
+  ('line -> expr ;','line',2,'p_line','compiler_old.py',184),
+  ('construct -> function','construct',1,'p_construct','compiler_old.py',189),
+  ('function -> start_context FUNCTION NAME ( ) { lines return } end_context','function',10,'p_function','compiler_old.py',193),
+  ('return -> <empty>','return',0,'p_return','compiler_old.py',208),
+  ('return -> RETURN variable ;','return',3,'p_return','compiler_old.py',209),
+  ('return -> RETURN ;','return',2,'p_return','compiler_old.py',210),
+  ('control -> while_loop','control',1,'p_control','compiler_old.py',224),
+  ('control -> for_loop','control',1,'p_control','compiler_old.py',225),
+  ('control -> if_control','control',1,'p_control','compiler_old.py',226),
+  ('while_loop -> start_context WHILE ( clause ) { lines } end_context','while_loop',9,'p_while_loop','compiler_old.py',231),
+  ('for_loop -> start_context FOR ( statement ; clause ; statement ) { lines } end_context','for_loop',13,'p_for_loop','compiler_old.py',243),
+  ('if_control -> IF ( clause ) { start_context lines end_context }','if_control',9,'p_if_control_plain','compiler_old.py',258),
+  ('if_control -> IF ( clause ) { start_context lines end_context } ELSE { start_context lines end_context }','if_control',15,'p_if_control_with_else','compiler_old.py',269),
+  ('if_control -> IF ( clause ) { start_context lines end_context } ELSE if_control','if_control',11,'p_if_control_with_else_if','compiler_old.py',282),
+  ('statement -> assignment','statement',1,'p_statement','compiler_old.py',297),
+  ('assignment -> variable = expr','assignment',3,'p_assignment_regular','compiler_old.py',301),
+  ('assignment -> SCREEN [ operation ] = operation','assignment',6,'p_assignment_screen','compiler_old.py',308),
+  ('expr -> function_call','expr',1,'p_expr','compiler_old.py',318),
+  ('expr -> return','expr',1,'p_expr','compiler_old.py',319),
+  ('expr -> clause','expr',1,'p_expr','compiler_old.py',320),
+  ('expr -> operation','expr',1,'p_expr','compiler_old.py',321),
+  ('function_call -> NAME ( )','function_call',3,'p_function_call','compiler_old.py',326),
+  ('clause -> value COMPARISON value','clause',3,'p_clause_comparison','compiler_old.py',333),
+  ('clause -> clause logic clause','clause',3,'p_clause_logic','compiler_old.py',360),
+  ('operation -> ( operation )','operation',3,'p_operation_simplify','compiler_old.py',377),
+  ('operation -> value','operation',1,'p_operation_simplify','compiler_old.py',378),
+  ('operation -> operation TIMES operation','operation',3,'p_operation_execute','compiler_old.py',386),
+  ('operation -> operation DIVIDE operation','operation',3,'p_operation_execute','compiler_old.py',387),
+  ('operation -> operation PLUS operation','operation',3,'p_operation_execute','compiler_old.py',388),
+  ('operation -> operation MINUS operation','operation',3,'p_operation_execute','compiler_old.py',389),
+  ('operation -> operation MOD operation','operation',3,'p_operation_execute','compiler_old.py',390),
+  ('logic -> AND','logic',1,'p_logic','compiler_old.py',412),
+  ('logic -> OR','logic',1,'p_logic','compiler_old.py',413),
+  ('value -> variable','value',1,'p_value','compiler_old.py',418),
+  ('value -> NUMBER','value',1,'p_value','compiler_old.py',419),
+  ('variable -> NAME','variable',1,'p_variable','compiler_old.py',424),
+  ('start_context -> <empty>','start_context',0,'p_start_context','compiler_old.py',429),
+  ('end_context -> <empty>','end_context',0,'p_end_context','compiler_old.py',436),
+]
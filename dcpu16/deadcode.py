@@ -0,0 +1,136 @@
+import ast
+from dcpu16.transforms import isPure
+from dcpu16.inliner import getCalls, getReadNames
+
+ENTRY_FUNCTION = "start"
+EXIT_FUNCTION = "end"
+
+def isCallTo(statement, names):
+    return isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call) and isinstance(statement.value.func, ast.Name) and statement.value.func.id in names
+
+def isEmpty(statements):
+    return all(isinstance(statement, ast.Pass) for statement in statements)
+
+class DeadCodeEliminator:
+    def __init__(self):
+        self.noReturn = set(["exit"])
+        self.removedFunctions = []
+        self.eliminated = []
+
+    def exits(self, statements):
+        for statement in statements:
+            if isCallTo(statement, self.noReturn):
+                return True
+            if isinstance(statement, ast.If) and statement.orelse and self.exits(statement.body) and self.exits(statement.orelse):
+                return True
+        return False
+
+    def isTerminator(self, statement):
+        if isinstance(statement, (ast.Return, ast.Break, ast.Continue)) or isCallTo(statement, self.noReturn):
+            return True
+        if isinstance(statement, ast.While) and isinstance(statement.test, ast.Num) and statement.test.n and not any(isinstance(child, ast.Break) for child in ast.walk(statement)):
+            return True
+        return isinstance(statement, ast.If) and bool(statement.orelse) and self.terminates(statement.body) and self.terminates(statement.orelse)
+
+    def terminates(self, statements):
+        return any(self.isTerminator(statement) for statement in statements)
+
+    def findNoReturn(self, functions):
+        # A function that ends in exit() on every path, directly or through
+        # another such function, never comes back to its caller.
+        changed = True
+        while changed:
+            changed = False
+            for name, node in functions.iteritems():
+                if name in self.noReturn or any(isinstance(child, ast.Return) for child in ast.walk(node)):
+                    continue
+                if self.exits(node.body):
+                    self.noReturn.add(name)
+                    changed = True
+
+    def findReachable(self, tree):
+        indexes = dict((node.name, index) for index, node in enumerate(tree.body) if isinstance(node, ast.FunctionDef))
+        pending = [index for index, node in enumerate(tree.body) if not isinstance(node, ast.FunctionDef) or node.name == ENTRY_FUNCTION]
+        reachable = set()
+        while pending:
+            index = pending.pop()
+            if index in reachable:
+                continue
+            reachable.add(index)
+            node = tree.body[index]
+            callees = set(call.func.id for call in getCalls(node))
+            if "exit" in callees:
+                callees.add(EXIT_FUNCTION)
+            pending.extend(indexes[name] for name in callees if name in indexes)
+            # Code generation adds no return of its own, so a body that
+            # runs off its end falls into the statement after it.
+            body = node.body if isinstance(node, ast.FunctionDef) else [node]
+            if index + 1 < len(tree.body) and not self.terminates(body):
+                pending.append(index + 1)
+        return reachable
+
+    def removeFunctions(self, tree):
+        if not any(isinstance(node, ast.FunctionDef) and node.name == ENTRY_FUNCTION for node in tree.body):
+            return
+        reachable = self.findReachable(tree)
+        body = []
+        for index, node in enumerate(tree.body):
+            if index in reachable:
+                body.append(node)
+            else:
+                self.removedFunctions.append(node.name)
+                self.eliminated.append(([node], []))
+        tree.body = body
+
+    def truncate(self, statements):
+        for index, statement in enumerate(statements):
+            if self.isTerminator(statement) and index + 1 < len(statements):
+                self.eliminated.append((statements[index + 1:], []))
+                del statements[index + 1:]
+                break
+        for statement in statements:
+            for field in ("body", "orelse"):
+                if isinstance(getattr(statement, field, None), list):
+                    self.truncate(getattr(statement, field))
+
+    def removeDeadStores(self, tree):
+        changed = True
+        while changed:
+            reads = getReadNames(tree)
+            changed = self.removeStores(tree.body, reads)
+
+    def removeStores(self, statements, reads):
+        changed = False
+        for index in xrange(len(statements) - 1, -1, -1):
+            statement = statements[index]
+            if isinstance(statement, ast.Assign) and all(isinstance(target, ast.Name) and target.id not in reads for target in statement.targets):
+                replacement = [] if isPure(statement.value) else [ast.copy_location(ast.Expr(value = statement.value), statement)]
+                self.eliminated.append(([statement], replacement))
+                statements[index:index + 1] = replacement
+                changed = True
+                continue
+            for field in ("body", "orelse"):
+                children = getattr(statement, field, None)
+                if isinstance(children, list) and children:
+                    changed |= self.removeStores(children, reads)
+                    if field == "body" and not children:
+                        children.append(ast.copy_location(ast.Pass(), statement))
+            if isinstance(statement, ast.If) and isEmpty(statement.body) and isEmpty(statement.orelse) and isPure(statement.test):
+                self.eliminated.append(([statement], []))
+                del statements[index]
+                changed = True
+        return changed
+
+    def run(self, tree):
+        functions = dict((node.name, node) for node in tree.body if isinstance(node, ast.FunctionDef))
+        self.findNoReturn(functions)
+        for node in functions.itervalues():
+            self.truncate(node.body)
+        self.removeFunctions(tree)
+        self.removeDeadStores(tree)
+        return tree
+
+def eliminateDeadCode(tree):
+    eliminator = DeadCodeEliminator()
+    tree = ast.fix_missing_locations(eliminator.run(tree))
+    return tree, (eliminator.eliminated, eliminator.removedFunctions)
@@ -0,0 +1,109 @@
+import ast
+from dcpu16.transforms import wrap
+from dcpu16.instructions import Instruction, Literal, Address, LabelRef, Memory, IndexedMemory, A, PC, VARIABLE_ADDRESS_RANGE
+
+CHAIN = "chain"
+TABLE = "table"
+SEARCH = "search"
+
+MIN_DISPATCH_CASES = 3
+SEARCH_LEAF_CASES = 2
+
+# A table has a word for every value between the lowest and the highest
+# case, so it is only built when at least this share of them are cases.
+MIN_TABLE_DENSITY = 0.5
+
+VARIABLE = Memory(Address(VARIABLE_ADDRESS_RANGE[0]))
+JUMP = Instruction("set", PC, LabelRef("case"))
+SKIP_CYCLES = 1
+
+def getTestedValue(test):
+    # Returns the name and constant of "name == constant", in either order.
+    if not isinstance(test, ast.Compare) or len(test.ops) != 1 or not isinstance(test.ops[0], ast.Eq):
+        return None
+    left, right = test.left, test.comparators[0]
+    if isinstance(left, ast.Num):
+        left, right = right, left
+    if not isinstance(left, ast.Name) or not isinstance(right, ast.Num) or not isinstance(right.n, (int, long)):
+        return None
+    return left.id, wrap(right.n)
+
+def getDispatchCases(node):
+    # Follows "if name == a ... elif name == b ..." for as long as every
+    # test compares the same name with a constant. Returns the name, the
+    # values with their bodies in order and what runs when none matches,
+    # or None when the ladder is too short to be worth dispatching.
+    tested = getTestedValue(node.test)
+    if tested is None:
+        return None
+    name = tested[0]
+    cases = []
+    seen = set()
+    orelse = [node]
+    while len(orelse) == 1 and isinstance(orelse[0], ast.If):
+        tested = getTestedValue(orelse[0].test)
+        if tested is None or tested[0] != name:
+            break
+        value = tested[1]
+        # Only the first test of a value can ever hold.
+        if value not in seen:
+            seen.add(value)
+            cases.append((value, orelse[0].body))
+        orelse = orelse[0].orelse
+    if len(cases) < MIN_DISPATCH_CASES:
+        return None
+    return name, cases, orelse
+
+def getChainCycles(values):
+    # Testing the variable against every value in turn, as the plain
+    # lowering of the ladder does.
+    cycles = []
+    spent = 0
+    for value in values:
+        test = Instruction("ifn", VARIABLE, Literal(value)).cycles()
+        cycles.append(spent + test + SKIP_CYCLES)
+        spent += test + JUMP.cycles()
+    return cycles
+
+def getSearchCycles(values):
+    # Halving the sorted values on "ifg a, pivot" down to a couple of
+    # equality tests, after loading the variable into a.
+    def search(values):
+        if len(values) <= SEARCH_LEAF_CASES:
+            cycles = []
+            spent = 0
+            for value in values:
+                test = Instruction("ife", A, Literal(value)).cycles()
+                cycles.append(spent + test + JUMP.cycles())
+                spent += test + SKIP_CYCLES
+            return cycles
+        middle = len(values) // 2
+        split = Instruction("ifg", A, Literal(values[middle - 1])).cycles()
+        return [cycles + split + SKIP_CYCLES for cycles in search(values[:middle])] + [cycles + split + JUMP.cycles() for cycles in search(values[middle:])]
+    load = Instruction("set", A, VARIABLE).cycles()
+    return [load + cycles for cycles in search(sorted(values))]
+
+def getTableCycles(values):
+    # Loading the variable, moving the lowest value to zero, one bounds
+    # test and a jump through the table.
+    low, high = min(values), max(values)
+    instructions = [Instruction("set", A, VARIABLE), Instruction("ifg", A, Literal(high - low)), Instruction("set", PC, IndexedMemory(A, LabelRef("table")))]
+    if low:
+        instructions.append(Instruction("sub", A, Literal(low)))
+    cycles = sum(instruction.cycles() for instruction in instructions) + SKIP_CYCLES
+    return [cycles] * len(values)
+
+def isDense(values):
+    return len(values) >= MIN_TABLE_DENSITY * (max(values) - min(values) + 1)
+
+def chooseDispatch(values):
+    # Picks the lowering that reaches the cases in the fewest cycles on
+    # average; the plain chain wins ties, as it needs no extra words.
+    candidates = [(CHAIN, getChainCycles(values)), (SEARCH, getSearchCycles(values))]
+    if isDense(values):
+        candidates.insert(1, (TABLE, getTableCycles(values)))
+    best, bestCycles = None, None
+    for strategy, cycles in candidates:
+        if bestCycles is None or sum(cycles) < bestCycles:
+            best, bestCycles = strategy, sum(cycles)
+    return best
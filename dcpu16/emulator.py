@@ -0,0 +1,347 @@
+import itertools
+import types
+from array import array
+from dcpu16.instructions import OPCODE_CYCLES, BASIC_OPCODES, SPECIAL_OPCODES
+
+MEMORY_SIZE = 0x10000
+
+PC_INDEX = 8
+SP_INDEX = 9
+EX_INDEX = 10
+IA_INDEX = 11
+
+BASIC_NAMES = dict((code, name) for name, code in BASIC_OPCODES.items())
+SPECIAL_NAMES = dict((code, name) for name, code in SPECIAL_OPCODES.items())
+
+NEXT_WORD_CODES = frozenset(range(0x10, 0x18) + [0x1a, 0x1e, 0x1f])
+NEXT_WORD = [1 if code in NEXT_WORD_CODES else 0 for code in range(0x40)]
+
+REGISTER_NAMES = ["a", "b", "c", "x", "y", "z", "i", "j", "pc", "sp", "ex", "ia"]
+
+TRANSLATIONS = {}
+
+def signed(value):
+    return value - 0x10000 if value & 0x8000 else value
+
+def truncatedDivide(left, right):
+    quotient = abs(left) // abs(right)
+    return -quotient if (left < 0) != (right < 0) else quotient
+
+def instructionLength(word):
+    length = 1 + NEXT_WORD[word >> 10]
+    if word & 0x1f:
+        length += NEXT_WORD[(word >> 5) & 0x1f]
+    return length
+
+class Operand:
+    def __init__(self, code, isA, nextWord, name):
+        self.setup = []
+        self.address = None
+        self.value = None
+        self.target = None
+        self.isPC = False
+
+        if code < 0x08:
+            self.value = self.target = "r[%d]" % (code,)
+        elif code < 0x10:
+            self.address = "r[%d]" % (code - 0x08,)
+        elif code < 0x18:
+            self.address = "(r[%d] + %d) & 0xffff" % (code - 0x10, nextWord)
+        elif code == 0x18:
+            if isA:
+                self.setup = ["%s = r[9]" % (name,), "r[9] = (%s + 1) & 0xffff" % (name,)]
+            else:
+                self.setup = ["%s = r[9] = (r[9] - 1) & 0xffff" % (name,)]
+            self.address = name
+        elif code == 0x19:
+            self.address = "r[9]"
+        elif code == 0x1a:
+            self.address = "(r[9] + %d) & 0xffff" % (nextWord,)
+        elif code == 0x1b:
+            self.value = self.target = "r[9]"
+        elif code == 0x1c:
+            self.isPC = True
+            self.target = "npc"
+        elif code == 0x1d:
+            self.value = self.target = "r[10]"
+        elif code == 0x1e:
+            self.address = "%d" % (nextWord,)
+        elif code == 0x1f:
+            self.value = "%d" % (nextWord,)
+        else:
+            self.value = "%d" % ((code - 0x21) & 0xffff,)
+
+        self.isMemory = self.address is not None
+        if self.isMemory:
+            if not self.address.isdigit() and self.address != name:
+                self.setup.append("%s = %s" % (name, self.address))
+                self.address = name
+            self.value = "m[%s]" % (self.address,)
+
+    def read(self, pc):
+        return "%d" % (pc,) if self.isPC else self.value
+
+    def write(self, expression):
+        if self.isMemory:
+            return ["m[%s] = %s" % (self.address, expression), "if cw[%s]: inv(%s)" % (self.address, self.address)]
+        if self.target is None:
+            return []
+        return ["%s = %s" % (self.target, expression)]
+
+BASIC_TEMPLATES = {
+    "set" : (False, ["v = av"]),
+    "add" : (True, ["v = bv + av", "r[10] = v >> 16"]),
+    "sub" : (True, ["v = bv - av", "r[10] = 0xffff if v < 0 else 0"]),
+    "mul" : (True, ["v = bv * av", "r[10] = (v >> 16) & 0xffff"]),
+    "mli" : (True, ["v = signed(bv) * signed(av)", "r[10] = (v >> 16) & 0xffff"]),
+    "div" : (True, ["if av:", "    r[10] = ((bv << 16) // av) & 0xffff", "    v = bv // av", "else:", "    r[10] = v = 0"]),
+    "dvi" : (True, ["if av:", "    r[10] = truncatedDivide(signed(bv) << 16, signed(av)) & 0xffff", "    v = truncatedDivide(signed(bv), signed(av))", "else:", "    r[10] = v = 0"]),
+    "mod" : (True, ["v = bv % av if av else 0"]),
+    "mdi" : (True, ["v = signed(bv) - truncatedDivide(signed(bv), signed(av)) * signed(av) if av else 0"]),
+    "and" : (True, ["v = bv & av"]),
+    "bor" : (True, ["v = bv | av"]),
+    "xor" : (True, ["v = bv ^ av"]),
+    "shr" : (True, ["r[10] = ((bv << 16) >> av) & 0xffff", "v = bv >> av"]),
+    "asr" : (True, ["r[10] = ((bv << 16) >> av) & 0xffff", "v = signed(bv) >> av"]),
+    "shl" : (True, ["v = bv << av", "r[10] = (v >> 16) & 0xffff"]),
+    "adx" : (True, ["v = bv + av + r[10]", "r[10] = 1 if v > 0xffff else 0"]),
+    "sbx" : (True, ["v = bv - av + r[10]", "r[10] = 0xffff if v < 0 else (1 if v > 0xffff else 0)"]),
+    "sti" : (False, ["v = av", "r[6] = (r[6] + 1) & 0xffff", "r[7] = (r[7] + 1) & 0xffff"]),
+    "std" : (False, ["v = av", "r[6] = (r[6] - 1) & 0xffff", "r[7] = (r[7] - 1) & 0xffff"]),
+}
+
+CONDITION_TEMPLATES = {
+    "ifb" : "(bv & av) != 0",
+    "ifc" : "(bv & av) == 0",
+    "ife" : "bv == av",
+    "ifn" : "bv != av",
+    "ifg" : "bv > av",
+    "ifa" : "signed(bv) > signed(av)",
+    "ifl" : "bv < av",
+    "ifu" : "signed(bv) < signed(av)",
+}
+
+class DecodedInstruction:
+    def __init__(self, length, cycles, reads, writes):
+        self.length = length
+        self.cycles = cycles
+        self.reads = reads
+        self.writes = writes
+
+class Emulator:
+    def __init__(self, words = None, devices = ()):
+        self.memory = array("H", [0]) * MEMORY_SIZE
+        self.registers = [0] * 12
+        self.pc = 0
+        self.devices = list(devices)
+        self.halted = False
+
+        self.cycles = 0
+        self.instructionCount = 0
+        self.memoryReads = 0
+        self.memoryWrites = 0
+        self.fetchedWords = 0
+
+        self.code = [None] * MEMORY_SIZE
+        self.hits = [0] * MEMORY_SIZE
+        self.decoded = {}
+        self.codeWords = [0] * MEMORY_SIZE
+        self.namespace = {
+            "r" : self.registers,
+            "m" : self.memory,
+            "cw" : self.codeWords,
+            "inv" : self.invalidate,
+            "skip" : self.skip,
+            "signed" : signed,
+            "truncatedDivide" : truncatedDivide,
+            "hardware" : self.hardware,
+        }
+
+        if words is not None:
+            self.load(words)
+
+    def load(self, words, address = 0):
+        self.flush()
+        for decodedAddress in list(self.decoded):
+            self.forget(decodedAddress)
+        self.memory[address:address + len(words)] = array("H", words)
+
+    def getRegister(self, name):
+        index = REGISTER_NAMES.index(name.lower())
+        return self.pc if index == PC_INDEX else self.registers[index]
+
+    def decode(self, pc):
+        memory = self.memory
+        word = memory[pc]
+        opcode = word & 0x1f
+        bCode = (word >> 5) & 0x1f
+        aCode = word >> 10
+
+        nextAddress = (pc + 1) & 0xffff
+        aWord = 0
+        if NEXT_WORD[aCode]:
+            aWord = memory[nextAddress]
+            nextAddress = (nextAddress + 1) & 0xffff
+        bWord = 0
+        if opcode and NEXT_WORD[bCode]:
+            bWord = memory[nextAddress]
+            nextAddress = (nextAddress + 1) & 0xffff
+        length = instructionLength(word)
+
+        a = Operand(aCode, True, aWord, "xa")
+        lines = list(a.setup)
+        reads = 1 if a.isMemory else 0
+        writes = 0
+        if opcode:
+            if opcode not in BASIC_NAMES:
+                raise Exception("Illegal instruction 0x%04x at 0x%04x" % (word, pc))
+            name = BASIC_NAMES[opcode]
+            b = Operand(bCode, False, bWord, "xb")
+            lines.append("av = %s" % (a.read(nextAddress),))
+            lines.extend(b.setup)
+            if name in CONDITION_TEMPLATES:
+                reads += 1 if b.isMemory else 0
+                lines.append("bv = %s" % (b.read(nextAddress),))
+                lines.append("if not (%s):" % (CONDITION_TEMPLATES[name],))
+                lines.append("    return skip(%d)" % (nextAddress,))
+            else:
+                readsB, body = BASIC_TEMPLATES[name]
+                if readsB:
+                    reads += 1 if b.isMemory else 0
+                    lines.append("bv = %s" % (b.read(nextAddress),))
+                lines.extend(body)
+                lines.extend(b.write("v & 0xffff"))
+                writes += 1 if b.isMemory else 0
+            result = "npc" if b.isPC and name not in CONDITION_TEMPLATES else "%d" % (nextAddress,)
+        else:
+            if bCode not in SPECIAL_NAMES:
+                raise Exception("Illegal instruction 0x%04x at 0x%04x" % (word, pc))
+            name = SPECIAL_NAMES[bCode]
+            result = "%d" % (nextAddress,)
+            if name in ("iag", "hwn"):
+                reads = 0
+                lines.extend(a.write("r[11]" if name == "iag" else "hardware(%d)" % (bCode,)))
+                writes += 1 if a.isMemory else 0
+                if a.isPC:
+                    result = "npc"
+            else:
+                lines.append("av = %s" % (a.read(nextAddress),))
+                if name == "jsr":
+                    lines.extend(["s = r[9] = (r[9] - 1) & 0xffff", "m[s] = %d" % (nextAddress,), "if cw[s]: inv(s)"])
+                    writes += 1
+                    result = "av"
+                elif name == "int":
+                    lines.extend([
+                        "if r[11]:",
+                        "    s = r[9] = (r[9] - 2) & 0xffff",
+                        "    m[(s + 1) & 0xffff] = %d" % (nextAddress,),
+                        "    m[s] = r[0]",
+                        "    if cw[s] or cw[(s + 1) & 0xffff]: inv(s); inv((s + 1) & 0xffff)",
+                        "    r[0] = av",
+                        "    return r[11]",
+                    ])
+                elif name == "ias":
+                    lines.append("r[11] = av")
+                elif name == "rfi":
+                    lines.extend(["s = r[9]", "r[0] = m[s]", "npc = m[(s + 1) & 0xffff]", "r[9] = (s + 2) & 0xffff"])
+                    reads += 2
+                    result = "npc"
+                elif name in ("hwq", "hwi"):
+                    lines.append("hardware(%d, av)" % (bCode,))
+
+        lines.append("return %s" % (result,))
+        source = "def f():\n    " + "\n    ".join(lines) + "\n"
+
+        code = TRANSLATIONS.get(source)
+        if code is None:
+            namespace = {}
+            exec compile(source, "<dcpu16>", "exec") in namespace
+            code = TRANSLATIONS[source] = namespace["f"].func_code
+        function = types.FunctionType(code, self.namespace)
+
+        cycles = OPCODE_CYCLES[name] + length - 1
+        self.code[pc] = function
+        self.decoded[pc] = DecodedInstruction(length, cycles, reads, writes)
+        for offset in range(length):
+            self.codeWords[(pc + offset) & 0xffff] += 1
+        return function
+
+    def hardware(self, opcode, index = None):
+        if opcode == SPECIAL_OPCODES["hwn"]:
+            return len(self.devices)
+        if index is not None and index < len(self.devices):
+            device = self.devices[index]
+            if opcode == SPECIAL_OPCODES["hwq"]:
+                device.query(self)
+            else:
+                self.cycles += device.interrupt(self) or 0
+        elif opcode == SPECIAL_OPCODES["hwq"]:
+            for register in range(5):
+                self.registers[register] = 0
+
+    def skip(self, pc):
+        memory = self.memory
+        extra = 1
+        while True:
+            word = memory[pc]
+            pc = (pc + instructionLength(word)) & 0xffff
+            if not 0x10 <= word & 0x1f <= 0x17:
+                break
+            extra += 1
+        self.cycles += extra
+        return pc
+
+    def forget(self, address):
+        decoded = self.decoded.pop(address)
+        hits = self.hits[address]
+        if hits:
+            self.account(decoded, hits)
+            self.hits[address] = 0
+        self.code[address] = None
+        for offset in range(decoded.length):
+            self.codeWords[(address + offset) & 0xffff] -= 1
+
+    def invalidate(self, address):
+        for start in (address, (address - 1) & 0xffff, (address - 2) & 0xffff):
+            decoded = self.decoded.get(start)
+            if decoded is not None and (address - start) & 0xffff < decoded.length:
+                self.forget(start)
+
+    def account(self, decoded, hits):
+        self.instructionCount += hits
+        self.cycles += hits * decoded.cycles
+        self.memoryReads += hits * decoded.reads
+        self.memoryWrites += hits * decoded.writes
+        self.fetchedWords += hits * decoded.length
+
+    def flush(self):
+        hits = self.hits
+        for address, decoded in self.decoded.iteritems():
+            if hits[address]:
+                self.account(decoded, hits[address])
+                hits[address] = 0
+
+    def run(self, maxInstructions = None):
+        code = self.code
+        hits = self.hits
+        decode = self.decode
+        pc = self.pc
+        steps = xrange(maxInstructions) if maxInstructions is not None else itertools.repeat(None)
+        try:
+            for step in steps:
+                function = code[pc]
+                if function is None:
+                    function = decode(pc)
+                hits[pc] += 1
+                nextPC = function()
+                if nextPC == pc:
+                    self.halted = True
+                    break
+                pc = nextPC
+        finally:
+            self.pc = pc
+            self.flush()
+        return self.halted
+
+    def step(self):
+        return self.run(1)
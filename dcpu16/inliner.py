@@ -0,0 +1,294 @@
+import ast
+import copy
+from dcpu16.transforms import countNodes, isPure
+
+CALL_WORDS = 2
+RETURN_WORDS = 1
+DEFAULT_MAX_GROWTH = 16
+MAX_ROUNDS = 8
+KEEP_FUNCTIONS = frozenset(["start", "end"])
+BUILTIN_FUNCTIONS = frozenset(["exit", "range"])
+
+def getSignatures(tree):
+    return dict((node.name, tuple(arg.id for arg in node.args.args)) for node in tree.body if isinstance(node, ast.FunctionDef))
+
+def getCalls(node):
+    return [child for child in ast.walk(node) if isinstance(child, ast.Call) and isinstance(child.func, ast.Name)]
+
+def getAssignedNames(nodes):
+    return set(child.id for node in nodes for child in ast.walk(node) if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store))
+
+def isExitCall(statement):
+    return isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call) and isinstance(statement.value.func, ast.Name) and statement.value.func.id == "exit"
+
+def getReadNames(node):
+    return set(child.id for child in ast.walk(node) if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Load))
+
+def getReadNamesOutside(node, excluded):
+    # The names node reads anywhere but inside excluded.
+    if node is excluded:
+        return set()
+    if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+        return set([node.id])
+    return set(name for child in ast.iter_child_nodes(node) for name in getReadNamesOutside(child, excluded))
+
+def estimateWords(nodes):
+    return sum(countNodes(node) for node in nodes)
+
+class Substituter(ast.NodeTransformer):
+    def __init__(self, values):
+        ast.NodeTransformer.__init__(self)
+
+        self.values = values
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and node.id in self.values:
+            return ast.copy_location(copy.deepcopy(self.values[node.id]), node)
+        return node
+
+class FunctionInfo:
+    def __init__(self, node):
+        self.node = node
+        self.params = tuple(arg.id for arg in node.args.args)
+        self.assigned = getAssignedNames(node.body)
+        self.callees = set(call.func.id for call in getCalls(node))
+        self.isLeaf = not (self.callees - BUILTIN_FUNCTIONS)
+        self.size = estimateWords(node.body)
+
+        body = node.body
+        returns = [child for child in ast.walk(node) if isinstance(child, ast.Return)]
+        self.result = body[-1].value if isinstance(body[-1], ast.Return) else None
+        self.statements = body[:-1] if isinstance(body[-1], ast.Return) else body
+        # Code generation adds no return of its own, so a body that neither
+        # returns nor exits at its end runs on into the next function.
+        self.fallsThrough = not returns and not isExitCall(body[-1])
+        self.isStatementShaped = len(returns) <= 1 and (not returns or body[-1] is returns[0]) and not self.fallsThrough and not node.args.vararg and not node.args.kwarg and not node.args.defaults
+        self.isExpressionShaped = self.isStatementShaped and not self.statements and self.result is not None
+
+class Inliner(ast.NodeTransformer):
+    def __init__(self, maxGrowth = DEFAULT_MAX_GROWTH):
+        ast.NodeTransformer.__init__(self)
+
+        self.maxGrowth = maxGrowth
+        self.functions = {}
+        self.chosen = set()
+        self.writes = {}
+        self.reads = []
+        self.inlined = 0
+        self.removed = []
+
+    def getBindings(self, info, call, inExpression):
+        if call.keywords or call.starargs or call.kwargs or len(call.args) != len(info.params):
+            return None
+        # Reads of a parameter can take the argument itself when nothing the
+        # callee runs, directly or through its own calls, writes either.
+        # Parameters are variables like any other, so the argument is still
+        # stored unless nothing outside the callee reads the parameter.
+        writes = self.writes[info.node.name]
+        values = {}
+        assignments = []
+        for param, arg in zip(info.params, call.args):
+            if param not in writes and (isinstance(arg, ast.Num) or isinstance(arg, ast.Name) and arg.id not in writes and arg.id not in info.params):
+                values[param] = arg
+                if not self.isReadOutside(param, info):
+                    continue
+            if inExpression:
+                return None
+            assignments.append((param, arg))
+        bound = set(param for param, arg in assignments)
+        if any(getReadNames(arg) & bound for param, arg in assignments):
+            return None
+        return values, assignments
+
+    def isReadOutside(self, name, info):
+        return any(name in names for owner, names in self.reads if owner != info.node.name)
+
+    def canInline(self, call, statement = None):
+        info = self.functions.get(call.func.id) if isinstance(call.func, ast.Name) else None
+        if info is None or not info.isStatementShaped:
+            return False
+        if statement is None and not info.isExpressionShaped:
+            return False
+        if statement is not None and not isinstance(statement, ast.Expr) and info.result is None:
+            return False
+        return self.getBindings(info, call, statement is None) is not None
+
+    def canHoist(self, statement, call):
+        # A call buried in an expression can move ahead of its statement
+        # when it is the only call there, is not evaluated conditionally
+        # and it writes nothing the expression reads outside the call,
+        # whether or not its own arguments read that name too.
+        root = getStatementExpression(statement)
+        if root is None or call is root or any(isinstance(child, ast.BoolOp) for child in ast.walk(root)):
+            return False
+        if len(getCalls(root)) != 1 or not self.canInline(call, HOISTED_STATEMENT):
+            return False
+        return not getReadNamesOutside(root, call) & self.writes.get(call.func.id, set())
+
+    def isSite(self, statement, call, direct):
+        if call is direct:
+            return self.canInline(call, statement)
+        return self.canInline(call) or self.canHoist(statement, call)
+
+    def getSites(self, tree):
+        sites = {}
+        totals = {}
+        for statement in ast.walk(tree):
+            if not isinstance(statement, ast.stmt):
+                continue
+            direct = getStatementCall(statement)
+            for child in ast.iter_child_nodes(statement):
+                if isinstance(child, ast.stmt):
+                    continue
+                for call in getCalls(child):
+                    name = call.func.id
+                    totals[name] = totals.get(name, 0) + 1
+                    if self.isSite(statement, call, direct):
+                        sites[name] = sites.get(name, 0) + 1
+        return sites, totals
+
+    def choose(self, tree):
+        reachable = self.getReachable()
+        sites, totals = self.getSites(tree)
+        chosen = set()
+        for name, info in self.functions.iteritems():
+            count = sites.get(name, 0)
+            if not count or name in reachable[name]:
+                continue
+            if not info.isLeaf and totals[name] > 1:
+                continue
+            removable = count == totals[name] and name not in KEEP_FUNCTIONS
+            growth = count * (info.size - CALL_WORDS) - (info.size + RETURN_WORDS if removable else 0)
+            if growth <= self.maxGrowth:
+                chosen.add(name)
+        return chosen
+
+    def getReachable(self):
+        reachable = {}
+        for name in self.functions:
+            seen = set()
+            pending = list(self.functions[name].callees)
+            while pending:
+                callee = pending.pop()
+                if callee in self.functions and callee not in seen:
+                    seen.add(callee)
+                    pending.extend(self.functions[callee].callees)
+            reachable[name] = seen
+        self.writes = dict((name, self.functions[name].assigned.union(*[self.functions[callee].assigned for callee in seen])) for name, seen in reachable.iteritems())
+        return reachable
+
+    def run(self, tree):
+        used = set()
+        for round in range(MAX_ROUNDS):
+            self.functions = dict((node.name, FunctionInfo(node)) for node in tree.body if isinstance(node, ast.FunctionDef))
+            self.reads = [(node.name if isinstance(node, ast.FunctionDef) else None, getReadNames(node)) for node in tree.body]
+            self.chosen = self.choose(tree)
+            if not self.chosen:
+                break
+            used |= self.chosen
+            body = []
+            for node in tree.body:
+                if isinstance(node, ast.FunctionDef) and node.name in self.chosen:
+                    body.append(node)
+                else:
+                    body.extend(self.visitBody([node]))
+            tree.body = body
+            self.removeUnreferenced(tree, used)
+        return tree
+
+    def removeUnreferenced(self, tree, used):
+        removed = True
+        while removed:
+            referenced = set(call.func.id for call in getCalls(tree))
+            body = []
+            for node in tree.body:
+                if isinstance(node, ast.FunctionDef) and node.name in used and node.name not in referenced and node.name not in KEEP_FUNCTIONS:
+                    self.removed.append(node.name)
+                else:
+                    body.append(node)
+            removed = len(body) < len(tree.body)
+            tree.body = body
+
+    def hoistCall(self, statement):
+        root = getStatementExpression(statement)
+        calls = getCalls(root) if root is not None else []
+        if len(calls) != 1 or calls[0].func.id not in self.chosen or self.canInline(calls[0]) or not self.canHoist(statement, calls[0]):
+            return None
+        call = calls[0]
+        name = "%s.result" % (call.func.id,)
+        replacer = Substituter({})
+        replacer.visit_Call = lambda node: ast.copy_location(ast.Name(id = name, ctx = ast.Load()), node) if node is call else replacer.generic_visit(node)
+        replacer.visit(statement)
+        return [ast.copy_location(ast.Assign(targets = [ast.Name(id = name, ctx = ast.Store())], value = call), statement), statement]
+
+    def visitBody(self, statements):
+        body = []
+        for statement in statements:
+            replacement = self.inlineStatement(statement) or self.hoistCall(statement)
+            if replacement is None:
+                body.append(self.visit(statement))
+            else:
+                body.extend(self.visitBody(replacement))
+        return body
+
+    def inlineStatement(self, statement):
+        call = getStatementCall(statement)
+        if call is None or call.func.id not in self.chosen or not self.canInline(call, statement):
+            return None
+        info = self.functions[call.func.id]
+
+        values, assignments = self.getBindings(info, call, False)
+        substituter = Substituter(values)
+        body = [ast.copy_location(ast.Assign(targets = [ast.Name(id = param, ctx = ast.Store())], value = arg), statement) for param, arg in assignments]
+        body.extend(substituter.visit(copy.deepcopy(child)) for child in info.statements)
+        result = substituter.visit(copy.deepcopy(info.result)) if info.result is not None else None
+        if isinstance(statement, ast.Assign):
+            body.append(ast.copy_location(ast.Assign(targets = statement.targets, value = result), statement))
+        elif isinstance(statement, ast.Return):
+            body.append(ast.copy_location(ast.Return(value = result), statement))
+        elif result is not None and not isPure(result):
+            body.append(ast.copy_location(ast.Expr(value = result), statement))
+        self.inlined += 1
+        return body
+
+    def generic_visit(self, node):
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list) and value and isinstance(value[0], ast.stmt):
+                setattr(node, field, self.visitBody(value))
+            elif isinstance(value, list):
+                setattr(node, field, [self.visit(item) if isinstance(item, ast.AST) else item for item in value])
+            elif isinstance(value, ast.AST):
+                setattr(node, field, self.visit(value))
+        return node
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.func, ast.Name) or node.func.id not in self.chosen or not self.canInline(node):
+            return node
+        info = self.functions[node.func.id]
+        values, assignments = self.getBindings(info, node, True)
+        self.inlined += 1
+        return ast.copy_location(Substituter(values).visit(copy.deepcopy(info.result)), node)
+
+HOISTED_STATEMENT = ast.Assign(targets = [], value = None)
+
+def getStatementExpression(statement):
+    if isinstance(statement, (ast.Expr, ast.Assign, ast.Return)):
+        return statement.value
+    if isinstance(statement, ast.If):
+        return statement.test
+    return None
+
+def getStatementCall(statement):
+    if isinstance(statement, ast.Assign) and not all(isinstance(target, ast.Name) for target in statement.targets):
+        return None
+    if isinstance(statement, (ast.Expr, ast.Assign, ast.Return)):
+        value = statement.value
+        if isinstance(value, ast.Call) and isinstance(value.func, ast.Name):
+            return value
+    return None
+
+def inlineFunctions(tree, maxGrowth = DEFAULT_MAX_GROWTH):
+    inliner = Inliner(maxGrowth)
+    tree = ast.fix_missing_locations(inliner.run(tree))
+    return tree, (inliner.inlined, inliner.removed)
@@ -0,0 +1,228 @@
+import sys
+
+OPCODE_CYCLES = {
+    "set" : 1, "add" : 2, "sub" : 2, "mul" : 2, "mli" : 2,
+    "div" : 3, "dvi" : 3, "mod" : 3, "mdi" : 3,
+    "and" : 1, "bor" : 1, "xor" : 1, "shr" : 1, "asr" : 1, "shl" : 1,
+    "ifb" : 2, "ifc" : 2, "ife" : 2, "ifn" : 2, "ifg" : 2, "ifa" : 2, "ifl" : 2, "ifu" : 2,
+    "adx" : 3, "sbx" : 3, "sti" : 2, "std" : 2,
+    "jsr" : 3, "int" : 4, "iag" : 1, "ias" : 1, "rfi" : 3, "iaq" : 2,
+    "hwn" : 2, "hwq" : 4, "hwi" : 4,
+}
+
+BASIC_OPCODES = {
+    "set" : 0x01, "add" : 0x02, "sub" : 0x03, "mul" : 0x04, "mli" : 0x05,
+    "div" : 0x06, "dvi" : 0x07, "mod" : 0x08, "mdi" : 0x09,
+    "and" : 0x0a, "bor" : 0x0b, "xor" : 0x0c, "shr" : 0x0d, "asr" : 0x0e, "shl" : 0x0f,
+    "ifb" : 0x10, "ifc" : 0x11, "ife" : 0x12, "ifn" : 0x13, "ifg" : 0x14, "ifa" : 0x15, "ifl" : 0x16, "ifu" : 0x17,
+    "adx" : 0x1a, "sbx" : 0x1b, "sti" : 0x1e, "std" : 0x1f,
+}
+
+SPECIAL_OPCODES = {
+    "jsr" : 0x01, "int" : 0x08, "iag" : 0x09, "ias" : 0x0a, "rfi" : 0x0b, "iaq" : 0x0c,
+    "hwn" : 0x10, "hwq" : 0x11, "hwi" : 0x12,
+}
+
+REGISTER_CODES = {
+    "a" : 0x00, "b" : 0x01, "c" : 0x02, "x" : 0x03, "y" : 0x04, "z" : 0x05, "i" : 0x06, "j" : 0x07,
+}
+
+GENERAL_REGISTER_NAMES = ("a", "b", "c", "x", "y", "z", "i", "j")
+
+CONDITIONAL_OPCODES = frozenset(["ifb", "ifc", "ife", "ifn", "ifg", "ifa", "ifl", "ifu"])
+
+VARIABLE_ADDRESS_RANGE = (0x2000, 0x7000)
+
+def toAddress(num):
+    return "0x%04x" % (num,)
+
+class Operand(object):
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.value == other.value
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((type(self).__name__, self.value))
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self.value)
+
+    def __reduce__(self):
+        return (type(self), (self.value,))
+
+class Register(Operand):
+    __slots__ = ()
+
+    def __str__(self):
+        return self.value
+
+class Literal(Operand):
+    __slots__ = ()
+
+    def __str__(self):
+        return "%d" % (self.value,)
+
+class Address(Operand):
+    __slots__ = ()
+
+    def __str__(self):
+        return toAddress(self.value)
+
+class LabelRef(Operand):
+    __slots__ = ()
+
+    def __str__(self):
+        return self.value
+
+class Memory(Operand):
+    __slots__ = ()
+
+    def __str__(self):
+        return "[%s]" % (self.value,)
+
+class IndexedMemory(Operand):
+    __slots__ = ()
+
+    def __init__(self, register, offset):
+        Operand.__init__(self, (register, offset))
+
+    def __str__(self):
+        return "[%s+%s]" % (self.value[1], self.value[0])
+
+    def __reduce__(self):
+        return (IndexedMemory, self.value)
+
+A = Register("a")
+PC = Register("PC")
+POP = Register("POP")
+PUSH = Register("PUSH")
+PEEK = Register("PEEK")
+SP = Register("SP")
+EX = Register("EX")
+
+GENERAL_REGISTERS = frozenset(Register(name) for name in GENERAL_REGISTER_NAMES)
+
+# Every access to these moves the stack pointer, so no two of them see
+# the same word.
+STACK_OPERANDS = frozenset([PUSH, POP])
+
+# Operands a copy cannot stand in for: the stack and the program counter.
+VOLATILE_OPERANDS = STACK_OPERANDS | frozenset([PEEK, SP, PC])
+
+def isShortLiteral(value):
+    return value == 0xffff or value == -1 or 0 <= value <= 0x1e
+
+def operandWords(operand, isA):
+    if isinstance(operand, Register):
+        return 0
+    if isinstance(operand, Memory):
+        return 0 if isinstance(operand.value, Register) else 1
+    if isinstance(operand, (Literal, Address)) and isA and isShortLiteral(operand.value):
+        return 0
+    return 1
+
+class Instruction(object):
+    __slots__ = ("opcode", "operands")
+
+    def __init__(self, opcode, *operands):
+        self.opcode = opcode
+        self.operands = operands
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.opcode == other.opcode and self.operands == other.operands
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "Instruction(%r, %s)" % (self.opcode, ", ".join(repr(o) for o in self.operands))
+
+    def __reduce__(self):
+        return (Instruction, (self.opcode,) + self.operands)
+
+    def __str__(self):
+        return "%s %s" % (self.opcode, ", ".join(str(o) for o in self.operands))
+
+    def isConditional(self):
+        return self.opcode in CONDITIONAL_OPCODES
+
+    def words(self):
+        operands = self.operands
+        last = len(operands) - 1
+        return 1 + sum(operandWords(operand, i == last) for i, operand in enumerate(operands))
+
+    def cycles(self):
+        return OPCODE_CYCLES[self.opcode] + self.words() - 1
+
+def isJump(item):
+    return isinstance(item, Instruction) and item.opcode == "set" and item.operands[0] == PC
+
+class Label(object):
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.name == other.name
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "Label(%r)" % (self.name,)
+
+    def __reduce__(self):
+        return (Label, (self.name,))
+
+    def __str__(self):
+        return ":%s" % (self.name,)
+
+class Data(object):
+    # Words placed in the program as they are, such as the labels of a
+    # jump table; they are never executed.
+    __slots__ = ("values",)
+
+    def __init__(self, *values):
+        self.values = values
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.values == other.values
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "Data(%s)" % (", ".join(repr(value) for value in self.values),)
+
+    def __reduce__(self):
+        return (Data, self.values)
+
+    def __str__(self):
+        return "dat %s" % (", ".join(str(value) for value in self.values),)
+
+    def words(self):
+        return len(self.values)
+
+def measure(instructions):
+    words = 0
+    cycles = 0
+    for instruction in instructions:
+        if isinstance(instruction, Instruction):
+            words += instruction.words()
+            cycles += instruction.cycles()
+        elif isinstance(instruction, Data):
+            words += instruction.words()
+    return words, cycles
+
+def render(instructions, out = None):
+    if out is None:
+        out = sys.stdout
+    out.writelines("%s\n" % (instruction,) for instruction in instructions)
@@ -0,0 +1,241 @@
+import bisect
+from dcpu16.instructions import Label, Data, Address, LabelRef, Memory, IndexedMemory, PC, BASIC_OPCODES, CONDITIONAL_OPCODES
+
+WRITE_ONLY_OPCODES = frozenset(["set"])
+
+class FragmentLiveness:
+    def __init__(self, fragment, start, end):
+        self.fragment = fragment
+        self.start = start
+        self.end = end
+        self.addresses = sorted(set(fragment.variables.itervalues()) | set(fragment.temporaries))
+        self.index = dict((address, i) for i, address in enumerate(self.addresses))
+        self.names = sorted(fragment.variables.itervalues())
+        self.pinned = 0
+        self.interference = [0] * len(self.addresses)
+        self.calls = []
+        self.fallsThrough = False
+
+    def getNode(self, address):
+        if address in self.index:
+            return self.index[address]
+        i = bisect.bisect_right(self.names, address) - 1
+        if i < 0:
+            return None
+        self.pinned |= 1 << self.index[self.names[i]]
+        return None
+
+    def getEffects(self, instruction):
+        if isinstance(instruction, Data):
+            return 0, 0
+        use = define = 0
+        last = len(instruction.operands) - 1
+        for position, operand in enumerate(instruction.operands):
+            if isinstance(operand, Address):
+                if self.start <= operand.value <= self.end:
+                    node = self.getNode(operand.value)
+                    if node is not None:
+                        self.pinned |= 1 << node
+                continue
+            if not (isinstance(operand, Memory) and isinstance(operand.value, Address)):
+                continue
+            if not self.start <= operand.value.value <= self.end:
+                continue
+            node = self.getNode(operand.value.value)
+            if node is None:
+                continue
+            bit = 1 << node
+            if position == last or instruction.opcode not in BASIC_OPCODES or instruction.opcode in CONDITIONAL_OPCODES:
+                use |= bit
+            elif instruction.opcode in WRITE_ONLY_OPCODES:
+                define |= bit
+            else:
+                use |= bit
+                define |= bit
+        return use, define
+
+    def analyze(self):
+        code = []
+        labels = {}
+        for item in self.fragment.instructions:
+            if isinstance(item, Label):
+                labels[item.name] = len(code)
+            else:
+                code.append(item)
+
+        count = len(code)
+        successors = []
+        for k, instruction in enumerate(code):
+            if isinstance(instruction, Data):
+                successors.append(tuple(labels[value.value] for value in instruction.values if isinstance(value, LabelRef) and value.value in labels))
+            elif instruction.isConditional():
+                skipped = k + 1
+                while skipped < count and code[skipped].isConditional():
+                    skipped += 1
+                successors.append((k + 1, skipped + 1))
+            elif instruction.opcode == "set" and instruction.operands[0] == PC:
+                target = instruction.operands[1]
+                if isinstance(target, IndexedMemory):
+                    # A jump through a table may go on to any of its entries.
+                    target = target.value[1]
+                successors.append((labels[target.value],) if isinstance(target, LabelRef) and target.value in labels else ())
+            else:
+                successors.append((k + 1,))
+
+        # Code without a jump at its end, or no code at all, runs on into
+        # the next fragment.
+        self.fallsThrough = not count or any(successor >= count for targets in successors for successor in targets)
+
+        effects = [self.getEffects(instruction) for instruction in code]
+        liveIn = [0] * (count + 2)
+        liveOut = [0] * count
+        changed = True
+        while changed:
+            changed = False
+            for k in xrange(count - 1, -1, -1):
+                out = 0
+                for successor in successors[k]:
+                    out |= liveIn[successor]
+                use, define = effects[k]
+                live = use | (out & ~define)
+                liveOut[k] = out
+                if live != liveIn[k]:
+                    liveIn[k] = live
+                    changed = True
+
+        # Anything live on entry carries a value between invocations, so
+        # it keeps a word of its own.
+        self.pinned |= liveIn[0] if count else 0
+
+        interference = self.interference
+        for k, instruction in enumerate(code):
+            define = effects[k][1]
+            live = liveOut[k]
+            node = 0
+            while define >> node:
+                if define >> node & 1:
+                    others = live & ~(1 << node)
+                    interference[node] |= others
+                    other = 0
+                    while others >> other:
+                        if others >> other & 1:
+                            interference[other] |= 1 << node
+                        other += 1
+                node += 1
+            if not isinstance(instruction, Data) and instruction.opcode == "jsr" and isinstance(instruction.operands[0], LabelRef):
+                self.calls.append((instruction.operands[0].value, live))
+        return self
+
+def iterateBits(mask):
+    node = 0
+    while mask:
+        if mask & 1:
+            yield node
+        mask >>= 1
+        node += 1
+
+class SlotAllocation:
+    def __init__(self, mappings, words, functions, unshared):
+        self.mappings = mappings
+        self.words = words
+        self.functions = functions
+        self.unshared = unshared
+
+def allocateSlots(fragments, start, end):
+    analyses = [FragmentLiveness(fragment, start, end).analyze() for fragment in fragments]
+
+    users = {}
+    for fragment in fragments:
+        for name in fragment.variables:
+            users[name] = users.get(name, 0) + 1
+    for analysis in analyses:
+        for name, address in analysis.fragment.variables.iteritems():
+            if users[name] > 1:
+                analysis.pinned |= 1 << analysis.index[address]
+
+    addresses = {}
+    for analysis in analyses:
+        for name, address in sorted(analysis.fragment.variables.iteritems(), key = lambda item: item[1]):
+            if analysis.pinned >> analysis.index[address] & 1 and name not in addresses:
+                addresses[name] = start + len(addresses)
+
+    nodes = []
+    nodeIds = []
+    for f, analysis in enumerate(analyses):
+        ids = {}
+        for node in iterateBits(((1 << len(analysis.addresses)) - 1) & ~analysis.pinned):
+            ids[node] = len(nodes)
+            nodes.append((f, node))
+        nodeIds.append(ids)
+
+    neighbours = [set() for node in nodes]
+    for f, analysis in enumerate(analyses):
+        ids = nodeIds[f]
+        for node, nodeId in ids.iteritems():
+            for other in iterateBits(analysis.interference[node]):
+                if other in ids:
+                    neighbours[nodeId].add(ids[other])
+
+    namespaces = dict((fragment.namespace, f) for f, fragment in enumerate(fragments))
+    callees = [set(namespaces[callee] for callee, live in analysis.calls if callee in namespaces) for analysis in analyses]
+    # Falling off the end enters the next fragment, which then writes its
+    # slots as if it had been called.
+    for f, analysis in enumerate(analyses[:-1]):
+        if analysis.fallsThrough:
+            callees[f].add(f + 1)
+    reachable = {}
+    def reach(f):
+        if f not in reachable:
+            seen = set([f])
+            pending = [f]
+            while pending:
+                for callee in callees[pending.pop()]:
+                    if callee not in seen:
+                        seen.add(callee)
+                        pending.append(callee)
+            reachable[f] = seen
+        return reachable[f]
+
+    # A value live across a call must survive every slot the callee, or
+    # anything it calls in turn, may write.
+    for f, analysis in enumerate(analyses):
+        ids = nodeIds[f]
+        for callee, live in analysis.calls:
+            if callee not in namespaces:
+                continue
+            crossing = [ids[node] for node in iterateBits(live) if node in ids]
+            if not crossing:
+                continue
+            clobbered = [nodeId for g in reach(namespaces[callee]) for nodeId in nodeIds[g].itervalues()]
+            for nodeId in crossing:
+                for other in clobbered:
+                    if other != nodeId:
+                        neighbours[nodeId].add(other)
+                        neighbours[other].add(nodeId)
+
+    colors = [None] * len(nodes)
+    slots = 0
+    for nodeId in xrange(len(nodes)):
+        taken = set(colors[other] for other in neighbours[nodeId])
+        color = 0
+        while color in taken:
+            color += 1
+        colors[nodeId] = color
+        slots = max(slots, color + 1)
+
+    base = start + len(addresses)
+    if base + slots - 1 > end:
+        raise Exception("Memory exhausted")
+
+    mappings = []
+    functions = {}
+    for f, analysis in enumerate(analyses):
+        fragment = analysis.fragment
+        mapping = dict((address, addresses[name]) for name, address in fragment.variables.iteritems() if name in addresses)
+        for node, nodeId in nodeIds[f].iteritems():
+            mapping[analysis.addresses[node]] = base + colors[nodeId]
+        mappings.append(mapping)
+        functions[fragment.namespace] = len(set(mapping.itervalues()))
+
+    unshared = len(users) + max([len(fragment.temporaries) for fragment in fragments] or [0])
+    return SlotAllocation(mappings, len(addresses) + slots, functions, unshared)
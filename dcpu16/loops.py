@@ -0,0 +1,279 @@
+import ast
+import copy
+from dcpu16.transforms import ConstantFolder, isConstant, wrap
+from dcpu16.inliner import Substituter, BUILTIN_FUNCTIONS, getCalls, getAssignedNames, estimateWords
+
+DEFAULT_UNROLL_BUDGET = 64
+MAX_UNROLL_TRIPS = 16
+SHORT_LITERAL_LIMIT = 0x1e
+
+def getRangeArguments(node):
+    # Returns the start, stop and step of "for name in range(...)", the
+    # step as a constant, or None for any other kind of for loop.
+    call = node.iter
+    if not isinstance(node.target, ast.Name) or not isinstance(call, ast.Call) or not isinstance(call.func, ast.Name) or call.func.id != "range":
+        return None
+    if call.keywords or call.starargs or call.kwargs or not 1 <= len(call.args) <= 3:
+        return None
+    args = call.args
+    start, stop = (ast.Num(n = 0), args[0]) if len(args) == 1 else (args[0], args[1])
+    step = getConstant(args[2]) if len(args) == 3 else 1
+    if step is None or not wrap(step):
+        return None
+    step = wrap(step)
+    return start, stop, step - 0x10000 if step & 0x8000 else step
+
+def getConstant(node):
+    node = ConstantFolder().visit(copy.deepcopy(node))
+    return node.n if isConstant(node) else None
+
+def getTripCount(node):
+    # The number of times a range loop with constant bounds runs its body,
+    # or None when a bound is only known at run time. Bounds count as
+    # written, so "range(0, -1, -1)" runs once as it does in Python.
+    arguments = getRangeArguments(node)
+    if arguments is None:
+        return None
+    start, stop, step = arguments
+    start, stop = getConstant(start), getConstant(stop)
+    if start is None or stop is None:
+        return None
+    return len(xrange(start, stop, step))
+
+def hasCalls(nodes):
+    return any(call.func.id not in BUILTIN_FUNCTIONS for node in nodes for call in getCalls(node))
+
+def getWrittenNames(nodes):
+    # Storing through a subscript changes the words the base name reads.
+    names = getAssignedNames(nodes)
+    for node in nodes:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Subscript) and isinstance(child.ctx, ast.Store) and isinstance(child.value, ast.Name):
+                names.add(child.value.id)
+    return names
+
+def hasJumps(nodes):
+    return any(isinstance(child, (ast.Break, ast.Continue)) for node in nodes for child in ast.walk(node))
+
+def isLoop(statement):
+    return isinstance(statement, (ast.While, ast.For))
+
+def getLoopExpressions(loop):
+    # The expressions evaluated on every pass around the loop; the range of
+    # a for loop is evaluated once, before it starts.
+    if isinstance(loop, ast.While):
+        yield loop.test
+    for statement in loop.body:
+        for child in ast.walk(statement):
+            if isinstance(child, ast.stmt):
+                for field, value in ast.iter_fields(child):
+                    if isinstance(value, ast.expr):
+                        yield value
+                    elif isinstance(value, list):
+                        for item in value:
+                            if isinstance(item, ast.expr):
+                                yield item
+
+class ExpressionReplacer(ast.NodeTransformer):
+    def __init__(self, replace):
+        ast.NodeTransformer.__init__(self)
+
+        self.replace = replace
+
+    def visit(self, node):
+        replacement = self.replace(node)
+        if replacement is not None:
+            return ast.copy_location(replacement, node)
+        return ast.NodeTransformer.visit(self, node)
+
+def assign(name, value, location):
+    return ast.copy_location(ast.Assign(targets = [ast.Name(id = name, ctx = ast.Store())], value = value), location)
+
+class LoopOptimizer:
+    def __init__(self, hoist = True, unroll = True, unrollBudget = DEFAULT_UNROLL_BUDGET):
+        self.hoist = hoist
+        self.unroll = unroll
+        self.unrollBudget = unrollBudget
+        self.hoisted = 0
+        self.reduced = 0
+        self.unrolled = 0
+        self.namespace = None
+        self.names = 0
+
+    def newName(self, kind):
+        self.names += 1
+        return "%s.%s%d" % (self.namespace, kind, self.names)
+
+    def unrollStatements(self, statements):
+        # Inner loops go first, so an outer loop is measured with them
+        # already unrolled.
+        body = []
+        for statement in statements:
+            for field in ("body", "orelse"):
+                children = getattr(statement, field, None)
+                if isinstance(children, list):
+                    setattr(statement, field, self.unrollStatements(children))
+            unrolled = self.unrollLoop(statement) if isinstance(statement, ast.For) else None
+            body.extend([statement] if unrolled is None else unrolled)
+        return body
+
+    def hoistStatements(self, statements):
+        # Outer loops go first, so an expression invariant in several
+        # nested loops moves out of all of them at once.
+        body = []
+        for statement in statements:
+            if isLoop(statement) and not hasCalls([statement]):
+                body.extend(self.reduceInductionVariables(statement))
+                body.extend(self.hoistInvariants(statement))
+            for field in ("body", "orelse"):
+                children = getattr(statement, field, None)
+                if isinstance(children, list):
+                    setattr(statement, field, self.hoistStatements(children))
+            body.append(statement)
+        return body
+
+    def unrollLoop(self, loop):
+        # Copies the body once for every value of a short range loop, as
+        # long as the copies stay within the size budget.
+        count = getTripCount(loop)
+        if count is None or count > MAX_UNROLL_TRIPS or hasJumps(loop.body):
+            return None
+        if estimateWords(loop.body) * (count - 1) > self.unrollBudget:
+            return None
+        start, stop, step = getRangeArguments(loop)
+        name = loop.target.id
+        values = [wrap(getConstant(start) + index * step) for index in xrange(count)]
+        substitute = name not in getAssignedNames(loop.body) and not hasCalls(loop.body)
+        body = []
+        for value in values:
+            if substitute:
+                body.extend(Substituter({name : ast.Num(n = value)}).visit(copy.deepcopy(statement)) for statement in loop.body)
+            else:
+                body.append(assign(name, ast.Num(n = value), loop))
+                body.extend(copy.deepcopy(loop.body))
+        if substitute and values:
+            body.append(assign(name, ast.Num(n = values[-1]), loop))
+        body.extend(loop.orelse)
+        self.unrolled += 1
+        return body
+
+    def hoistInvariants(self, loop):
+        # An expression reading only names the loop never writes has the
+        # same value on every pass, so it is computed once before the loop.
+        # Nothing here can fault, so computing it when the loop runs no
+        # pass at all is harmless.
+        written = getWrittenNames([loop])
+        def isInvariant(node):
+            if not isinstance(node, (ast.BinOp, ast.UnaryOp)):
+                return False
+            leaves = [child for child in ast.walk(node) if not isinstance(child, (ast.BinOp, ast.UnaryOp, ast.operator, ast.unaryop, ast.expr_context))]
+            if not all(isinstance(leaf, ast.Num) or isinstance(leaf, ast.Name) and leaf.id not in written for leaf in leaves):
+                return False
+            return any(isinstance(leaf, ast.Name) for leaf in leaves)
+
+        hoisted = []
+        names = {}
+        def replace(node):
+            if not isInvariant(node):
+                return None
+            key = ast.dump(node)
+            if key not in names:
+                names[key] = self.newName("invariant")
+                hoisted.append(assign(names[key], copy.deepcopy(node), loop))
+                self.hoisted += 1
+            return ast.Name(id = names[key], ctx = ast.Load())
+
+        replacer = ExpressionReplacer(replace)
+        if isinstance(loop, ast.While):
+            loop.test = replacer.visit(loop.test)
+        for statement in loop.body:
+            self.replaceExpressions(statement, replacer)
+        return hoisted
+
+    def replaceExpressions(self, statement, replacer):
+        for field, value in ast.iter_fields(statement):
+            if isinstance(value, ast.expr) and not (isinstance(value, ast.Name) and isinstance(value.ctx, ast.Store)):
+                setattr(statement, field, replacer.visit(value))
+            elif isinstance(value, list):
+                for index, item in enumerate(value):
+                    if isinstance(item, ast.stmt):
+                        self.replaceExpressions(item, replacer)
+                    elif isinstance(item, ast.expr) and not (isinstance(item, ast.Name) and isinstance(item.ctx, ast.Store)):
+                        value[index] = replacer.visit(item)
+
+    def reduceInductionVariables(self, loop):
+        # "i * c" in a range loop becomes a variable stepped by "step * c"
+        # at the top of every pass, when the multiplications it saves cost
+        # more cycles than the add.
+        arguments = getRangeArguments(loop) if isinstance(loop, ast.For) else None
+        if arguments is None:
+            return []
+        start, stop, step = arguments
+        name = loop.target.id
+        if name in getAssignedNames(loop.body) or getCalls(start):
+            return []
+        products = {}
+        for expression in getLoopExpressions(loop):
+            for child in ast.walk(expression):
+                factor = getInductionFactor(child, name)
+                if factor is not None:
+                    products.setdefault(factor, []).append(child)
+
+        initial = []
+        for factor, uses in sorted(products.iteritems()):
+            increment = wrap(step * factor)
+            if len(uses) * getMultiplyCycles(factor) <= getIncrementCycles(increment):
+                continue
+            reduced = self.newName("induction")
+            first = ast.BinOp(left = ast.BinOp(left = copy.deepcopy(start), op = ast.Sub(), right = ast.Num(n = wrap(step))), op = ast.Mult(), right = ast.Num(n = factor))
+            initial.append(assign(reduced, first, loop))
+            ids = set(id(use) for use in uses)
+            replacer = ExpressionReplacer(lambda node: ast.Name(id = reduced, ctx = ast.Load()) if id(node) in ids else None)
+            for statement in loop.body:
+                self.replaceExpressions(statement, replacer)
+            update = ast.BinOp(left = ast.Name(id = reduced, ctx = ast.Load()), op = ast.Add(), right = ast.Num(n = increment))
+            loop.body.insert(0, assign(reduced, update, loop))
+            self.reduced += 1
+        return initial
+
+    def optimize(self, statements):
+        if self.unroll:
+            statements = self.unrollStatements(statements)
+        if self.hoist:
+            statements = self.hoistStatements(statements)
+        return statements
+
+    def run(self, tree):
+        body = []
+        for index, node in enumerate(tree.body):
+            self.names = 0
+            if isinstance(node, ast.FunctionDef):
+                self.namespace = node.name
+                node.body = self.optimize(node.body)
+                body.append(node)
+            else:
+                self.namespace = "module%d" % (index,)
+                body.extend(self.optimize([node]))
+        tree.body = body
+        return tree
+
+def getInductionFactor(node, name):
+    if not isinstance(node, ast.BinOp) or not isinstance(node.op, ast.Mult):
+        return None
+    for variable, factor in ((node.left, node.right), (node.right, node.left)):
+        if isinstance(variable, ast.Name) and variable.id == name and isConstant(factor):
+            return wrap(factor.n)
+    return None
+
+def getMultiplyCycles(factor):
+    if factor > 1 and not factor & (factor - 1):
+        return 1
+    return 2 + (factor > SHORT_LITERAL_LIMIT)
+
+def getIncrementCycles(increment):
+    return 3 + (SHORT_LITERAL_LIMIT < increment < 0xffff)
+
+def optimizeLoops(tree, hoist = True, unroll = True, unrollBudget = DEFAULT_UNROLL_BUDGET):
+    optimizer = LoopOptimizer(hoist, unroll, unrollBudget)
+    tree = ast.fix_missing_locations(optimizer.run(tree))
+    return tree, (optimizer.hoisted, optimizer.reduced, optimizer.unrolled)
@@ -0,0 +1,291 @@
+import sys
+import time
+from dcpu16.instructions import Instruction, Label, Data, LabelRef, IndexedMemory, PC, isJump
+from dcpu16.valuenumbering import numberValues
+
+def getJumpLabel(instruction):
+    # A jump through "[table+register]" goes on to one of the table's
+    # entries, so it is followed to the table itself.
+    target = instruction.operands[1]
+    if isinstance(target, LabelRef):
+        return target.value
+    if isinstance(target, IndexedMemory) and isinstance(target.value[1], LabelRef):
+        return target.value[1].value
+    return None
+
+class BasicBlock:
+    def __init__(self, labels, instructions):
+        self.labels = labels
+        self.instructions = instructions
+
+    def isGuarded(self, index):
+        previous = self.instructions[index - 1] if index > 0 else None
+        return isinstance(previous, Instruction) and previous.isConditional()
+
+    def getJumpTargets(self):
+        targets = []
+        for instruction in self.instructions:
+            if isinstance(instruction, Data):
+                targets.extend(value.value for value in instruction.values if isinstance(value, LabelRef))
+            elif isJump(instruction) and getJumpLabel(instruction) is not None:
+                targets.append(getJumpLabel(instruction))
+        return targets
+
+    def fallsThrough(self):
+        if not self.instructions:
+            return True
+        last = len(self.instructions) - 1
+        if isinstance(self.instructions[last], Data):
+            return False
+        return not isJump(self.instructions[last]) or self.isGuarded(last)
+
+class FunctionBlocks:
+    def __init__(self, namespace, blocks):
+        self.namespace = namespace
+        self.blocks = blocks
+
+    def getBlockIndexes(self):
+        return dict((label, index) for index, block in enumerate(self.blocks) for label in block.labels)
+
+    def isLocalLabel(self, label):
+        return label.startswith(self.namespace + ".")
+
+    def getSuccessors(self, index):
+        indexes = self.getBlockIndexes()
+        block = self.blocks[index]
+        successors = [indexes[label] for label in block.getJumpTargets() if label in indexes]
+        if block.fallsThrough() and index + 1 < len(self.blocks):
+            successors.append(index + 1)
+        return successors
+
+    def getPredecessors(self):
+        predecessors = [[] for block in self.blocks]
+        for index in xrange(len(self.blocks)):
+            for successor in self.getSuccessors(index):
+                predecessors[successor].append(index)
+        return predecessors
+
+    def getEntries(self):
+        # Labels outside the function's namespace can be entered from other
+        # functions, so their blocks are entries along with the first one.
+        return [index for index, block in enumerate(self.blocks) if index == 0 or any(not self.isLocalLabel(label) for label in block.labels)]
+
+    def getReversePostorder(self):
+        successors = [self.getSuccessors(index) for index in xrange(len(self.blocks))]
+        order = []
+        seen = set()
+        for entry in self.getEntries():
+            if entry in seen:
+                continue
+            seen.add(entry)
+            stack = [(entry, iter(successors[entry]))]
+            while stack:
+                index, children = stack[-1]
+                for child in children:
+                    if child not in seen:
+                        seen.add(child)
+                        stack.append((child, iter(successors[child])))
+                        break
+                else:
+                    stack.pop()
+                    order.append(index)
+        order.reverse()
+        return order
+
+    def getImmediateDominators(self):
+        # The iterative algorithm of Cooper, Harvey and Kennedy, with every
+        # entry hanging off one virtual root; entries and blocks nothing
+        # reaches get None.
+        root = len(self.blocks)
+        order = self.getReversePostorder()
+        positions = dict((index, position) for position, index in enumerate(order))
+        positions[root] = -1
+        predecessors = self.getPredecessors()
+        for entry in self.getEntries():
+            predecessors[entry].append(root)
+        dominators = {root : root}
+
+        def intersect(first, second):
+            while first != second:
+                while positions[first] > positions[second]:
+                    first = dominators[first]
+                while positions[second] > positions[first]:
+                    second = dominators[second]
+            return first
+
+        changed = True
+        while changed:
+            changed = False
+            for index in order:
+                processed = [predecessor for predecessor in predecessors[index] if predecessor in dominators]
+                dominator = processed[0]
+                for predecessor in processed[1:]:
+                    dominator = intersect(predecessor, dominator)
+                if dominators.get(index) != dominator:
+                    dominators[index] = dominator
+                    changed = True
+        return [None if dominators.get(index, root) == root else dominators[index] for index in xrange(len(self.blocks))]
+
+    def countInstructions(self):
+        return sum(len(block.instructions) for block in self.blocks)
+
+    def flatten(self):
+        instructions = []
+        for block in self.blocks:
+            instructions.extend(Label(label) for label in block.labels)
+            instructions.extend(block.instructions)
+        return instructions
+
+def buildBlocks(namespace, instructions):
+    # A label starts a block and a jump, taken or guarded by a test, or a
+    # table of data ends one; flattening the blocks gives back exactly the
+    # same instructions.
+    blocks = []
+    labels = []
+    body = []
+    for item in instructions:
+        if isinstance(item, Label):
+            if body:
+                blocks.append(BasicBlock(labels, body))
+                labels, body = [], []
+            labels.append(item.name)
+            continue
+        body.append(item)
+        if isJump(item) or isinstance(item, Data):
+            blocks.append(BasicBlock(labels, body))
+            labels, body = [], []
+    if labels or body:
+        blocks.append(BasicBlock(labels, body))
+    return FunctionBlocks(namespace, blocks)
+
+def threadJumps(function):
+    # A jump to a block that does nothing but jump again can take the
+    # second jump itself.
+    indexes = function.getBlockIndexes()
+    def getForwardedJump(label):
+        seen = set()
+        jump = None
+        while label in indexes and label not in seen:
+            seen.add(label)
+            block = function.blocks[indexes[label]]
+            if len(block.instructions) != 1 or not isJump(block.instructions[0]):
+                break
+            jump = block.instructions[0]
+            target = jump.operands[1]
+            if not isinstance(target, LabelRef):
+                break
+            label = target.value
+        return jump
+
+    for block in function.blocks:
+        for index, instruction in enumerate(block.instructions):
+            if isJump(instruction) and isinstance(instruction.operands[1], LabelRef):
+                jump = getForwardedJump(instruction.operands[1].value)
+                if jump is not None and jump != instruction:
+                    block.instructions[index] = Instruction("set", PC, jump.operands[1])
+    return function
+
+def removeUnreachableBlocks(function):
+    pending = function.getEntries()
+    reachable = set()
+    while pending:
+        index = pending.pop()
+        if index not in reachable:
+            reachable.add(index)
+            pending.extend(function.getSuccessors(index))
+    function.blocks = [block for index, block in enumerate(function.blocks) if index in reachable]
+    return function
+
+class Pass:
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+
+PASSES = dict((optimizationPass.name, optimizationPass) for optimizationPass in [
+    Pass("thread-jumps", threadJumps),
+    Pass("unreachable-blocks", removeUnreachableBlocks),
+    Pass("value-numbering", numberValues),
+])
+
+DEFAULT_LEVEL = 2
+
+# What each -O level turns on; level 0 leaves the visitor's output as it is.
+OPTIMIZATION_LEVELS = {
+    0 : dict(fold = False, inline = False, deadcode = False, hoist = False, unroll = False, dispatch = False, peephole = False, share = False, passes = ()),
+    1 : dict(fold = True, inline = False, deadcode = False, hoist = False, unroll = False, dispatch = False, peephole = True, share = False, passes = ("thread-jumps",)),
+    2 : dict(fold = True, inline = True, deadcode = True, hoist = True, unroll = False, dispatch = True, peephole = True, share = True, passes = ("thread-jumps", "unreachable-blocks", "value-numbering")),
+    3 : dict(fold = True, inline = True, deadcode = True, hoist = True, unroll = True, dispatch = True, peephole = True, share = True, passes = ("thread-jumps", "unreachable-blocks", "value-numbering")),
+}
+
+DEFAULT_PASSES = OPTIMIZATION_LEVELS[DEFAULT_LEVEL]["passes"]
+
+class PassRecord:
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.seconds = 0.0
+        self.before = 0
+        self.after = 0
+        self.functions = []
+        self.functionCounts = {}
+
+    def add(self, seconds, before, after, namespace = None):
+        self.runs += 1
+        self.seconds += seconds
+        self.before += before
+        self.after += after
+        if namespace is not None:
+            counts = self.functionCounts.get(namespace)
+            if counts is None:
+                counts = self.functionCounts[namespace] = [0, 0]
+                self.functions.append(namespace)
+            counts[0] += before
+            counts[1] += after
+
+class PassManager:
+    def __init__(self, pipeline = DEFAULT_PASSES, timer = time.time):
+        unknown = [name for name in pipeline if name not in PASSES]
+        if unknown:
+            raise Exception("Unknown pass %s" % (", ".join(unknown),))
+        self.pipeline = [PASSES[name] for name in pipeline]
+        self.timer = timer
+        self.records = []
+        self.recordsByName = {}
+
+    def record(self, name, seconds, before, after, namespace = None):
+        record = self.recordsByName.get(name)
+        if record is None:
+            record = self.recordsByName[name] = PassRecord(name)
+            self.records.append(record)
+        record.add(seconds, before, after, namespace)
+
+    def runInstructionPass(self, name, function, instructions, *args, **kwargs):
+        started = self.timer()
+        before = countInstructions(instructions)
+        instructions = function(instructions, *args, **kwargs)
+        self.record(name, self.timer() - started, before, countInstructions(instructions))
+        return instructions
+
+    def optimize(self, namespace, instructions):
+        if not self.pipeline:
+            return instructions
+        function = buildBlocks(namespace, instructions)
+        for optimizationPass in self.pipeline:
+            started = self.timer()
+            before = function.countInstructions()
+            function = optimizationPass.function(function)
+            self.record(optimizationPass.name, self.timer() - started, before, function.countInstructions(), namespace)
+        return function.flatten()
+
+    def report(self, out = None):
+        if out is None:
+            out = sys.stderr
+        for record in self.records:
+            out.write("pass %s: %d runs, %.6f seconds, %d -> %d instructions\n" % (record.name, record.runs, record.seconds, record.before, record.after))
+            for namespace in record.functions:
+                before, after = record.functionCounts[namespace]
+                if before != after:
+                    out.write("pass %s %s: %d instructions eliminated\n" % (record.name, namespace, before - after))
+
+def countInstructions(instructions):
+    return sum(1 for item in instructions if isinstance(item, Instruction))
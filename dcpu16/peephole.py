@@ -0,0 +1,183 @@
+from dcpu16.instructions import Instruction, Label, Literal, LabelRef, Memory, A, PC, POP, GENERAL_REGISTERS, VOLATILE_OPERANDS, isJump, measure
+
+CONDITION_TESTS = {
+    "ife" : lambda b, a: b == a,
+    "ifn" : lambda b, a: b != a,
+    "ifg" : lambda b, a: b > a,
+    "ifl" : lambda b, a: b < a,
+    "ifb" : lambda b, a: (b & a) != 0,
+    "ifc" : lambda b, a: (b & a) == 0,
+}
+
+def isInstruction(item, opcode = None):
+    return isinstance(item, Instruction) and (opcode is None or item.opcode == opcode)
+
+def isGeneralRegister(operand):
+    return operand in GENERAL_REGISTERS
+
+def references(operand, register):
+    return operand == register or operand == Memory(register)
+
+def removeRedundantLoad(window):
+    if len(window) < 2:
+        return None
+    first, second = window[-2], window[-1]
+    if not (isInstruction(first, "set") and isInstruction(second, "set")):
+        return None
+    target, source = first.operands
+    if not (isGeneralRegister(source) or isGeneralRegister(target)):
+        return None
+    if target in VOLATILE_OPERANDS or source in VOLATILE_OPERANDS:
+        return None
+    if second.operands == (source, target):
+        return 2, [first]
+    return None
+
+def removeSelfMove(window):
+    instruction = window[-1]
+    if isInstruction(instruction, "set") and instruction.operands[0] == instruction.operands[1] and instruction.operands[0] not in VOLATILE_OPERANDS:
+        return 1, []
+    return None
+
+def removeDeadMove(window):
+    if len(window) < 2:
+        return None
+    first, second = window[-2], window[-1]
+    if not (isInstruction(first, "set") and isInstruction(second, "set")):
+        return None
+    register = first.operands[0]
+    if not isGeneralRegister(register) or first.operands[1] in VOLATILE_OPERANDS:
+        return None
+    if second.operands[0] == register and not references(second.operands[1], register):
+        return 2, [second]
+    return None
+
+def forwardMove(window):
+    if len(window) < 3:
+        return None
+    first, second, third = window[-3:]
+    if not (isInstruction(first, "set") and isInstruction(second, "set") and isInstruction(third, "set")):
+        return None
+    if first.operands[0] != A or second.operands[1] != A or first.operands[1] in VOLATILE_OPERANDS:
+        return None
+    target = second.operands[0]
+    if not isGeneralRegister(target) or target == A or references(first.operands[1], target):
+        return None
+    if third.operands[0] != A or references(third.operands[1], A) or references(third.operands[1], target):
+        return None
+    return 3, [Instruction("set", target, first.operands[1]), third]
+
+def evaluateConstantTest(window):
+    if len(window) < 2:
+        return None
+    if len(window) >= 3 and isInstruction(window[-3], "set") and isInstruction(window[-2]) and window[-2].opcode in CONDITION_TESTS:
+        setter, test, skipped = window[-3:]
+        if isInstruction(skipped) and not skipped.isConditional():
+            result = testConstant(setter, test)
+            if result is False:
+                return 3, [setter]
+    setter, test = window[-2:]
+    if isInstruction(setter, "set") and isInstruction(test) and test.opcode in CONDITION_TESTS:
+        if testConstant(setter, test) is True:
+            return 2, [setter]
+    return None
+
+def testConstant(setter, test):
+    register, value = setter.operands
+    if not isGeneralRegister(register) or not isinstance(value, Literal):
+        return None
+    left, right = test.operands
+    if left == register and isinstance(right, Literal):
+        return CONDITION_TESTS[test.opcode](value.value & 0xffff, right.value & 0xffff)
+    if right == register and isinstance(left, Literal):
+        return CONDITION_TESTS[test.opcode](left.value & 0xffff, value.value & 0xffff)
+    return None
+
+def removeJumpToNextLabel(window):
+    labels = set()
+    for i in xrange(len(window) - 1, -1, -1):
+        item = window[i]
+        if isinstance(item, Label):
+            labels.add(item.name)
+            continue
+        if isJump(item) and isinstance(item.operands[1], LabelRef) and item.operands[1].value in labels:
+            count = len(window) - i
+            return count, window[i + 1:]
+        return None
+    return None
+
+def replaceTailCall(window):
+    # Returning straight after a call lets the callee return to our caller
+    # instead; a function calling itself this way becomes a loop.
+    if len(window) < 2:
+        return None
+    call, ret = window[-2], window[-1]
+    if isInstruction(call, "jsr") and isInstruction(ret, "set") and ret.operands == (PC, POP):
+        return 2, [Instruction("set", PC, call.operands[0])]
+    return None
+
+def removeUnreachable(window):
+    if len(window) < 2:
+        return None
+    jump, instruction = window[-2], window[-1]
+    if isJump(jump) and isInstruction(instruction):
+        return 2, [jump]
+    return None
+
+class PeepholeRule:
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+
+RULES = [
+    PeepholeRule("redundant-load", removeRedundantLoad),
+    PeepholeRule("self-move", removeSelfMove),
+    PeepholeRule("dead-move", removeDeadMove),
+    PeepholeRule("forward-move", forwardMove),
+    PeepholeRule("constant-test", evaluateConstantTest),
+    PeepholeRule("tail-call", replaceTailCall),
+    PeepholeRule("jump-to-next", removeJumpToNextLabel),
+    PeepholeRule("unreachable", removeUnreachable),
+]
+
+class PeepholeOptimizer:
+    def __init__(self, rules = RULES):
+        self.rules = rules
+        self.stats = dict((rule.name, [0, 0, 0]) for rule in rules)
+
+    def apply(self, output):
+        for rule in self.rules:
+            match = rule.function(output)
+            if match is None:
+                continue
+            count, replacement = match
+            if len(output) > count and isInstruction(output[-count - 1]) and output[-count - 1].isConditional():
+                continue
+            oldWords, oldCycles = measure(output[-count:])
+            newWords, newCycles = measure(replacement)
+            ruleStats = self.stats[rule.name]
+            ruleStats[0] += 1
+            ruleStats[1] += oldWords - newWords
+            ruleStats[2] += oldCycles - newCycles
+            output[-count:] = replacement
+            return True
+        return False
+
+    def run(self, instructions):
+        changed = True
+        while changed:
+            changed = False
+            output = []
+            for item in instructions:
+                output.append(item)
+                while output and self.apply(output):
+                    changed = True
+            instructions = output
+        return instructions
+
+def optimize(instructions, rules = RULES, stats = None):
+    optimizer = PeepholeOptimizer(rules)
+    instructions = optimizer.run(instructions)
+    if stats is not None:
+        stats.update(optimizer.stats)
+    return instructions
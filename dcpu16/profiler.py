@@ -0,0 +1,111 @@
+import gc
+import sys
+import time
+
+def countObjects():
+    # Container objects allocated less those freed since the collector
+    # last ran; it only stays a running count while collection is paused.
+    return gc.get_count()[0]
+
+class StageProfile:
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+class NodeProfile:
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.selfSeconds = 0.0
+        self.instructions = 0
+        self.slots = 0
+        self.objects = 0
+
+class Profiler:
+    def __init__(self, timer = time.time, profileNodes = True):
+        self.timer = timer
+        self.profileNodes = profileNodes
+        self.stages = {}
+        self.nodes = {}
+
+    def stage(self, name, function, *args, **kwargs):
+        profile = self.stages.get(name)
+        if profile is None:
+            profile = self.stages[name] = StageProfile()
+        started = self.timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.calls += 1
+            profile.seconds += self.timer() - started
+
+    def instrument(self, producer):
+        if not self.profileNodes:
+            return producer
+        visit = producer.visit
+        instructions = producer.instructions
+        timer = self.timer
+        nodes = self.nodes
+        stack = []
+        slots = [0]
+
+        allocator = producer.program.allocator
+        reserve = allocator.reserve
+        def countingReserve(address):
+            slots[0] += 1
+            return reserve(address)
+        allocator.reserve = countingReserve
+
+        def profiledVisit(node):
+            paused = not stack and gc.isenabled()
+            if paused:
+                gc.disable()
+            children = [0.0, 0, 0, 0]
+            stack.append(children)
+            started = timer()
+            startInstructions = len(instructions)
+            startSlots = slots[0]
+            startObjects = countObjects()
+            try:
+                return visit(node)
+            finally:
+                elapsed = timer() - started
+                emitted = len(instructions) - startInstructions
+                allocated = slots[0] - startSlots
+                objects = countObjects() - startObjects
+                stack.pop()
+                if paused:
+                    gc.enable()
+
+                name = type(node).__name__
+                profile = nodes.get(name)
+                if profile is None:
+                    profile = nodes[name] = NodeProfile()
+                profile.calls += 1
+                profile.seconds += elapsed
+                profile.selfSeconds += elapsed - children[0]
+                profile.instructions += emitted - children[1]
+                profile.slots += allocated - children[2]
+                profile.objects += objects - children[3]
+
+                if stack:
+                    parent = stack[-1]
+                    parent[0] += elapsed
+                    parent[1] += emitted
+                    parent[2] += allocated
+                    parent[3] += objects
+
+        producer.visit = profiledVisit
+        return producer
+
+    def report(self, out = None):
+        if out is None:
+            out = sys.stderr
+
+        out.write("%-16s %8s %12s\n" % ("stage", "calls", "seconds"))
+        for name, profile in sorted(self.stages.items(), key = lambda item: -item[1].seconds):
+            out.write("%-16s %8d %12.6f\n" % (name, profile.calls, profile.seconds))
+
+        out.write("\n%-16s %8s %12s %12s %12s %8s %8s\n" % ("node", "calls", "seconds", "self", "instructions", "slots", "objects"))
+        for name, profile in sorted(self.nodes.items(), key = lambda item: -item[1].selfSeconds):
+            out.write("%-16s %8d %12.6f %12.6f %12d %8d %8d\n" % (name, profile.calls, profile.seconds, profile.selfSeconds, profile.instructions, profile.slots, profile.objects))
@@ -0,0 +1,120 @@
+import base64
+import hashlib
+import json
+import os
+import SocketServer
+import sys
+import threading
+from StringIO import StringIO
+from dcpu16.compiler import generate
+from dcpu16.instructions import render
+from dcpu16.assembler import assemble, writeImage
+from dcpu16.cache import MemoryCache, DEFAULT_MAX_ENTRIES
+from dcpu16.passes import OPTIMIZATION_LEVELS, DEFAULT_LEVEL
+
+DEFAULT_MAX_RESULTS = 256
+
+class CompileService:
+    def __init__(self, maxEntries = DEFAULT_MAX_ENTRIES, maxResults = DEFAULT_MAX_RESULTS):
+        self.fragments = MemoryCache(maxEntries)
+        self.results = MemoryCache(maxResults, self.fragments.version)
+
+    def compile(self, request):
+        source = request["source"]
+        binary = request.get("format", "assembly") == "binary"
+        options = dict(OPTIMIZATION_LEVELS[request.get("level", DEFAULT_LEVEL)])
+        for name in options:
+            if name in request:
+                options[name] = request[name]
+        options["passes"] = tuple(options["passes"])
+        options["registers"] = request.get("registers", True)
+        littleEndian = request.get("littleEndian", False)
+
+        digest = hashlib.sha1(self.results.version)
+        digest.update("%r\0%r\0%r\0" % (sorted(options.items()), binary, littleEndian))
+        digest.update(source.encode("utf-8") if isinstance(source, unicode) else source)
+        key = digest.hexdigest()
+        result = self.results.get(key)
+        if result is not None:
+            return result
+
+        instructions = generate(source, cache = self.fragments, **options)
+        out = StringIO()
+        if binary:
+            writeImage(assemble(instructions), out, littleEndian)
+            result = {"binary" : base64.b64encode(out.getvalue())}
+        else:
+            render(instructions, out)
+            result = {"assembly" : out.getvalue()}
+        self.results.put(key, result)
+        return result
+
+    def handle(self, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("expected an object")
+        except ValueError as error:
+            return {"ok" : False, "error" : "invalid request: %s" % (error,)}
+
+        response = {"id" : request.get("id"), "ok" : True}
+        try:
+            response.update(self.compile(request))
+        except Exception as error:
+            response["ok"] = False
+            response["error"] = str(error)
+        return response
+
+def formatResponse(response):
+    return json.dumps(response, sort_keys = True) + "\n"
+
+def serveStream(service, input = None, output = None):
+    if input is None:
+        input = sys.stdin
+    if output is None:
+        output = sys.stdout
+
+    lock = threading.Lock()
+    def respond(line):
+        response = formatResponse(service.handle(line))
+        with lock:
+            output.write(response)
+            output.flush()
+
+    # Requests run on their own threads so a slow compile does not hold up
+    # the replies to quicker ones; replies carry the request id.
+    threads = []
+    for line in iter(input.readline, ""):
+        if not line.strip():
+            continue
+        thread = threading.Thread(target = respond, args = (line,))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+        threads = [thread for thread in threads if thread.is_alive()]
+    for thread in threads:
+        thread.join()
+
+class CompileRequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        for line in iter(self.rfile.readline, ""):
+            if line.strip():
+                self.wfile.write(formatResponse(self.server.service.handle(line)))
+                self.wfile.flush()
+
+class CompileServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        if os.path.exists(path):
+            os.remove(path)
+        SocketServer.UnixStreamServer.__init__(self, path, CompileRequestHandler)
+        self.service = service
+
+def serveSocket(service, path):
+    server = CompileServer(path, service)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
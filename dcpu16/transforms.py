@@ -0,0 +1,148 @@
+import ast
+
+WORD_MASK = 0xffff
+
+def wrap(value):
+    return value & WORD_MASK
+
+def divide(left, right):
+    return left // right if right else 0
+
+def modulo(left, right):
+    return left % right if right else 0
+
+BIN_OP_FOLDERS = {
+    "Add" : lambda left, right: wrap(left + right),
+    "Sub" : lambda left, right: wrap(left - right),
+    "Mult" : lambda left, right: wrap(left * right),
+    "Div" : divide,
+    "FloorDiv" : divide,
+    "Mod" : modulo,
+    "BitAnd" : lambda left, right: left & right,
+    "BitOr" : lambda left, right: left | right,
+    "BitXor" : lambda left, right: left ^ right,
+    "LShift" : lambda left, right: wrap(left << right) if right < 16 else 0,
+    "RShift" : lambda left, right: left >> right if right < 16 else 0,
+}
+
+UNARY_OP_FOLDERS = {
+    "Not" : lambda operand: int(not operand),
+    "USub" : lambda operand: wrap(-operand),
+    "UAdd" : lambda operand: operand,
+    "Invert" : lambda operand: wrap(~operand),
+}
+
+COMPARE_OP_FOLDERS = {
+    "Eq" : lambda left, right: left == right,
+    "NotEq" : lambda left, right: left != right,
+    "Lt" : lambda left, right: left < right,
+    "LtE" : lambda left, right: left <= right,
+    "Gt" : lambda left, right: left > right,
+    "GtE" : lambda left, right: left >= right,
+}
+
+def countNodes(node):
+    return sum(1 for child in ast.walk(node))
+
+def isConstant(node):
+    return isinstance(node, ast.Num) and isinstance(node.n, (int, long))
+
+def isPure(node):
+    return not any(isinstance(child, ast.Call) for child in ast.walk(node))
+
+class ConstantFolder(ast.NodeTransformer):
+    def __init__(self):
+        ast.NodeTransformer.__init__(self)
+
+        self.removed = 0
+
+    def replace(self, node, replacement):
+        self.removed += countNodes(node) - countNodes(replacement)
+        return ast.copy_location(replacement, node)
+
+    def constant(self, node, value):
+        return self.replace(node, ast.Num(n = value))
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+
+        opName = type(node.op).__name__
+        left, right = node.left, node.right
+        if isConstant(left) and isConstant(right) and opName in BIN_OP_FOLDERS:
+            return self.constant(node, BIN_OP_FOLDERS[opName](wrap(left.n), wrap(right.n)))
+
+        leftValue = wrap(left.n) if isConstant(left) else None
+        rightValue = wrap(right.n) if isConstant(right) else None
+        if opName == "Add":
+            if rightValue == 0:
+                return self.replace(node, left)
+            if leftValue == 0:
+                return self.replace(node, right)
+        elif opName == "Sub":
+            if rightValue == 0:
+                return self.replace(node, left)
+        elif opName == "Mult":
+            if rightValue == 1:
+                return self.replace(node, left)
+            if leftValue == 1:
+                return self.replace(node, right)
+            if (rightValue == 0 or leftValue == 0) and isPure(node):
+                return self.constant(node, 0)
+        elif opName in ("Div", "FloorDiv"):
+            if rightValue == 1:
+                return self.replace(node, left)
+            if leftValue == 0 and isPure(node):
+                return self.constant(node, 0)
+        elif opName == "Mod":
+            if (rightValue == 1 or leftValue == 0) and isPure(node):
+                return self.constant(node, 0)
+        return node
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+
+        opName = type(node.op).__name__
+        if isConstant(node.operand) and opName in UNARY_OP_FOLDERS:
+            return self.constant(node, UNARY_OP_FOLDERS[opName](wrap(node.operand.n)))
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+
+        operands = [node.left] + node.comparators
+        if not all(isConstant(operand) for operand in operands):
+            return node
+
+        result = 1
+        for i, op in enumerate(node.ops):
+            opName = type(op).__name__
+            if opName not in COMPARE_OP_FOLDERS:
+                return node
+            if not COMPARE_OP_FOLDERS[opName](wrap(operands[i].n), wrap(operands[i + 1].n)):
+                result = 0
+        return self.constant(node, result)
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+
+        isOr = isinstance(node.op, ast.Or)
+        values = []
+        for value in node.values:
+            if isConstant(value):
+                if bool(value.n) == isOr:
+                    values.append(value)
+                    break
+                if value is not node.values[-1]:
+                    continue
+            values.append(value)
+
+        if len(values) == 1:
+            return self.replace(node, values[0])
+        if len(values) < len(node.values):
+            return self.replace(node, ast.BoolOp(op = node.op, values = values))
+        return node
+
+def foldConstants(tree):
+    folder = ConstantFolder()
+    tree = ast.fix_missing_locations(folder.visit(tree))
+    return tree, folder.removed
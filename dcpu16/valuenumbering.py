@@ -0,0 +1,231 @@
+from dcpu16.instructions import Instruction, Data, Register, Literal, Address, Memory, IndexedMemory, PC, EX, GENERAL_REGISTERS, STACK_OPERANDS, VARIABLE_ADDRESS_RANGE, operandWords
+
+ARITHMETIC_OPCODES = frozenset(["add", "sub", "mul", "mli", "div", "dvi", "mod", "mdi", "and", "bor", "xor", "shr", "asr", "shl"])
+COMMUTATIVE_OPCODES = frozenset(["add", "mul", "mli", "and", "bor", "xor"])
+OVERFLOW_OPCODES = ARITHMETIC_OPCODES - frozenset(["and", "bor", "xor"])
+
+def isLocation(operand):
+    # The places a value can be kept in and found again: the general
+    # registers and the words at fixed addresses.
+    return operand in GENERAL_REGISTERS or (isinstance(operand, Memory) and isinstance(operand.value, Address))
+
+def isCheaper(replacement, instruction):
+    return (replacement.cycles(), replacement.words()) < (instruction.cycles(), instruction.words())
+
+def getReadRegisters(instruction):
+    registers = set()
+    for index, operand in enumerate(instruction.operands):
+        if operand in GENERAL_REGISTERS or operand == EX:
+            if index > 0 or instruction.opcode != "set":
+                registers.add(operand)
+        elif isinstance(operand, Memory) and isinstance(operand.value, Register):
+            registers.add(operand.value)
+        elif isinstance(operand, IndexedMemory):
+            registers.add(operand.value[0])
+    return registers
+
+def isTracked(instruction):
+    return isinstance(instruction, Instruction) and (instruction.opcode == "set" or instruction.opcode in ARITHMETIC_OPCODES or instruction.isConditional())
+
+class BlockEffects:
+    # What a block may overwrite, used to tell which values known at a
+    # dominator still hold on entry to a block it dominates.
+    def __init__(self, block):
+        self.locations = set()
+        self.memory = False
+        self.everything = False
+        for instruction in block.instructions:
+            if isinstance(instruction, Data):
+                continue
+            if not isTracked(instruction):
+                self.everything = True
+                continue
+            if instruction.isConditional():
+                continue
+            target = instruction.operands[0]
+            if isLocation(target):
+                self.locations.add(target)
+            elif isinstance(target, (Memory, IndexedMemory)):
+                self.memory = True
+
+    def kills(self, location):
+        return self.everything or location in self.locations or (self.memory and isinstance(location, Memory))
+
+class ValueNumbering:
+    def __init__(self, function):
+        self.function = function
+        self.count = 0
+        self.expressions = {}
+        self.constants = {}
+
+    def newValue(self):
+        self.count += 1
+        return self.count
+
+    def lookup(self, key):
+        value = self.expressions.get(key)
+        if value is None:
+            value = self.expressions[key] = self.newValue()
+        return value
+
+    def getValue(self, operand, facts):
+        if isLocation(operand):
+            value = facts.get(operand)
+            if value is None:
+                value = facts[operand] = self.newValue()
+            return value
+        if isinstance(operand, (Literal, Address)):
+            key = (type(operand).__name__, operand.value & 0xffff if isinstance(operand, Literal) else operand.value)
+            value = self.lookup(key)
+            self.constants[value] = operand
+            return value
+        # Stack operands, pointers and the special registers give a value
+        # nothing else can be known to share.
+        return self.newValue()
+
+    def getHolders(self, value, facts, exclude = None):
+        holders = [location for location, held in facts.iteritems() if held == value and location != exclude]
+        return sorted(holders, key = lambda location: (isinstance(location, Memory), str(location)))
+
+    def getCheaperOperand(self, operand, facts, isA = True):
+        # A register holding the same value saves the operand's extra word.
+        if isinstance(operand, (Memory, Literal, Address)) and operandWords(operand, isA) and not (isinstance(operand, Memory) and not isinstance(operand.value, Address)):
+            value = self.getValue(operand, facts)
+            for holder in self.getHolders(value, facts):
+                if holder in GENERAL_REGISTERS:
+                    return holder
+        return operand
+
+    def forgetMemory(self, facts):
+        for location in [location for location in facts if isinstance(location, Memory)]:
+            del facts[location]
+
+    def store(self, target, value, facts):
+        if isLocation(target):
+            facts[target] = value
+        elif isinstance(target, Memory) and target.value in GENERAL_REGISTERS:
+            # A store through a register that is known to hold a constant
+            # address only touches that word; the screen and other words
+            # outside the variables cannot hold anything we track.
+            address = self.constants.get(facts.get(target.value))
+            start, end = VARIABLE_ADDRESS_RANGE
+            if address is None or (isinstance(address, Literal) and start <= address.value & 0xffff <= end):
+                self.forgetMemory(facts)
+            elif isinstance(address, Address) and start <= address.value <= end:
+                facts[Memory(address)] = value
+        elif isinstance(target, (Memory, IndexedMemory)):
+            self.forgetMemory(facts)
+
+    def numberInstruction(self, instruction, facts, guarded):
+        # Returns the instruction to keep in its place, or None when it
+        # would only put a value where it already is.
+        if isinstance(instruction, Data):
+            return instruction
+        opcode = instruction.opcode
+        if instruction.isConditional():
+            last = len(instruction.operands) - 1
+            return Instruction(opcode, *[self.getCheaperOperand(operand, facts, index == last) for index, operand in enumerate(instruction.operands)])
+        if not isTracked(instruction):
+            facts.clear()
+            return instruction
+        target, source = instruction.operands
+        if target == PC:
+            return instruction
+        if target in STACK_OPERANDS or source in STACK_OPERANDS:
+            self.getValue(source, facts)
+            self.store(target, self.newValue(), facts)
+            return instruction
+        cheaperSource = self.getCheaperOperand(source, facts)
+        if opcode == "set":
+            value = self.getValue(source, facts)
+            if isLocation(target) and facts.get(target) == value and not guarded:
+                return None
+            replacement = Instruction("set", target, cheaperSource)
+        else:
+            left, right = self.getValue(target, facts), self.getValue(source, facts)
+            if opcode in COMMUTATIVE_OPCODES and right < left:
+                left, right = right, left
+            value = self.lookup((opcode, left, right))
+            replacement = Instruction(opcode, target, cheaperSource)
+            for holder in self.getHolders(value, facts, target):
+                reuse = Instruction("set", target, holder)
+                if isCheaper(reuse, replacement):
+                    replacement = reuse
+                break
+        # An instruction behind a test may not run, so afterwards its
+        # target holds one of two values we cannot tell apart.
+        self.store(target, self.newValue() if guarded else value, facts)
+        return replacement
+
+    def numberBlock(self, block, facts):
+        instructions = []
+        for index, instruction in enumerate(block.instructions):
+            replacement = self.numberInstruction(instruction, facts, block.isGuarded(index))
+            if replacement is not None:
+                instructions.append(replacement)
+        block.instructions = instructions
+        return facts
+
+    def getEntryFacts(self, index, dominator, exits, effects, successors, predecessors):
+        if dominator is None:
+            return {}
+        # Whatever a block on some path from the dominator to this block may
+        # overwrite no longer holds on entry.
+        def reach(starts, edges):
+            seen = set()
+            pending = list(starts)
+            while pending:
+                current = pending.pop()
+                if current in seen or current == dominator:
+                    continue
+                seen.add(current)
+                pending.extend(edges[current])
+            return seen
+        between = reach(successors[dominator], successors) & reach(predecessors[index], predecessors)
+        return dict((location, value) for location, value in exits[dominator].iteritems() if not any(effects[block].kills(location) for block in between))
+
+    def run(self):
+        function = self.function
+        dominators = function.getImmediateDominators()
+        successors = [function.getSuccessors(index) for index in xrange(len(function.blocks))]
+        predecessors = function.getPredecessors()
+        effects = [BlockEffects(block) for block in function.blocks]
+        exits = {}
+        for index in function.getReversePostorder():
+            facts = self.getEntryFacts(index, dominators[index], exits, effects, successors, predecessors)
+            exits[index] = self.numberBlock(function.blocks[index], facts)
+
+def removeDeadRegisterWrites(block):
+    # Every register may still be read after the block, so only a write
+    # that is overwritten in the same block before anything reads it goes.
+    # Nothing the code generator emits reads EX across a jump.
+    live = set(GENERAL_REGISTERS)
+    instructions = []
+    for index in xrange(len(block.instructions) - 1, -1, -1):
+        instruction = block.instructions[index]
+        guarded = block.isGuarded(index)
+        if not isTracked(instruction) or (instruction.opcode == "set" and instruction.operands[0] == PC):
+            live.update(GENERAL_REGISTERS)
+            instructions.append(instruction)
+            continue
+        target = instruction.operands[0]
+        overflows = instruction.opcode in OVERFLOW_OPCODES
+        if not instruction.isConditional() and not guarded and target in GENERAL_REGISTERS and target not in live and not (overflows and EX in live) and not any(operand in STACK_OPERANDS for operand in instruction.operands):
+            continue
+        if not instruction.isConditional() and not guarded:
+            live.discard(target)
+            if overflows:
+                live.discard(EX)
+        live.update(getReadRegisters(instruction))
+        instructions.append(instruction)
+    instructions.reverse()
+    block.instructions = instructions
+
+def numberValues(function):
+    # Reuses values already computed or loaded, within a block and from
+    # the blocks dominating it, and drops the register writes this leaves
+    # unread.
+    ValueNumbering(function).run()
+    for block in function.blocks:
+        removeDeadRegisterWrites(block)
+    return function
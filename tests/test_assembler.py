@@ -0,0 +1,62 @@
+import unittest
+from StringIO import StringIO
+from dcpu16.assembler import Assembler, assemble, parseAssembly, writeImage
+from dcpu16.compiler import generate
+from dcpu16.emulator import Emulator
+from dcpu16.instructions import Instruction, Label, Data, Register, Literal, LabelRef, Memory, IndexedMemory, A, PC, POP, measure
+
+class AssemblerTest(unittest.TestCase):
+    def testParsesRenderedAssembly(self):
+        program = parseAssembly(":start\nset [0x2000], a ; store\nset PC, POP\nset a, [0x1000+b]\njsr start\n")
+        
+        self.assertEqual([
+            Label("start"),
+            Instruction("set", Memory(Literal(0x2000)), A),
+            Instruction("set", PC, POP),
+            Instruction("set", A, IndexedMemory(Register("b"), Literal(0x1000))),
+            Instruction("jsr", LabelRef("start")),
+        ], program)
+    
+    def testEncodesShortLiteralsInOperand(self):
+        self.assertEqual([0x7c01, 0x001f], list(assemble("set a, 31")))
+        self.assertEqual([0xfc01], list(assemble("set a, 30")))
+        self.assertEqual([0x8001], list(assemble("set a, 0xffff")))
+        self.assertEqual([0x8bd2, 0x2000], list(assemble("ife [0x2000], 1")))
+        self.assertEqual([0x8bf2, 0x0002], list(assemble("ife 2, 1")))
+    
+    def testResolvesForwardLabels(self):
+        assembler = Assembler()
+        
+        image = assembler.assemble("jsr end\nset a, 1\n:end\nset PC, end\n")
+        
+        self.assertEqual(3, assembler.labels["end"])
+        self.assertEqual([0x7c20, 0x0003, 0x8801, 0x7f81, 0x0003], list(image))
+    
+    def testAssemblesDataWords(self):
+        program = parseAssembly("set PC, [table+a]\n:table dat one, 0x1234\n:one\n")
+        
+        self.assertEqual([Instruction("set", PC, IndexedMemory(A, LabelRef("table"))), Label("table"), Data(LabelRef("one"), Literal(0x1234)), Label("one")], program)
+        self.assertEqual([0x4381, 0x0002, 0x0004, 0x1234], list(assemble(program)))
+        self.assertEqual((4, 2), measure(program))
+    
+    def testRejectsUndefinedLabel(self):
+        self.assertRaises(Exception, assemble, "set PC, nowhere")
+    
+    def testImageSizeMatchesStaticWordCount(self):
+        instructions = generate(open("example.py").read())
+        
+        self.assertEqual(measure(instructions)[0], len(assemble(instructions)))
+    
+    def testWritesImageInOneWrite(self):
+        out = StringIO()
+        
+        writeImage(assemble("set a, 30\nset a, 31"), out)
+        writeImage(assemble("set a, 30"), out, littleEndian = True)
+        
+        self.assertEqual("\xfc\x01\x7c\x01\x00\x1f\x01\xfc", out.getvalue())
+    
+    def testCompiledExampleRunsToCompletion(self):
+        emulator = Emulator(assemble(generate(open("example.py").read())))
+        
+        self.assertTrue(emulator.run(10000))
+        self.assertEqual(563, emulator.memory[0x8000 + 45])
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+from dcpu16.batch import BatchOptions, compileFiles, findInputs, getOutputPath
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sources = os.path.join(self.directory, "src")
+        os.makedirs(os.path.join(self.sources, "nested"))
+        self.write("src/a.py", "def start():\n    x = 1\n    exit()\n")
+        self.write("src/nested/b.py", "def start():\n    y = 2\n    exit()\n")
+        self.write("src/notes.txt", "")
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def write(self, name, text):
+        with open(os.path.join(self.directory, name), "w") as out:
+            out.write(text)
+    
+    def testFindInputsWalksDirectoriesAndGlobs(self):
+        expected = [os.path.join(self.sources, "a.py"), os.path.join(self.sources, "nested", "b.py")]
+        
+        self.assertEqual(expected, findInputs([self.sources]))
+        self.assertEqual(expected[:1], findInputs([os.path.join(self.sources, "*.py")]))
+    
+    def testWritesOneOutputPerInput(self):
+        options = BatchOptions(os.path.join(self.directory, "out"))
+        
+        result = compileFiles([self.sources], options, jobs = 2)
+        
+        self.assertEqual((2, 0, []), (result.compiled, result.skipped, result.failures))
+        self.assertEqual(6, result.lines)
+        with open(os.path.join(self.directory, "out", "a.dasm")) as out:
+            self.assertEqual(":start\nset PC, end\n", out.read())
+        self.assertTrue("files/s" in result.summary())
+    
+    def testSkipsInputsWithNewerOutputs(self):
+        options = BatchOptions()
+        compileFiles([self.sources], options)
+        source = os.path.join(self.sources, "a.py")
+        os.utime(source, (0, 0))
+        os.utime(os.path.join(self.sources, "nested", "b.py"), (os.path.getmtime(getOutputPath(source, options)) + 10,) * 2)
+        
+        result = compileFiles([self.sources], options)
+        
+        self.assertEqual((1, 1), (result.compiled, result.skipped))
+    
+    def testReportsFailuresAndKeepsGoing(self):
+        self.write("src/broken.py", "def start(:\n")
+        
+        result = compileFiles([self.sources], BatchOptions())
+        
+        self.assertEqual(2, result.compiled)
+        self.assertEqual([os.path.join(self.sources, "broken.py")], [path for path, error in result.failures])
+    
+    def testFailsOnPathsMatchingNothing(self):
+        missing = os.path.join(self.directory, "missing.py")
+        
+        result = compileFiles([missing, os.path.join(self.sources, "*.txt.py"), self.sources], BatchOptions())
+        
+        self.assertEqual(2, result.compiled)
+        self.assertEqual([missing, os.path.join(self.sources, "*.txt.py")], [path for path, error in result.failures])
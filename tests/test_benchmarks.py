@@ -0,0 +1,46 @@
+import os
+import unittest
+from dcpu16.compiler import generate
+from dcpu16.benchmark import runProgram, runSuite, findRegressions, loadBaseline, generateSource, runCompileBenchmark, measurePeakMemory
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+
+class BenchmarkTest(unittest.TestCase):
+    def testCorpusRunsCorrectlyWithoutRegressions(self):
+        results = runSuite(os.path.join(BENCHMARKS, "programs"))
+        
+        self.assertEqual([], [failure for result in results for failure in result.failures])
+        self.assertEqual([], findRegressions(results, loadBaseline(os.path.join(BENCHMARKS, "baseline.json"))))
+    
+    def testReportsWrongResults(self):
+        result = runProgram("wrong", "# expect: 0x8000 = 2\ndef start():\n    SCREEN[0] = 1\n    exit()\n    return 0\ndef end():\n    exit()\n")
+        
+        self.assertEqual(["[0x8000] is 1, expected 2"], result.failures)
+    
+    def testFindsRegressionsAboveTolerance(self):
+        result = runProgram("tiny", "def start():\n    exit()\n    return 0\ndef end():\n    exit()\n")
+        baseline = {"tiny" : {"words" : result.metrics["words"] - 1, "instructions" : 100, "cycles" : 100}}
+        
+        self.assertEqual(1, len(findRegressions([result], baseline)))
+        self.assertEqual([], findRegressions([result], baseline, 1.0))
+
+class CompileBenchmarkTest(unittest.TestCase):
+    def testGeneratedSourceHasRequestedShape(self):
+        source = generateSource(3, 5, 2)
+        
+        self.assertEqual(3, source.count("def "))
+        self.assertEqual(3, source.count("return 0"))
+    
+    def testReportsEveryPhase(self):
+        result = runCompileBenchmark(2, 5, 2, repeat = 1)
+        
+        for key in ("parse", "inline", "loops", "deadcode", "transform", "codegen", "passes", "link", "peephole", "emit", "total", "instructions", "lines", "peak_memory"):
+            self.assertTrue(key in result)
+        self.assertTrue(result["instructions"] > 0)
+        self.assertEqual(len(generate(generateSource(2, 5, 2))), result["instructions"])
+    
+    def testPeakMemoryOfEachSourceIsMeasuredOnItsOwn(self):
+        large = measurePeakMemory(generateSource(20, 40, 3))
+        small = measurePeakMemory(generateSource(1, 2, 1))
+        
+        self.assertTrue(small < large)
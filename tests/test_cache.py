@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+import dcpu16.dispatch
+from dcpu16.cache import FragmentCache, compilerVersion
+from dcpu16.compiler import Fragment, generate
+from dcpu16.instructions import Instruction, Label, A, Literal
+
+SOURCE = "def start():\n    x = 1\n    if x == 1:\n        y = f()\n    exit()\n\ndef f():\n    return x + 2\n"
+
+class FragmentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def testCachedCompileMatchesUncachedCompile(self):
+        cache = FragmentCache(self.directory)
+        
+        first = generate(SOURCE, cache = cache, inline = False)
+        second = generate(SOURCE, cache = FragmentCache(self.directory), inline = False)
+        
+        self.assertEqual(generate(SOURCE, inline = False), first)
+        self.assertEqual(first, second)
+        self.assertEqual((0, 2), (cache.hits, cache.misses))
+    
+    def testOnlyChangedFunctionsAreRecompiled(self):
+        generate(SOURCE, cache = FragmentCache(self.directory), inline = False)
+        cache = FragmentCache(self.directory)
+        
+        instructions = generate(SOURCE.replace("x + 2", "x + 3"), cache = cache, inline = False)
+        
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual(generate(SOURCE.replace("x + 2", "x + 3"), inline = False), instructions)
+    
+    def testKeyDependsOnOptionsAndVersion(self):
+        cache = FragmentCache(self.directory)
+        generate(SOURCE, cache = cache, inline = False)
+        
+        generate(SOURCE, registers = False, cache = cache, inline = False)
+        generate(SOURCE, cache = FragmentCache(self.directory, version = "other"), inline = False)
+        
+        self.assertEqual(6, len(os.listdir(self.directory)))
+    
+    def testChangingCodeGeneratorSourceInvalidatesEntries(self):
+        generate(SOURCE, cache = FragmentCache(self.directory), inline = False)
+        copy = tempfile.mkdtemp()
+        path = os.path.join(copy, "dispatch.py")
+        shutil.copy(os.path.splitext(dcpu16.dispatch.__file__)[0] + ".py", path)
+        original = dcpu16.dispatch.__file__
+        dcpu16.dispatch.__file__ = path
+        try:
+            with open(path, "a") as source:
+                source.write("\nMIN_DISPATCH_CASES = 4\n")
+            cache = FragmentCache(self.directory)
+        finally:
+            dcpu16.dispatch.__file__ = original
+            shutil.rmtree(copy)
+        
+        generate(SOURCE, cache = cache, inline = False)
+        
+        self.assertNotEqual(compilerVersion(), cache.version)
+        self.assertEqual((0, 2), (cache.hits, cache.misses))
+    
+    def testEvictsLeastRecentlyUsedEntries(self):
+        fragment = Fragment("f", [Label("f"), Instruction("set", A, Literal(1))], {}, [])
+        cache = FragmentCache(self.directory)
+        cache.put("first", fragment)
+        cache.put("second", fragment)
+        size = os.path.getsize(os.path.join(self.directory, "first"))
+        os.utime(os.path.join(self.directory, "first"), (1, 1))
+        os.utime(os.path.join(self.directory, "second"), (2, 2))
+        cache.maxBytes = 2 * size
+        
+        self.assertTrue(cache.get("first") is not None)
+        cache.put("third", fragment)
+        
+        self.assertEqual(["first", "third"], sorted(os.listdir(self.directory)))
+        self.assertTrue(cache.get("second") is None)
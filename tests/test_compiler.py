@@ -1,11 +1,12 @@
 import unittest
-from dcpu16.compiler import VARIABLE_ADDRESS_RANGE, Variable, Context, Program
+from StringIO import StringIO
+from dcpu16.compiler import VARIABLE_ADDRESS_RANGE, AddressAllocator, Variable, Context, Program, generate, parse
+from dcpu16.instructions import Instruction, Label, Register, Literal, Address, LabelRef, Memory, A, PC, POP, PUSH, measure, render
+from dcpu16.benchmark import generateSource, runProgram
+from dcpu16.passes import OPTIMIZATION_LEVELS
 
 def toMemoryAddress(offset):
-    hexStr = hex(VARIABLE_ADDRESS_RANGE[0] + offset)
-    while len(hexStr) < 6:
-        hexStr = hexStr[0:2] + "0" + hexStr[2:]
-    return hexStr
+    return VARIABLE_ADDRESS_RANGE[0] + offset
 
 class ContextTest(unittest.TestCase):
     def setUp(self):
@@ -26,19 +27,19 @@ class ContextTest(unittest.TestCase):
         
         self.assertEqual(address0, context.getNextAddress())
         
-        context.varsByAddress[address0] = Variable("var1", address0, Context())
+        context.addVariable(Variable("var1", address0, Context()))
         
         self.assertEqual(address1, context.getNextAddress())
         
-        context.varsByAddress[address2] = Variable("var2", address2, Context())
+        context.addVariable(Variable("var2", address2, Context()))
         
         self.assertEqual(address1, context.getNextAddress())
         
-        context.varsByAddress[address1] = Variable("var3", address1, Context())
+        context.addVariable(Variable("var3", address1, Context()))
         
         self.assertEqual(address3, context.getNextAddress())
         
-        del context.varsByAddress[address0]
+        context.removeAddress(address0)
         
         self.assertEqual(address0, context.getNextAddress())
     
@@ -53,19 +54,19 @@ class ContextTest(unittest.TestCase):
         
         self.assertEqual(address0, context.getNextAddress())
         
-        parent.varsByAddress[address0] = Variable("var1", address0, Context())
+        parent.addVariable(Variable("var1", address0, Context()))
         
         self.assertEqual(address1, context.getNextAddress())
         
-        parent.varsByAddress[address2] = Variable("var2", address2, Context())
+        parent.addVariable(Variable("var2", address2, Context()))
         
         self.assertEqual(address1, context.getNextAddress())
         
-        parent.varsByAddress[address1] = Variable("var3", address1, Context())
+        parent.addVariable(Variable("var3", address1, Context()))
         
         self.assertEqual(address3, context.getNextAddress())
         
-        del parent.varsByAddress[address0]
+        parent.removeAddress(address0)
         
         self.assertEqual(address0, context.getNextAddress())
     
@@ -125,6 +126,37 @@ class ContextTest(unittest.TestCase):
         
         self.assertFalse(result == context2.getVariable("var2"))
     
+class AddressAllocatorTest(unittest.TestCase):
+    def testAllocateHandsOutLowestFreeAddress(self):
+        allocator = AddressAllocator(0x2000, 0x2003)
+        
+        self.assertEqual([0x2000, 0x2001, 0x2002], [allocator.allocate() for i in range(3)])
+        
+        allocator.release(0x2001)
+        allocator.release(0x2000)
+        
+        self.assertEqual(0x2000, allocator.allocate())
+        self.assertEqual(0x2001, allocator.allocate())
+        self.assertEqual(0x2003, allocator.allocate())
+    
+    def testReserveSkipsAddressesUntilReleased(self):
+        allocator = AddressAllocator(0x2000, 0x7000)
+        
+        allocator.reserve(0x2002)
+        
+        self.assertTrue(allocator.isAllocated(0x2002))
+        self.assertFalse(allocator.isAllocated(0x2001))
+        self.assertEqual(0x2000, allocator.allocate())
+        self.assertEqual(0x2001, allocator.allocate())
+        self.assertEqual(0x2003, allocator.allocate())
+    
+    def testAllocateRaisesWhenExhausted(self):
+        allocator = AddressAllocator(0x2000, 0x2000)
+        
+        allocator.allocate()
+        
+        self.assertRaises(Exception, allocator.allocate)
+
 class ProgramTest(unittest.TestCase):
     def testGetUniqueId(self):
         program = Program()
@@ -139,3 +171,190 @@ class ProgramTest(unittest.TestCase):
         self.assertEqual("loop1", program.getUniqueTag("loop"))
         self.assertEqual("loop2", program.getUniqueTag("loop"))
         self.assertEqual("skip3", program.getUniqueTag("skip"))
+    
+    def testGetUniqueTagWithNamespace(self):
+        program = Program("start")
+        
+        self.assertEqual("start.if1", program.getUniqueTag("if"))
+    
+    def testVariablesNeverReuseTemporaryAddresses(self):
+        program = Program()
+        
+        temporary = program.getUniqueAddress()
+        program.removeAddress(temporary)
+        
+        self.assertNotEqual(temporary, program.getVariable("x").address)
+        self.assertEqual({"x" : toMemoryAddress(1)}, program.variables)
+        self.assertEqual(set([temporary]), program.temporaries)
+
+class ProducerTest(unittest.TestCase):
+    def testGenerateAppendsInstructionRecords(self):
+        instructions = generate("def start():\n    return 5\n")
+        
+        self.assertEqual([Label("start"), Instruction("set", A, Literal(5)), Instruction("set", PC, POP)], instructions)
+    
+    def testBoolOpEmitsEveryValue(self):
+        instructions = generate("def start():\n    x = 1 or 2\n", registers = False, fold = False, peephole = False, deadcode = False)
+        
+        self.assertTrue(Instruction("set", A, Literal(1)) in instructions)
+        self.assertTrue(Instruction("set", A, Literal(2)) in instructions)
+    
+    def testParseStreamsToOutput(self):
+        out = StringIO()
+        
+        parse("def start():\n    exit()\n", out)
+        
+        self.assertEqual(":start\nset PC, end\n", out.getvalue())
+
+class BranchTest(unittest.TestCase):
+    def testIfBranchesOnTheComparisonItself(self):
+        instructions = generate("def start():\n    if x == y:\n        z = 1\n", peephole = False, deadcode = False)
+        
+        self.assertEqual([Label("start"), Instruction("ifn", Memory(Address(toMemoryAddress(0))), Memory(Address(toMemoryAddress(1)))), Instruction("set", PC, LabelRef("start.if1end"))], instructions[:3])
+    
+    def testInclusiveComparisonWithConstantNeedsOneTest(self):
+        instructions = generate("def start():\n    if x < 384:\n        z = 1\n", peephole = False, deadcode = False)
+        
+        self.assertTrue(Instruction("ifg", Memory(Address(toMemoryAddress(0))), Literal(383)) in instructions)
+        self.assertEqual(1, len([i for i in instructions if isinstance(i, Instruction) and i.isConditional()]))
+    
+    def testConstantOnTheLeftIsMirrored(self):
+        instructions = generate("def start():\n    if 3 > x:\n        z = 1\n", peephole = False, deadcode = False)
+        
+        self.assertTrue(Instruction("ifg", Memory(Address(toMemoryAddress(0))), Literal(2)) in instructions)
+    
+    def testBoolOpShortCircuitsWithoutMaterializing(self):
+        instructions = generate("def start():\n    if x == 1 or not y != 2:\n        z = 1\n", peephole = False, deadcode = False)
+        
+        self.assertFalse(Instruction("set", A, Literal(1)) in instructions[:-3])
+        self.assertEqual(["ife", "ifn"], [i.opcode for i in instructions if isinstance(i, Instruction) and i.isConditional()])
+    
+    def testNotEqualIsSupported(self):
+        instructions = generate("def start():\n    x = y != 2\n", peephole = False, deadcode = False)
+        
+        self.assertTrue(Instruction("ifn", Memory(Address(toMemoryAddress(0))), Literal(2)) in instructions)
+    
+    def testWhileTestsAtTheBottom(self):
+        instructions = generate("def start():\n    while x < 5:\n        x = x + 1\n", peephole = False, deadcode = False)
+        
+        self.assertEqual([Instruction("set", PC, LabelRef("start.while1test")), Label("start.while1body")], instructions[1:3])
+        self.assertEqual([Instruction("ifl", Memory(Address(toMemoryAddress(0))), Literal(5)), Instruction("set", PC, LabelRef("start.while1body"))], instructions[-3:-1])
+    
+    def testComparedVariablesAreReadBeforeCallsFurtherRight(self):
+        lines = ["# expect: 0x%04x = 1" % (0x8000 + index,) for index in range(3)]
+        lines.extend(["def start():", "    r0 = 0", "    r1 = 0", "    r2 = 0"])
+        lines.extend(["    v = 5", "    if v > reset():", "        r0 = 1"])
+        lines.extend(["    v = 1", "    if v < bump() < 9:", "        r1 = 1"])
+        lines.extend(["    v = 1", "    if zero() < v < bump():", "        r2 = 1"])
+        lines.extend(["    SCREEN[0] = r0", "    SCREEN[1] = r1", "    SCREEN[2] = r2", "    end()", ""])
+        lines.extend(["def reset():", "    v = 0", "    return 3", ""])
+        lines.extend(["def bump():", "    v = 8", "    return 5", ""])
+        lines.extend(["def zero():", "    return 0", ""])
+        lines.extend(["def end():", "    exit()", ""])
+        source = "\n".join(lines)
+        
+        for level in sorted(OPTIMIZATION_LEVELS):
+            self.assertEqual([], runProgram("branch", source, **OPTIMIZATION_LEVELS[level]).failures, "at -O%d" % (level,))
+
+class StrengthReductionTest(unittest.TestCase):
+    def getOpcodes(self, expression):
+        instructions = generate("def start():\n    x = %s\n" % (expression,), peephole = False, deadcode = False)
+        return [(i.opcode, i.operands[1]) for i in instructions if isinstance(i, Instruction) and i.opcode != "set"]
+    
+    def testPowersOfTwoBecomeShiftsAndMasks(self):
+        self.assertEqual([("shl", Literal(3))], self.getOpcodes("y * 8"))
+        self.assertEqual([("shl", Literal(4))], self.getOpcodes("16 * y"))
+        self.assertEqual([("shr", Literal(1))], self.getOpcodes("y / 2"))
+        self.assertEqual([("and", Literal(31))], self.getOpcodes("y % 32"))
+    
+    def testOtherConstantsKeepTheirInstruction(self):
+        self.assertEqual([("mul", Literal(10))], self.getOpcodes("y * 10"))
+        self.assertEqual([("div", Literal(3))], self.getOpcodes("y / 3"))
+        self.assertEqual(("div", Memory(Address(toMemoryAddress(0)))), self.getOpcodes("8 / y")[0])
+    
+    def testUpdatesOfAVariableWorkInPlace(self):
+        instructions = generate("def start():\n    x = x + 1\n    x = x * 4\n", peephole = False, deadcode = False)
+        
+        self.assertEqual([Instruction("add", Memory(Address(toMemoryAddress(0))), Literal(1)), Instruction("shl", Memory(Address(toMemoryAddress(0))), Literal(2))], instructions[1:])
+
+class LinkTest(unittest.TestCase):
+    def testFunctionsShareVariablesByName(self):
+        instructions = generate("def start():\n    y = 1\n    x = 2\n\ndef f():\n    x = y\n", peephole = False, deadcode = False)
+        
+        self.assertEqual(Instruction("set", Memory(Address(toMemoryAddress(1))), A), instructions[4])
+        self.assertEqual(Instruction("set", A, Memory(Address(toMemoryAddress(0)))), instructions[6])
+    
+    def testTemporariesFollowNamedVariables(self):
+        instructions = generate("def start():\n    x = y - (z - w)\n", registers = False, peephole = False, deadcode = False)
+        
+        self.assertTrue(Instruction("set", Memory(Address(toMemoryAddress(4))), A) in instructions)
+    
+    def testLabelsAreNamespacedPerFunction(self):
+        instructions = generate("def start():\n    if x:\n        x = 1\n\ndef f():\n    if x:\n        x = 1\n")
+        
+        labels = [item.name for item in instructions if isinstance(item, Label)]
+        self.assertEqual(["start", "start.if1end", "f", "f.if1end"], labels)
+
+class ParallelGenerateTest(unittest.TestCase):
+    def render(self, instructions):
+        out = StringIO()
+        render(instructions, out)
+        return out.getvalue()
+    
+    def testOutputIsIdenticalForAnyWorkerCount(self):
+        source = generateSource(6, 8, 3, variables = 24)
+        
+        expected = self.render(generate(source))
+        
+        for workers in (2, 3, 8):
+            self.assertEqual(expected, self.render(generate(source, workers = workers)))
+    
+    def testMemoryTemporariesRelocateAcrossWorkers(self):
+        source = generateSource(4, 6, 3)
+        
+        self.assertEqual(self.render(generate(source, registers = False)), self.render(generate(source, registers = False, workers = 2)))
+
+class RegisterAllocationTest(unittest.TestCase):
+    def testBinOpKeepsTemporariesInRegisters(self):
+        instructions = generate("def start():\n    x = y - (z - w)\n", peephole = False, deadcode = False)
+        
+        self.assertTrue(Instruction("set", Register("b"), A) in instructions)
+        memoryWrites = [i for i in instructions if isinstance(i, Instruction) and isinstance(i.operands[0], Memory)]
+        self.assertEqual(1, len(memoryWrites))
+    
+    def testSpillsToMemoryUnderPressure(self):
+        expression = "v1"
+        for i in range(2, 11):
+            expression = "v%d - (%s)" % (i, expression)
+        
+        instructions = generate("def start():\n    x = %s\n" % (expression,), deadcode = False)
+        
+        self.assertTrue(any(isinstance(i.operands[0], Memory) for i in instructions if isinstance(i, Instruction) and i.opcode == "sub"))
+    
+    def testCallSavesLiveRegisters(self):
+        instructions = generate("def start():\n    x = y - f()\n")
+        
+        index = instructions.index(Instruction("jsr", LabelRef("f")))
+        self.assertEqual(Instruction("set", PUSH, Register("b")), instructions[index - 1])
+        self.assertEqual(Instruction("set", Register("b"), POP), instructions[index + 1])
+    
+    def testOperandsWithCallsKeepTheirOrder(self):
+        source = "# expect: 0x8000 = 10\ndef start():\n    a = 5\n    b = a * 1 + a * bump()\n    SCREEN[0] = b\n    end()\n\ndef bump():\n    a = a + 5\n    return 1\n\ndef end():\n    exit()\n"
+        
+        for options in [OPTIMIZATION_LEVELS[level] for level in sorted(OPTIMIZATION_LEVELS)] + [dict(registers = False)]:
+            self.assertEqual([], runProgram("order", source, **options).failures, repr(options))
+    
+    def testComparedVariablesAreReadBeforeCallsOnTheRight(self):
+        source = "# expect: 0x8000 = 1\ndef start():\n    a = 5\n    SCREEN[0] = a == reset()\n    end()\n\ndef reset():\n    a = 0\n    return 5\n\ndef end():\n    exit()\n"
+        
+        for level in sorted(OPTIMIZATION_LEVELS):
+            self.assertEqual([], runProgram("compare", source, **OPTIMIZATION_LEVELS[level]).failures, "at -O%d" % (level,))
+    
+    def testRegistersBeatMemoryTemporariesOnExample(self):
+        source = open("example.py").read()
+        
+        memoryWords, memoryCycles = measure(generate(source, False))
+        registerWords, registerCycles = measure(generate(source))
+        
+        self.assertTrue(registerWords < memoryWords)
+        self.assertTrue(registerCycles < memoryCycles)
@@ -0,0 +1,41 @@
+import subprocess
+import sys
+import threading
+import unittest
+from dcpu16.compiler_old import Compiler
+
+def getSource(value):
+    return "function start() { x = %d; SCREEN[0] = x + 1; exit(); }" % (value,)
+
+class CompilerTest(unittest.TestCase):
+    def testImportDoesNotLoadParser(self):
+        output = subprocess.check_output([sys.executable, "-c", "import sys, dcpu16.compiler_old; print 'ply' in sys.modules"])
+        
+        self.assertEqual("False", output.strip())
+    
+    def testEveryCompileStartsFromAFreshProgram(self):
+        compiler = Compiler()
+        source = "function start() { x = 1; if (x == 1) { y = x; } }"
+        
+        first = compiler.compile(source)
+        
+        self.assertTrue(":if1end" in first)
+        self.assertEqual(first, compiler.compile(source))
+        self.assertEqual(first, Compiler().compile(source))
+    
+    def testCompilesConcurrently(self):
+        compiler = Compiler()
+        expected = dict((value, compiler.compile(getSource(value))) for value in range(10, 30))
+        results = {}
+        
+        def run(value):
+            for i in range(20):
+                results[value, i] = compiler.compile(getSource(value))
+        threads = [threading.Thread(target = run, args = (value,)) for value in expected]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        for (value, i), assembly in results.iteritems():
+            self.assertEqual(expected[value], assembly)
@@ -0,0 +1,56 @@
+import ast
+import unittest
+from dcpu16.compiler import generate
+from dcpu16.deadcode import eliminateDeadCode
+from dcpu16.instructions import Label
+
+def getLabels(instructions):
+    return [item.name for item in instructions if isinstance(item, Label)]
+
+class DeadCodeTest(unittest.TestCase):
+    def eliminate(self, source):
+        tree, (eliminated, removed) = eliminateDeadCode(ast.parse(source))
+        return tree, removed
+    
+    def testDropsFunctionsUnreachableFromStart(self):
+        tree, removed = self.eliminate("def start():\n    f()\n    return 0\n\ndef f():\n    return 1\n\ndef g():\n    h()\n    return 2\n\ndef h():\n    g()\n    return 3\n")
+        
+        self.assertEqual(["start", "f"], [node.name for node in tree.body])
+        self.assertEqual(["g", "h"], removed)
+    
+    def testKeepsFunctionsReachedByFallingThrough(self):
+        tree, removed = self.eliminate("def start():\n    SCREEN[0] = 1\n\ndef f():\n    return 1\n")
+        
+        self.assertEqual([], removed)
+    
+    def testKeepsEndWhenExitIsCalled(self):
+        tree, removed = self.eliminate("def start():\n    exit()\n\ndef other():\n    return 1\n\ndef end():\n    exit()\n")
+        
+        self.assertEqual(["other"], removed)
+    
+    def testDropsStatementsAfterReturnAndExit(self):
+        tree, removed = self.eliminate("def start():\n    stop()\n    SCREEN[0] = 1\n\ndef stop():\n    if x:\n        exit()\n    else:\n        exit()\n    SCREEN[1] = 2\n")
+        
+        self.assertEqual(1, len(tree.body[0].body))
+        self.assertEqual(1, len(tree.body[1].body))
+    
+    def testDropsStatementsAfterLoopsThatNeverEnd(self):
+        endless, removed = self.eliminate("def start():\n    while 1:\n        SCREEN[0] = x\n    SCREEN[1] = 2\n")
+        broken, removed = self.eliminate("def start():\n    while 1:\n        if x:\n            break\n    SCREEN[1] = 2\n")
+        
+        self.assertEqual(1, len(endless.body[0].body))
+        self.assertEqual(2, len(broken.body[0].body))
+    
+    def testDropsStoresThatAreNeverRead(self):
+        tree, removed = self.eliminate("def start():\n    a = 1\n    b = a + 1\n    c = f()\n    if b:\n        d = 2\n    SCREEN[0] = b\n    return 0\n")
+        
+        self.assertEqual(["Assign", "Assign", "Expr", "Assign", "Return"], [type(node).__name__ for node in tree.body[0].body])
+    
+    def testReportsEliminatedWords(self):
+        source = "def start():\n    a = 5\n    SCREEN[0] = 1\n    end()\n    return 0\n\ndef unused():\n    return 3\n\ndef end():\n    exit()\n"
+        stats = {}
+        
+        instructions = generate(source, peephole = False, stats = stats)
+        
+        self.assertEqual(["start", "end"], getLabels(instructions))
+        self.assertEqual((7, ["unused"]), stats["deadcode"])
@@ -0,0 +1,77 @@
+import ast
+import unittest
+from dcpu16.benchmark import runProgram
+from dcpu16.compiler import generate
+from dcpu16.dispatch import getDispatchCases, chooseDispatch, CHAIN, TABLE, SEARCH
+from dcpu16.instructions import Instruction, Data, LabelRef, IndexedMemory, A, PC
+from dcpu16.passes import OPTIMIZATION_LEVELS
+
+LADDER = """
+def start():
+    if y == %d:
+        SCREEN[0] = 1
+    elif y == %d:
+        SCREEN[0] = 2
+    elif y == %d:
+        SCREEN[0] = 3
+    elif y == %d:
+        SCREEN[0] = 4
+    else:
+        SCREEN[0] = 5
+"""
+
+def getProgram(values, tested):
+    source = "# expect: 0x8000 = %d\n" + LADDER + "    end()\n\ndef end():\n    exit()\n"
+    expected = values.index(tested) + 1 if tested in values else 5
+    return (source % ((expected,) + tuple(values))).replace("def start():\n", "def start():\n    y = %d\n" % (tested,))
+
+class DispatchCasesTest(unittest.TestCase):
+    def getCases(self, source):
+        return getDispatchCases(ast.parse(source).body[0])
+    
+    def testFollowsEqualityTestsOnOneName(self):
+        name, cases, orelse = self.getCases("if y == 1:\n    a = 1\nelif 2 == y:\n    a = 2\nelif y == -1:\n    a = 3\nelif y == 2:\n    a = 4\nelse:\n    a = 5\n")
+        
+        self.assertEqual("y", name)
+        self.assertEqual([1, 2, 0xffff], [value for value, body in cases])
+        self.assertEqual(5, orelse[0].value.n)
+    
+    def testStopsAtAnotherKindOfTest(self):
+        name, cases, orelse = self.getCases("if y == 1:\n    a = 1\nelif y == 2:\n    a = 2\nelif y == 3:\n    a = 3\nelif x == 4:\n    a = 4\n")
+        
+        self.assertEqual(3, len(cases))
+        self.assertTrue(isinstance(orelse[0], ast.If))
+    
+    def testLeavesShortLaddersAlone(self):
+        self.assertEqual(None, self.getCases("if y == 1:\n    a = 1\nelif y == 2:\n    a = 2\n"))
+        self.assertEqual(None, self.getCases("if y < 1:\n    a = 1\nelif y == 2:\n    a = 2\nelif y == 3:\n    a = 3\n"))
+
+class ChooseDispatchTest(unittest.TestCase):
+    def testDenseValuesUseATable(self):
+        self.assertEqual(TABLE, chooseDispatch(range(10)))
+        self.assertEqual(TABLE, chooseDispatch([3, 5, 7, 8]))
+    
+    def testSparseValuesUseABinarySearch(self):
+        self.assertEqual(SEARCH, chooseDispatch([1, 40, 300, 1000, 2000, 5000]))
+    
+    def testFewSparseValuesKeepTheChain(self):
+        self.assertEqual(CHAIN, chooseDispatch([1, 300, 5000]))
+
+class DispatchCodeTest(unittest.TestCase):
+    def testDenseLaddersJumpThroughATable(self):
+        instructions = generate(LADDER % (4, 5, 6, 7), deadcode = False)
+        
+        self.assertTrue(Instruction("set", PC, IndexedMemory(A, LabelRef("start.switch1table"))) in instructions)
+        self.assertEqual([Data(LabelRef("start.switch1case0"), LabelRef("start.switch1case1"), LabelRef("start.switch1case2"), LabelRef("start.switch1case3"))], [i for i in instructions if isinstance(i, Data)])
+    
+    def testDisabledDispatchKeepsTheChain(self):
+        instructions = generate(LADDER % (4, 5, 6, 7), deadcode = False, dispatch = False)
+        
+        self.assertEqual([], [i for i in instructions if isinstance(i, Data)])
+    
+    def testEveryLevelPicksTheRightCase(self):
+        for values in [(1, 2, 3, 5), (0, 1, 2, 3), (3, 300, 7, 0xffff), (9, 8, 7, 6)]:
+            for tested in set(values) | set([0, 4, 10, 299, 0xfffe]):
+                source = getProgram(list(values), tested)
+                for level in sorted(OPTIMIZATION_LEVELS):
+                    self.assertEqual([], runProgram("dispatch", source, **OPTIMIZATION_LEVELS[level]).failures, "%r == %d at -O%d" % (values, tested, level))
@@ -0,0 +1,109 @@
+import unittest
+from dcpu16.emulator import Emulator
+
+def encode(opcode, b, a):
+    return opcode | (b << 5) | (a << 10)
+
+def literal(value):
+    return 0x21 + value
+
+SET, ADD, SUB, MUL, DIV, SHL, IFE, IFN = 0x01, 0x02, 0x03, 0x04, 0x06, 0x0f, 0x12, 0x13
+A, B, PC, POP, PUSH, NEXT_WORD, NEXT_WORD_ADDRESS = 0x00, 0x01, 0x1c, 0x18, 0x18, 0x1f, 0x1e
+JSR = 0x01
+
+def halt(address):
+    return [encode(SET, PC, literal(address))]
+
+class EmulatorTest(unittest.TestCase):
+    def testArithmeticAndOverflow(self):
+        emulator = Emulator([
+            encode(SET, A, NEXT_WORD), 0xffff,
+            encode(ADD, A, literal(2)),
+            encode(SET, B, 0x1d),
+            encode(MUL, A, literal(30)),
+        ] + halt(5))
+        
+        self.assertTrue(emulator.run())
+        self.assertEqual(30, emulator.getRegister("a"))
+        self.assertEqual(1, emulator.getRegister("b"))
+    
+    def testDivisionByZeroYieldsZero(self):
+        emulator = Emulator([encode(SET, A, literal(7)), encode(DIV, A, literal(0))] + halt(2))
+        
+        emulator.run()
+        
+        self.assertEqual(0, emulator.getRegister("a"))
+    
+    def testCountsCyclesAndInstructions(self):
+        emulator = Emulator([
+            encode(SET, A, literal(0)),
+            encode(ADD, A, literal(1)),
+            encode(IFN, A, NEXT_WORD), 100,
+            encode(SET, PC, literal(1)),
+        ] + halt(5))
+        
+        emulator.run()
+        
+        self.assertEqual(100, emulator.getRegister("a"))
+        self.assertEqual(1 + 100 * 2 + 100 * 3 + 99 * 1 + 1 + 1, emulator.cycles)
+        self.assertEqual(1 + 100 + 100 + 99 + 1, emulator.instructionCount)
+    
+    def testFailedConditionSkipsChainedConditionals(self):
+        emulator = Emulator([
+            encode(IFE, A, literal(1)),
+            encode(IFE, A, literal(0)),
+            encode(SET, B, literal(5)),
+            encode(SET, B, literal(7)),
+        ] + halt(4))
+        
+        emulator.run()
+        
+        self.assertEqual(7, emulator.getRegister("b"))
+        self.assertEqual(2 + 2 + 1 + 1, emulator.cycles)
+    
+    def testSubroutineCallAndReturn(self):
+        emulator = Emulator([
+            encode(0, JSR, literal(3)),
+            encode(SET, B, A),
+        ] + halt(2) + [
+            encode(SET, A, literal(9)),
+            encode(SET, PC, POP),
+        ])
+        
+        emulator.run()
+        
+        self.assertEqual(9, emulator.getRegister("b"))
+        self.assertEqual(0, emulator.getRegister("sp"))
+        self.assertEqual(1, emulator.memoryReads)
+        self.assertEqual(1, emulator.memoryWrites)
+    
+    def testMemoryOperandsCountTraffic(self):
+        emulator = Emulator([
+            encode(SET, NEXT_WORD_ADDRESS, literal(3)), 0x2000,
+            encode(ADD, NEXT_WORD_ADDRESS, literal(4)), 0x2000,
+            encode(SET, A, NEXT_WORD_ADDRESS), 0x2000,
+        ] + halt(6))
+        
+        emulator.run()
+        
+        self.assertEqual(7, emulator.getRegister("a"))
+        self.assertEqual(7, emulator.memory[0x2000])
+        self.assertEqual(2, emulator.memoryReads)
+        self.assertEqual(2, emulator.memoryWrites)
+    
+    def testSelfModifyingCodeIsRedecoded(self):
+        emulator = Emulator([
+            encode(SET, A, literal(1)),
+            encode(SET, NEXT_WORD_ADDRESS, NEXT_WORD), encode(SET, A, literal(2)), 0,
+            encode(SET, PC, literal(0)),
+        ])
+        
+        emulator.run(4)
+        
+        self.assertEqual(2, emulator.getRegister("a"))
+    
+    def testRunStopsAfterMaxInstructions(self):
+        emulator = Emulator(halt(1) + halt(0))
+        
+        self.assertFalse(emulator.run(10))
+        self.assertEqual(10, emulator.instructionCount)
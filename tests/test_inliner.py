@@ -0,0 +1,85 @@
+import ast
+import unittest
+from dcpu16.benchmark import runProgram
+from dcpu16.compiler import generate
+from dcpu16.inliner import inlineFunctions
+from dcpu16.instructions import Instruction
+from dcpu16.passes import OPTIMIZATION_LEVELS
+
+END = "\ndef end():\n    exit()\n"
+
+def getCallees(instructions):
+    return [i.operands[0].value for i in instructions if isinstance(i, Instruction) and i.opcode == "jsr"]
+
+class InlinerTest(unittest.TestCase):
+    def inline(self, source, maxGrowth = 16):
+        tree, (inlined, removed) = inlineFunctions(ast.parse(source), maxGrowth)
+        return [node.name for node in tree.body if isinstance(node, ast.FunctionDef)], inlined, removed
+    
+    def testInlinesLeafAndRemovesIt(self):
+        names, inlined, removed = self.inline("def start():\n    x = double(3)\n\ndef double(n):\n    return n + n\n")
+        
+        self.assertEqual(["start"], names)
+        self.assertEqual((1, ["double"]), (inlined, removed))
+    
+    def testKeepsRecursiveFunctions(self):
+        names, inlined, removed = self.inline("def start():\n    f()\n\ndef f():\n    x = x + 1\n    if x < 3:\n        f()\n")
+        
+        self.assertEqual(["start", "f"], names)
+        self.assertEqual(0, inlined)
+    
+    def testRespectsGrowthBudget(self):
+        source = "def start():\n    f()\n    f()\n    f()\n\ndef f():\n    x = y * 3 + z\n    y = x - 1\n    return 0\n"
+        
+        self.assertEqual(["start", "f"], self.inline(source, 0)[0])
+        self.assertEqual(["start"], self.inline(source, 64)[0])
+    
+    def testNeverRemovesEntryPoints(self):
+        names, inlined, removed = self.inline("def start():\n    end()\n\ndef end():\n    x = 1\n    exit()\n")
+        
+        self.assertEqual(["start", "end"], names)
+        self.assertEqual(1, inlined)
+    
+    def testKeepsCallsToFunctionsThatFallThrough(self):
+        source = "# expect: 0x8000 = 7\n# expect: 0x8003 = 9\ndef start():\n    q = 7\n    f()\n    SCREEN[0] = q\n    end()\n\ndef f():\n    a = 1\n\ndef g():\n    b = 9\n    SCREEN[3] = b\n    return 0\n" + END
+        
+        for level in sorted(OPTIMIZATION_LEVELS):
+            self.assertEqual([], runProgram("fall_through", source, **OPTIMIZATION_LEVELS[level]).failures, "at -O%d" % (level,))
+    
+    def testHoistsCallOutOfExpression(self):
+        source = "# expect: 0x8000 = 9\ndef start():\n    x = 2\n    SCREEN[0] = twice(x) + 5\n    end()\n\ndef twice(n):\n    n = n * 2\n    return n\n" + END
+        
+        result = runProgram("hoist", source)
+        
+        self.assertEqual([], result.failures)
+        self.assertEqual([], getCallees(generate(source)))
+    
+    def testArgumentsWrittenByNestedCallsAreBound(self):
+        source = "# expect: 0x8000 = 2\n# expect: 0x8001 = 1\ndef start():\n    x = 1\n    n = 0\n    y = twice(x)\n    SCREEN[0] = y\n    SCREEN[1] = n\n    end()\n\ndef twice(n):\n    bump()\n    return n + n\n\ndef bump():\n    x = x + 6\n    if x == 0:\n        bump()\n    return 0\n" + END
+        
+        for level in sorted(OPTIMIZATION_LEVELS):
+            self.assertEqual([], runProgram("bound", source, **OPTIMIZATION_LEVELS[level]).failures, "at -O%d" % (level,))
+    
+    def testKeepsCallsAfterReadsOfWhatTheyWrite(self):
+        source = "# expect: 0x8000 = 2\ndef start():\n    x = 1\n    y = x + bump(x)\n    SCREEN[0] = y\n    end()\n\ndef bump(n):\n    x = 10\n    return n\n" + END
+        
+        for level in sorted(OPTIMIZATION_LEVELS):
+            self.assertEqual([], runProgram("hoist", source, **OPTIMIZATION_LEVELS[level]).failures, "at -O%d" % (level,))
+    
+    def testInlinedCodeMatchesCalledCode(self):
+        source = open("benchmarks/programs/call_chain.py").read()
+        
+        inlined = runProgram("inline", source)
+        called = runProgram("call", source, inline = False)
+        
+        self.assertEqual([], inlined.failures + called.failures)
+        self.assertTrue(inlined.metrics["cycles"] < called.metrics["cycles"])
+
+class ArgumentTest(unittest.TestCase):
+    def testCallsBindArguments(self):
+        source = "# expect: 0x8000 = 7\n# expect: 0x8001 = 3\ndef start():\n    a = 3\n    b = 4\n    f(b, a)\n    end()\n\ndef f(a, b):\n    SCREEN[0] = a + b\n    SCREEN[1] = b\n" + END
+        
+        result = runProgram("arguments", source, inline = False)
+        
+        self.assertEqual([], result.failures)
+        self.assertEqual(["f", "end"], getCallees(generate(source, inline = False)))
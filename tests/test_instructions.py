@@ -0,0 +1,34 @@
+import unittest
+from StringIO import StringIO
+from dcpu16.instructions import Instruction, Label, Register, Literal, Address, LabelRef, Memory, A, PC, POP, measure, render
+
+class InstructionTest(unittest.TestCase):
+    def testRegisterOperandsTakeOneWord(self):
+        instruction = Instruction("add", A, Register("b"))
+        
+        self.assertEqual(1, instruction.words())
+        self.assertEqual(2, instruction.cycles())
+    
+    def testShortLiteralOnlyFitsInOperandA(self):
+        self.assertEqual(1, Instruction("set", A, Literal(30)).words())
+        self.assertEqual(2, Instruction("set", A, Literal(31)).words())
+        self.assertEqual(2, Instruction("ife", Literal(1), A).words())
+    
+    def testMemoryOperandsCostAWordAndACycle(self):
+        instruction = Instruction("set", Memory(Address(0x2000)), Memory(Address(0x2001)))
+        
+        self.assertEqual(3, instruction.words())
+        self.assertEqual(3, instruction.cycles())
+        self.assertEqual(1, Instruction("set", Memory(A), A).words())
+    
+    def testMeasureSkipsLabels(self):
+        instructions = [Label("start"), Instruction("jsr", LabelRef("end")), Instruction("set", PC, POP)]
+        
+        self.assertEqual((3, 5), measure(instructions))
+    
+    def testRenderFormatsAddressesAsHex(self):
+        out = StringIO()
+        
+        render([Instruction("set", Memory(Address(0x2000)), A)], out)
+        
+        self.assertEqual("set [0x2000], a\n", out.getvalue())
@@ -0,0 +1,55 @@
+import unittest
+from dcpu16.compiler import generate
+from dcpu16.benchmark import runProgram
+from dcpu16.instructions import Instruction, Address, Literal, Memory, A
+
+def getWrittenAddresses(instructions):
+    return set(i.operands[0].value.value for i in instructions if isinstance(i, Instruction) and i.opcode == "set" and isinstance(i.operands[0], Memory) and isinstance(i.operands[0].value, Address))
+
+class SlotSharingTest(unittest.TestCase):
+    def testSequentialLocalsShareOneWord(self):
+        source = "def start():\n    a = 1\n    b = a + 2\n    c = b * 3\n    result = c\n"
+        stats = {}
+        
+        instructions = generate(source, stats = stats, deadcode = False)
+        
+        self.assertEqual(1, len(getWrittenAddresses(instructions)))
+        self.assertEqual((1, 4, {"start" : 1}), stats["memory"])
+    
+    def testDisabledSharingKeepsOneWordPerVariable(self):
+        source = "def start():\n    a = 1\n    b = a + 2\n    c = b * 3\n    result = c\n"
+        
+        self.assertEqual(4, len(getWrittenAddresses(generate(source, share = False, deadcode = False))))
+    
+    def testValuesLiveAcrossCallsAvoidCalleeSlots(self):
+        source = "def start():\n    a = 5\n    f()\n    result = a\n\ndef f():\n    b = 7\n    out = b + 1\n"
+        
+        instructions = generate(source, peephole = False, deadcode = False)
+        
+        start = instructions.index(Instruction("set", A, Literal(5))) + 1
+        f = instructions.index(Instruction("set", A, Literal(7))) + 1
+        self.assertNotEqual(instructions[start].operands[0], instructions[f].operands[0])
+        self.assertEqual(2, len(getWrittenAddresses(instructions)))
+    
+    def testValuesLiveOnEntryKeepTheirOwnWord(self):
+        source = "def start():\n    count = count + 1\n    temp = 2\n    out = temp\n"
+        stats = {}
+        
+        generate(source, stats = stats, deadcode = False)
+        
+        self.assertEqual(2, stats["memory"][0])
+    
+    def testMemoryTemporariesSurviveCalls(self):
+        source = open("benchmarks/programs/call_chain.py").read()
+        
+        self.assertEqual([], runProgram("call_chain", source, registers = False).failures)
+    
+    def testMemoryTemporariesSurviveCallsWithoutSharing(self):
+        source = "# expect: 0x8000 = 2\ndef start():\n    a = 5\n    SCREEN[0] = a - f()\n    end()\n\ndef f():\n    return 3 - (a - 5)\n\ndef end():\n    exit()\n"
+        
+        self.assertEqual([], runProgram("no_sharing", source, registers = False, share = False, inline = False).failures)
+    
+    def testValuesLiveAcrossCallsAvoidSlotsOfCodeCalleesFallInto(self):
+        source = "# expect: 0x8000 = 7\ndef start():\n    q = 7\n    f()\n    SCREEN[0] = q\n    end()\n\ndef f():\n    a = 1\n\ndef g():\n    b = 9\n    return b\n\ndef end():\n    exit()\n"
+        
+        self.assertEqual([], runProgram("fall_through", source, inline = False).failures)
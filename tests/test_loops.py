@@ -0,0 +1,206 @@
+import ast
+import unittest
+from dcpu16.benchmark import runProgram
+from dcpu16.compiler import generate
+from dcpu16.loops import optimizeLoops
+from dcpu16.passes import OPTIMIZATION_LEVELS
+
+def wrapProgram(body, expectations):
+    lines = ["# expect: 0x%04x = %d" % (0x8000 + index, value) for index, value in enumerate(expectations)]
+    lines.append("def start():")
+    lines.extend("    " + line for line in body.strip("\n").split("\n"))
+    lines.extend("    SCREEN[%d] = r%d" % (index, index) for index in range(len(expectations)))
+    lines.extend(["    end()", "", "def end():", "    exit()", ""])
+    return "\n".join(lines)
+
+class LoopOptimizerTest(unittest.TestCase):
+    def optimize(self, source, hoist = True, unroll = False):
+        tree, counts = optimizeLoops(ast.parse(source), hoist, unroll)
+        return tree.body[0].body, counts
+    
+    def testHoistsInvariantExpressions(self):
+        body, (hoisted, reduced, unrolled) = self.optimize("def f():\n    while i < n * 2:\n        i = i + n * 2\n")
+        
+        self.assertEqual(1, hoisted)
+        self.assertEqual(["f.invariant1"], [target.id for target in body[0].targets])
+        self.assertEqual("f.invariant1", body[1].test.comparators[0].id)
+        self.assertEqual("f.invariant1", body[1].body[0].value.right.id)
+    
+    def testKeepsExpressionsTheLoopChanges(self):
+        for source in ["def f():\n    while i < 8:\n        n = n + 1\n        i = i + n * 2\n",
+                       "def f():\n    while i < 8:\n        i = i + n * 2\n        g()\n",
+                       "def f():\n    while i < 8:\n        n[0] = i\n        i = i + n * 2\n"]:
+            body, (hoisted, reduced, unrolled) = self.optimize(source)
+            
+            self.assertEqual(0, hoisted)
+            self.assertEqual(1, len(body))
+    
+    def testReducesRepeatedProductsOfTheLoopVariable(self):
+        body, (hoisted, reduced, unrolled) = self.optimize("def f():\n    for i in range(1, n):\n        SCREEN[i * 10] = i * 10 + 1\n")
+        
+        self.assertEqual(1, reduced)
+        self.assertEqual("f.induction1", body[0].targets[0].id)
+        self.assertEqual(["f.induction1"], [target.id for target in body[1].body[0].targets])
+        self.assertFalse("Mult" in ast.dump(body[1].body[1]))
+    
+    def testKeepsASingleCheapProduct(self):
+        body, (hoisted, reduced, unrolled) = self.optimize("def f():\n    for i in range(n):\n        SCREEN[i * 8] = 1\n")
+        
+        self.assertEqual(0, reduced)
+    
+    def testUnrollsShortLoopsWithinTheBudget(self):
+        body, (hoisted, reduced, unrolled) = self.optimize("def f():\n    for i in range(3):\n        SCREEN[i] = x\n", unroll = True)
+        
+        self.assertEqual(1, unrolled)
+        self.assertEqual([0, 1, 2], [statement.targets[0].slice.value.n for statement in body[:3]])
+        self.assertEqual(2, body[3].value.n)
+    
+    def testKeepsLoopsTooLongOrWithJumps(self):
+        for source in ["def f():\n    for i in range(40):\n        SCREEN[i] = x\n",
+                       "def f():\n    for i in range(12):\n        SCREEN[i] = x + y * z - w\n",
+                       "def f():\n    for i in range(3):\n        if x:\n            break\n"]:
+            body, (hoisted, reduced, unrolled) = self.optimize(source, hoist = False, unroll = True)
+            
+            self.assertEqual(0, unrolled)
+
+class LoopProgramTest(unittest.TestCase):
+    def assertRunsAtEveryLevel(self, body, expectations, functions = ""):
+        source = wrapProgram(body, expectations) + functions
+        for registers in (True, False):
+            for level in sorted(OPTIMIZATION_LEVELS):
+                options = dict(OPTIMIZATION_LEVELS[level], registers = registers)
+                self.assertEqual([], runProgram("loop", source, **options).failures, "at -O%d with registers = %s" % (level, registers))
+    
+    def testWhileLoops(self):
+        self.assertRunsAtEveryLevel("""
+r0 = 0
+while r0 < 10:
+    r0 = r0 + 3
+r1 = 5
+while r1 > 9:
+    r1 = 0
+else:
+    r1 = r1 + 1
+""", [12, 6])
+    
+    def testRangeLoopsLeaveTheLastValue(self):
+        self.assertRunsAtEveryLevel("""
+r0 = 0
+for i in range(5):
+    r0 = r0 + i
+r1 = i
+r2 = 0
+for j in range(10, 0, -3):
+    r2 = r2 + j
+r3 = j
+""", [10, 4, 22, 1])
+    
+    def testNegativeBoundsCountAsInPython(self):
+        self.assertRunsAtEveryLevel("""
+r0 = 0
+for i in range(0, -1, -1):
+    r0 = r0 + 1
+r1 = 0
+for j in range(2, -3, -2):
+    r1 = r1 + 1
+r2 = 0
+for k in range(-2, 1):
+    r2 = r2 + 1
+""", [1, 3, 3])
+    
+    def testRangeLoopsWithRuntimeBounds(self):
+        self.assertRunsAtEveryLevel("""
+n = 7
+r0 = 0
+for i in range(2, n):
+    r0 = r0 + i
+r1 = 0
+for i in range(n, 2):
+    r1 = r1 + 1
+r2 = 0
+for i in range(n, 0, -2):
+    r2 = r2 + i
+r3 = 0
+for i in range(1, n, 3):
+    r3 = r3 + i
+""", [20, 0, 16, 5])
+    
+    def testRuntimeBoundsCountSignedLikeConstantOnes(self):
+        self.assertRunsAtEveryLevel("""
+r0 = 0
+for i in range(-3, 2):
+    r0 = r0 + 1
+n = -3
+r1 = 0
+for i in range(n, 2):
+    r1 = r1 + 1
+m = 2
+r2 = 0
+for i in range(m, n, -1):
+    r2 = r2 + 1
+r3 = 0
+for i in range(n, m, 2):
+    r3 = r3 + 1
+""", [5, 5, 5, 3])
+    
+    def testBoundsAreReadInOrderAroundCalls(self):
+        self.assertRunsAtEveryLevel("""
+v = 2
+r0 = 0
+for i in range(v, bump()):
+    r0 = r0 + 1
+v = 2
+r1 = 0
+for i in range(bump(), v + 8):
+    r1 = r1 + 1
+""", [4, 6], "def bump():\n    v = 4\n    return 6\n")
+    
+    def testBreakContinueAndElse(self):
+        self.assertRunsAtEveryLevel("""
+r0 = 0
+for i in range(10):
+    if i == 6:
+        break
+    if i % 2 == 1:
+        continue
+    r0 = r0 + i
+else:
+    r0 = 100
+r1 = 0
+while r1 < 4:
+    r1 = r1 + 1
+else:
+    r1 = r1 + 10
+r2 = i
+""", [6, 14, 6])
+    
+    def testBodiesWritingTheVariableStillStepThroughTheRange(self):
+        self.assertRunsAtEveryLevel("""
+r0 = 0
+for i in range(4):
+    r0 = r0 + i
+    i = i * 10
+r1 = i
+""", [6, 30])
+    
+    def testNestedLoopsWithInvariantsAndProducts(self):
+        self.assertRunsAtEveryLevel("""
+r0 = 0
+base = 3
+for row in range(4):
+    for column in range(5):
+        r0 = r0 + row * 7 + base * 2 + column + row * 7
+r1 = row * 7
+""", [580, 21])
+
+class ForLoopCodeTest(unittest.TestCase):
+    def testCountsDownToZero(self):
+        instructions = [str(i) for i in generate("def start():\n    for i in range(n):\n        SCREEN[i] = 1\n", deadcode = False)]
+        
+        self.assertTrue("ifn b, 0" in instructions)
+        self.assertTrue("sub b, 1" in instructions)
+    
+    def testRejectsLoopsOverAnythingButRange(self):
+        self.assertRaises(Exception, generate, "def start():\n    for i in items:\n        x = i\n")
+        self.assertRaises(Exception, generate, "def start():\n    for i in range(0, 8, n):\n        x = i\n")
+        self.assertRaises(Exception, generate, "def start():\n    for i in range(-1, 70000):\n        x = i\n")
@@ -0,0 +1,259 @@
+import unittest
+from dcpu16.compiler import generate
+import StringIO
+from dcpu16.benchmark import runProgram
+from dcpu16.instructions import Instruction, Label, Data, LabelRef, Literal, Address, Memory, IndexedMemory, Register, A, PC, POP
+from dcpu16.passes import PassManager, OPTIMIZATION_LEVELS, buildBlocks, removeUnreachableBlocks, threadJumps
+from dcpu16.valuenumbering import numberValues, getReadRegisters
+
+B = Register("b")
+X = Memory(Address(0x2000))
+Y = Memory(Address(0x2001))
+
+def diamond():
+    return buildBlocks("f", [
+        Label("f"),
+        Instruction("ife", A, Literal(1)),
+        Instruction("set", PC, LabelRef("f.else")),
+        Instruction("set", A, Literal(2)),
+        Instruction("set", PC, LabelRef("f.end")),
+        Label("f.else"),
+        Instruction("set", A, Literal(3)),
+        Label("f.end"),
+        Instruction("set", PC, POP),
+    ])
+
+class BasicBlockTest(unittest.TestCase):
+    def testBlocksFlattenToTheSameInstructions(self):
+        instructions = generate(open("example.py").read(), **OPTIMIZATION_LEVELS[0])
+        
+        function = buildBlocks("start", instructions)
+        
+        self.assertEqual(instructions, function.flatten())
+        self.assertTrue(len(function.blocks) > 1)
+    
+    def testLabelsStartAndJumpsEndBlocks(self):
+        function = buildBlocks("f", [
+            Label("f"),
+            Instruction("ife", A, Literal(1)),
+            Instruction("set", PC, LabelRef("f.end")),
+            Instruction("set", A, Literal(2)),
+            Label("f.end"),
+            Instruction("set", PC, POP),
+        ])
+        
+        self.assertEqual([["f"], [], ["f.end"]], [block.labels for block in function.blocks])
+        self.assertEqual([2, 1], function.getSuccessors(0))
+        self.assertTrue(function.blocks[0].fallsThrough())
+        self.assertFalse(function.blocks[2].fallsThrough())
+    
+    def testFindsImmediateDominators(self):
+        function = diamond()
+        
+        self.assertEqual([None, 0, 0, 0], function.getImmediateDominators())
+        self.assertEqual([[], [0], [0], [1, 2]], function.getPredecessors())
+
+class PassTest(unittest.TestCase):
+    def testThreadsJumpsThroughJumpOnlyBlocks(self):
+        function = buildBlocks("f", [
+            Label("f"),
+            Instruction("ife", A, Literal(1)),
+            Instruction("set", PC, LabelRef("f.a")),
+            Instruction("set", A, Literal(2)),
+            Label("f.a"),
+            Instruction("set", PC, LabelRef("f.b")),
+            Label("f.b"),
+            Instruction("set", PC, POP),
+        ])
+        
+        threadJumps(function)
+        
+        self.assertEqual(Instruction("set", PC, POP), function.blocks[0].instructions[1])
+    
+    def testRemovesBlocksNothingReaches(self):
+        function = buildBlocks("f", [
+            Label("f"),
+            Instruction("set", PC, LabelRef("f.b")),
+            Label("f.a"),
+            Instruction("set", A, Literal(2)),
+            Label("f.b"),
+            Instruction("set", PC, POP),
+            Label("g"),
+            Instruction("set", PC, POP),
+        ])
+        
+        removeUnreachableBlocks(function)
+        
+        self.assertEqual([["f"], ["f.b"], ["g"]], [block.labels for block in function.blocks])
+    
+    def testKeepsBlocksReachedThroughAJumpTable(self):
+        function = buildBlocks("f", [
+            Label("f"),
+            Instruction("set", PC, IndexedMemory(A, LabelRef("f.table"))),
+            Label("f.table"),
+            Data(LabelRef("f.b"), LabelRef("f.b")),
+            Label("f.a"),
+            Instruction("set", A, Literal(2)),
+            Label("f.b"),
+            Instruction("set", PC, POP),
+        ])
+        
+        self.assertEqual([1], function.getSuccessors(0))
+        self.assertEqual([3, 3], function.getSuccessors(1))
+        
+        removeUnreachableBlocks(function)
+        
+        self.assertEqual([["f"], ["f.table"], ["f.b"]], [block.labels for block in function.blocks])
+    
+    def testManagerRecordsEveryPass(self):
+        manager = PassManager(("thread-jumps", "unreachable-blocks"))
+        
+        manager.optimize("f", [Label("f"), Instruction("set", PC, POP), Label("f.dead"), Instruction("set", A, Literal(1))])
+        
+        self.assertEqual(["thread-jumps", "unreachable-blocks"], [record.name for record in manager.records])
+        self.assertEqual((2, 1), (manager.records[1].before, manager.records[1].after))
+    
+    def testRejectsUnknownPasses(self):
+        self.assertRaises(Exception, PassManager, ("no-such-pass",))
+
+class ValueNumberingTest(unittest.TestCase):
+    def optimize(self, instructions):
+        return numberValues(buildBlocks("f", [Label("f")] + instructions)).flatten()[1:]
+    
+    def testReusesARepeatedComputation(self):
+        instructions = self.optimize([
+            Instruction("set", A, X),
+            Instruction("mul", A, Y),
+            Instruction("set", B, A),
+            Instruction("set", A, Y),
+            Instruction("mul", A, X),
+            Instruction("add", B, A),
+            Instruction("set", PC, POP),
+        ])
+        
+        self.assertEqual([
+            Instruction("set", A, X),
+            Instruction("mul", A, Y),
+            Instruction("set", B, A),
+            Instruction("set", A, B),
+            Instruction("add", B, A),
+            Instruction("set", PC, POP),
+        ], instructions)
+    
+    def testReusesALoadFromARegister(self):
+        instructions = self.optimize([
+            Instruction("set", A, X),
+            Instruction("set", B, Literal(1)),
+            Instruction("add", B, A),
+            Instruction("set", A, X),
+            Instruction("add", A, X),
+            Instruction("set", PC, POP),
+        ])
+        
+        self.assertEqual(Instruction("add", A, A), instructions[3])
+        self.assertEqual(5, len(instructions))
+    
+    def testCallsAndStoresThroughPointersForgetMemory(self):
+        for clobber in [Instruction("jsr", LabelRef("g")), Instruction("set", Memory(B), Literal(1))]:
+            instructions = self.optimize([
+                Instruction("set", A, X),
+                Instruction("set", Y, A),
+                clobber,
+                Instruction("set", A, X),
+                Instruction("set", PC, POP),
+            ])
+            
+            self.assertEqual(5, len(instructions))
+    
+    def testStoresToTheScreenKeepMemory(self):
+        instructions = self.optimize([
+            Instruction("set", A, X),
+            Instruction("set", Y, A),
+            Instruction("set", B, Address(0x8000)),
+            Instruction("set", Memory(B), Literal(1)),
+            Instruction("set", A, X),
+            Instruction("set", PC, POP),
+        ])
+        
+        self.assertEqual(5, len(instructions))
+    
+    def testLeavesInstructionsBehindTestsInPlace(self):
+        instructions = self.optimize([
+            Instruction("set", A, X),
+            Instruction("ife", Y, Literal(1)),
+            Instruction("set", A, X),
+            Instruction("set", PC, POP),
+        ])
+        
+        self.assertEqual(4, len(instructions))
+    
+    def testReusesValuesFromADominatingBlock(self):
+        function = numberValues(buildBlocks("f", [
+            Label("f"),
+            Instruction("set", B, X),
+            Instruction("mul", B, Y),
+            Instruction("ife", A, Literal(1)),
+            Instruction("set", PC, LabelRef("f.else")),
+            Instruction("set", A, X),
+            Instruction("mul", A, Y),
+            Instruction("set", PC, LabelRef("f.end")),
+            Label("f.else"),
+            Instruction("set", B, Literal(3)),
+            Label("f.end"),
+            Instruction("set", A, X),
+            Instruction("mul", A, Y),
+            Instruction("set", PC, POP),
+        ]))
+        
+        self.assertEqual([Instruction("set", A, B), Instruction("set", PC, LabelRef("f.end"))], function.blocks[1].instructions)
+        self.assertEqual([Instruction("set", A, X), Instruction("mul", A, Y), Instruction("set", PC, POP)], function.blocks[3].instructions)
+    
+    def testKeepsTheProgramsResults(self):
+        source = "\n".join([
+            "# expect: 0x8001 = 40",
+            "# expect: 0x8000 = 7",
+            "def start():",
+            "    a = 4",
+            "    b = 5",
+            "    y = 2",
+            "    SCREEN[y - 1] = a * b + a * b",
+            "    if y == 1:",
+            "        SCREEN[0] = 1",
+            "    elif y == 2:",
+            "        SCREEN[0] = a + 3",
+            "    end()",
+            "def end():",
+            "    exit()",
+        ])
+        
+        self.assertEqual([], runProgram("cse", source).failures)
+    
+    def testManagerReportsEliminatedInstructionsPerFunction(self):
+        manager = PassManager(("value-numbering",))
+        out = StringIO.StringIO()
+        
+        manager.optimize("f", [Label("f"), Instruction("set", A, X), Instruction("set", A, X), Instruction("set", PC, POP)])
+        manager.optimize("g", [Label("g"), Instruction("set", PC, POP)])
+        manager.report(out)
+        
+        self.assertTrue("pass value-numbering f: 1 instructions eliminated\n" in out.getvalue())
+        self.assertFalse("value-numbering g" in out.getvalue())
+    
+    def testIndexedReadsKeepTheirRegisterLive(self):
+        self.assertEqual(set([A]), getReadRegisters(Instruction("set", B, IndexedMemory(A, LabelRef("f.table")))))
+
+class LevelTest(unittest.TestCase):
+    def testLevelZeroRunsNoPass(self):
+        stats = {}
+        
+        generate(open("example.py").read(), stats = stats, **OPTIMIZATION_LEVELS[0])
+        
+        self.assertEqual([], stats["passes"].records)
+        self.assertFalse("peephole" in stats)
+    
+    def testHigherLevelsNeverGrowTheCode(self):
+        source = open("benchmarks/programs/if_ladder.py").read()
+        
+        counts = [len([i for i in generate(source, **OPTIMIZATION_LEVELS[level]) if isinstance(i, Instruction)]) for level in sorted(OPTIMIZATION_LEVELS)]
+        
+        self.assertEqual(sorted(counts, reverse = True), counts)
@@ -0,0 +1,79 @@
+import unittest
+from dcpu16.instructions import Instruction, Label, Register, Literal, Address, LabelRef, Memory, A, PC, POP
+from dcpu16.peephole import PeepholeRule, optimize, removeSelfMove
+from dcpu16.benchmark import runProgram
+
+B = Register("b")
+TEMPORARY = Memory(Address(0x2000))
+
+class PeepholeTest(unittest.TestCase):
+    def testRemovesReloadOfStoredValue(self):
+        stats = {}
+        instructions = optimize([Instruction("set", TEMPORARY, A), Instruction("set", A, TEMPORARY)], stats = stats)
+        
+        self.assertEqual([Instruction("set", TEMPORARY, A)], instructions)
+        self.assertEqual([1, 2, 2], stats["redundant-load"])
+    
+    def testKeepsReloadAfterConditionalStore(self):
+        original = [Instruction("ife", A, B), Instruction("set", TEMPORARY, A), Instruction("set", A, TEMPORARY)]
+        
+        self.assertEqual(original, optimize(list(original)))
+    
+    def testEvaluatesTestOfKnownConstant(self):
+        instructions = optimize([
+            Instruction("set", A, Literal(1)),
+            Instruction("ifn", A, Literal(1)),
+            Instruction("set", PC, LabelRef("else")),
+            Instruction("set", TEMPORARY, A),
+            Label("else"),
+        ])
+        
+        self.assertEqual([Instruction("set", A, Literal(1)), Instruction("set", TEMPORARY, A), Label("else")], instructions)
+    
+    def testKeepsTestOfConditionallySetRegister(self):
+        original = [
+            Instruction("set", A, Literal(0)),
+            Instruction("ife", TEMPORARY, Literal(2)),
+            Instruction("set", A, Literal(1)),
+            Instruction("ifn", A, Literal(1)),
+            Instruction("set", PC, LabelRef("else")),
+            Label("else"),
+        ]
+        
+        self.assertEqual(original, optimize(list(original)))
+    
+    def testRemovesJumpToFollowingLabel(self):
+        stats = {}
+        instructions = optimize([Instruction("set", PC, LabelRef("if1end")), Label("if1else"), Label("if1end")], stats = stats)
+        
+        self.assertEqual([Label("if1else"), Label("if1end")], instructions)
+        self.assertEqual([1, 2, 2], stats["jump-to-next"])
+    
+    def testRemovesCodeAfterUnconditionalJump(self):
+        instructions = optimize([Instruction("set", PC, POP), Instruction("set", A, Literal(5)), Label("next")])
+        
+        self.assertEqual([Instruction("set", PC, POP), Label("next")], instructions)
+    
+    def testReplacesTailCallWithJump(self):
+        stats = {}
+        instructions = optimize([Label("f"), Instruction("jsr", LabelRef("g")), Instruction("set", PC, POP), Label("h")], stats = stats)
+        
+        self.assertEqual([Label("f"), Instruction("set", PC, LabelRef("g")), Label("h")], instructions)
+        self.assertEqual([1, 1, 3], stats["tail-call"])
+    
+    def testKeepsConditionalCall(self):
+        original = [Instruction("ife", A, B), Instruction("jsr", LabelRef("g")), Instruction("set", PC, POP)]
+        
+        self.assertEqual(original, optimize(list(original)))
+    
+    def testSelfRecursiveTailCallRunsInConstantStack(self):
+        source = "# expect: 0x8000 = 40000\ndef start():\n    n = 0\n    count()\n    SCREEN[0] = n\n    end()\n\ndef count():\n    n = n + 1\n    if n < 40000:\n        return count()\n    return 0\n\ndef end():\n    exit()\n"
+        
+        self.assertEqual([], runProgram("count", source).failures)
+    
+    def testRunsOnlyGivenRules(self):
+        stats = {}
+        instructions = optimize([Instruction("set", A, A), Instruction("set", A, Literal(3))], [PeepholeRule("self-move", removeSelfMove)], stats)
+        
+        self.assertEqual([Instruction("set", A, Literal(3))], instructions)
+        self.assertEqual({"self-move" : [1, 1, 1]}, stats)
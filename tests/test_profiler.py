@@ -0,0 +1,60 @@
+import ast
+import gc
+import unittest
+from StringIO import StringIO
+from dcpu16.compiler import DCPU16AssemblyProducer, generate
+from dcpu16.profiler import Profiler
+
+SOURCE = "def start():\n    x = y + z * w\n    if x < 3:\n        x = 1\n    return x\n"
+
+class ProfilerTest(unittest.TestCase):
+    def testRecordsEveryStage(self):
+        profiler = Profiler()
+        
+        generate(SOURCE, profiler = profiler)
+        
+        self.assertEqual(["codegen", "deadcode", "inline", "link", "loops", "parse", "passes", "peephole", "transform"], sorted(profiler.stages))
+        for profile in profiler.stages.values():
+            self.assertEqual(1, profile.calls)
+    
+    def testCountsNodeTypesAndInstructions(self):
+        profiler = Profiler()
+        
+        instructions = generate(SOURCE, peephole = False, profiler = profiler)
+        
+        self.assertEqual(1, profiler.nodes["FunctionDef"].calls)
+        self.assertEqual(2, profiler.nodes["Assign"].calls)
+        self.assertEqual(len(instructions), sum(profile.instructions for profile in profiler.nodes.values()))
+        self.assertEqual(4, sum(profile.slots for profile in profiler.nodes.values()))
+        self.assertTrue(profiler.nodes["Module"].seconds >= profiler.nodes["FunctionDef"].seconds)
+    
+    def testCountsObjectsAllocatedByNodes(self):
+        profiler = Profiler()
+        
+        generate(SOURCE, profiler = profiler)
+        
+        self.assertTrue(profiler.nodes["Module"].objects > 0)
+        self.assertTrue(gc.isenabled())
+    
+    def testTimesStagesAloneWithoutProfilingNodes(self):
+        profiler = Profiler(profileNodes = False)
+        
+        generate(SOURCE, profiler = profiler)
+        
+        self.assertTrue("codegen" in profiler.stages)
+        self.assertEqual({}, profiler.nodes)
+    
+    def testLeavesProducerUntouchedWhenDisabled(self):
+        generate(SOURCE)
+        
+        self.assertTrue(DCPU16AssemblyProducer.visit.im_func is ast.NodeVisitor.visit.im_func)
+    
+    def testReportListsStagesAndNodes(self):
+        profiler = Profiler()
+        out = StringIO()
+        
+        generate(SOURCE, profiler = profiler)
+        profiler.report(out)
+        
+        self.assertTrue("codegen" in out.getvalue())
+        self.assertTrue("BinOp" in out.getvalue())
@@ -0,0 +1,82 @@
+import base64
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+from dcpu16.server import CompileService, CompileServer, serveStream
+
+SOURCE = "def start():\n    x = 1\n    f()\n\ndef f():\n    y = x\n"
+
+class CompileServiceTest(unittest.TestCase):
+    def testCompilesToAssembly(self):
+        response = CompileService().handle(json.dumps({"id" : 7, "source" : SOURCE, "deadcode" : False}))
+        
+        self.assertEqual(7, response["id"])
+        self.assertTrue(response["ok"])
+        self.assertTrue(response["assembly"].startswith(":start\nset a, 1\n"))
+    
+    def testCompilesToBinary(self):
+        response = CompileService().handle(json.dumps({"source" : "def start():\n    x = 1\n", "format" : "binary", "deadcode" : False}))
+        
+        self.assertEqual("\x88\x01\x03\xc1\x20\x00", base64.b64decode(response["binary"]))
+    
+    def testReportsErrors(self):
+        response = CompileService().handle(json.dumps({"id" : 1, "source" : "def start(:\n"}))
+        
+        self.assertFalse(response["ok"])
+        self.assertTrue("invalid syntax" in response["error"])
+    
+    def testRejectsRequestsThatAreNotObjects(self):
+        for line in ("[1]", "\"x\"", "3"):
+            response = CompileService().handle(line)
+            
+            self.assertFalse(response["ok"])
+            self.assertEqual("invalid request: expected an object", response["error"])
+    
+    def testKeepsResultsAndFunctionsWarm(self):
+        service = CompileService()
+        service.compile({"source" : SOURCE, "inline" : False, "deadcode" : False})
+        
+        service.compile({"source" : SOURCE, "inline" : False, "deadcode" : False})
+        service.compile({"source" : SOURCE.replace("y = x", "y = x + 1"), "inline" : False, "deadcode" : False})
+        
+        self.assertEqual(1, service.results.hits)
+        self.assertEqual((1, 3), (service.fragments.hits, service.fragments.misses))
+
+class ServeTest(unittest.TestCase):
+    def testStreamAnswersEveryRequest(self):
+        requests = "".join(json.dumps({"id" : i, "source" : SOURCE}) + "\n" for i in range(4))
+        output = StringIO()
+        
+        serveStream(CompileService(), StringIO(requests), output)
+        
+        responses = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(range(4), sorted(response["id"] for response in responses))
+    
+    def testSocketRoundTrip(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "dcpu16.sock")
+        server = CompileServer(path, CompileService())
+        thread = threading.Thread(target = server.serve_forever)
+        thread.start()
+        try:
+            client = socket.socket(socket.AF_UNIX)
+            client.connect(path)
+            stream = client.makefile("rw")
+            stream.write(json.dumps({"id" : 1, "source" : SOURCE}) + "\n")
+            stream.flush()
+            
+            response = json.loads(stream.readline())
+            
+            stream.close()
+            client.close()
+            self.assertTrue(response["ok"])
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+            shutil.rmtree(directory)
@@ -0,0 +1,46 @@
+import ast
+import unittest
+from dcpu16.transforms import foldConstants
+
+def foldExpression(source):
+    tree, removed = foldConstants(ast.parse(source))
+    return tree.body[0].value, removed
+
+class ConstantFolderTest(unittest.TestCase):
+    def testFoldsExampleExpression(self):
+        node, removed = foldExpression("(1 + 3 - 2) * 2 / 4 % 2")
+        
+        self.assertTrue(isinstance(node, ast.Num))
+        self.assertEqual(1, node.n)
+        self.assertEqual(15, removed)
+    
+    def testWrapsAroundSixteenBits(self):
+        self.assertEqual(0, foldExpression("65535 + 1")[0].n)
+        self.assertEqual(65535, foldExpression("0 - 1")[0].n)
+        self.assertEqual(65535, foldExpression("-(2 - 1)")[0].n)
+        self.assertEqual(0, foldExpression("256 * 256")[0].n)
+    
+    def testDivisionByZeroMatchesHardware(self):
+        self.assertEqual(0, foldExpression("5 / 0")[0].n)
+        self.assertEqual(0, foldExpression("5 % 0")[0].n)
+    
+    def testFoldsComparisons(self):
+        self.assertEqual(1, foldExpression("3 >= 3")[0].n)
+        self.assertEqual(0, foldExpression("1 < 2 < 2")[0].n)
+        self.assertEqual(1, foldExpression("-1 > 5")[0].n)
+    
+    def testAppliesIdentities(self):
+        self.assertEqual("x", foldExpression("x * 1")[0].id)
+        self.assertEqual("x", foldExpression("0 + x")[0].id)
+        self.assertEqual("x", foldExpression("x - (2 - 2)")[0].id)
+        self.assertEqual(0, foldExpression("x * 0")[0].n)
+    
+    def testKeepsCallsWhenMultiplyingByZero(self):
+        node, removed = foldExpression("f() * 0")
+        
+        self.assertTrue(isinstance(node, ast.BinOp))
+        self.assertEqual(0, removed)
+    
+    def testShortCircuitsConstantBoolOps(self):
+        self.assertEqual(1, foldExpression("0 or 1 or f()")[0].n)
+        self.assertEqual("x", foldExpression("1 and x")[0].id)